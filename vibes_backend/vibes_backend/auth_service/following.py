@@ -0,0 +1,59 @@
+"""
+Follow relationships between the caller and many users at once, for the
+bulk follow-status endpoint and anything else that renders lists of users.
+
+Without a cache each lookup is one query on the (follower, followed)
+unique index (Follow.objects.relationships). With FOLLOWING_CACHE set to a
+CACHES alias, each user's following set is kept there (shared between
+workers when that is Redis/Memcached), so "do I follow X" is a set
+membership test; only "does X follow me" still queries. Sets are dropped
+once a follow or unfollow by the user commits (see signals.py). Users who
+follow more than FOLLOWING_CACHE_MAX_SIZE accounts are not cached.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Follow
+
+# Cached in place of a set too large to keep, so it isn't reloaded per call
+TOO_LARGE = "too-large"
+
+
+def _cache():
+    alias = settings.FOLLOWING_CACHE
+    return caches[alias] if alias else None
+
+
+def _key(user_id):
+    return f"following:{user_id}"
+
+
+def following_set(user_id):
+    """Ids the user follows, or None when the cache is off or the set is too large."""
+    cache = _cache()
+    if cache is None:
+        return None
+    following = cache.get(_key(user_id))
+    if following is None:
+        limit = settings.FOLLOWING_CACHE_MAX_SIZE
+        ids = list(Follow.objects.filter(follower_id=user_id).values_list('followed_id', flat=True)[:limit + 1])
+        following = set(ids) if len(ids) <= limit else TOO_LARGE
+        cache.set(_key(user_id), following, settings.FOLLOWING_CACHE_TTL)
+    return None if following == TOO_LARGE else following
+
+
+def relationships(user, profile_ids):
+    """(ids of `profile_ids` that `user` follows, ids of those that follow `user`)."""
+    following = following_set(user.pk) if user.is_authenticated else None
+    if following is None:
+        return Follow.objects.relationships(user, profile_ids)
+    followers = set(
+        Follow.objects.filter(follower__in=profile_ids, followed=user).values_list('follower_id', flat=True)
+    ) if profile_ids else set()
+    return following.intersection(profile_ids), followers
+
+
+def invalidate_following(*user_ids):
+    cache = _cache()
+    if cache is not None:
+        cache.delete_many([_key(user_id) for user_id in user_ids])
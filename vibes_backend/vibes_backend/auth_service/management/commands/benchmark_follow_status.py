@@ -0,0 +1,91 @@
+import random
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from auth_service.models import Follow, Profile
+from auth_service.views import FollowStatusBulkView, FollowStatusView
+from vibes_backend.benchmarking import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Follow status of a list of users as the client fetches it: one "
+        "FollowStatusView call per user versus one FollowStatusBulkView call, "
+        "with and without the cached following set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20000, help="Seeded users.")
+        parser.add_argument("--following", type=int, default=1000, help="Users the viewer follows.")
+        parser.add_argument("--followers", type=int, default=1000, help="Users following the viewer.")
+        parser.add_argument("--targets", type=int, default=50, help="Users on the rendered list.")
+        parser.add_argument("--repeat", type=int, default=20, help="Runs timed per row.")
+        parser.add_argument("--rtt", type=float, default=50, help="Client round trip (ms) for the estimate.")
+
+    def run_benchmark(self, **options):
+        viewer, users = self.seed(options["users"], options["following"], options["followers"])
+        targets = random.Random(1).sample(users, options["targets"])
+        factory = APIRequestFactory()
+
+        def single_calls():
+            for target in targets:
+                request = factory.get("/auth/status/", {"follower_id": viewer.id, "following_id": target.id})
+                force_authenticate(request, user=viewer)
+                FollowStatusView.as_view()(request)
+
+        def batched():
+            request = factory.get("/auth/status/bulk/", {"ids": ",".join(str(t.id) for t in targets)})
+            force_authenticate(request, user=viewer)
+            FollowStatusBulkView.as_view()(request)
+
+        cases = [
+            (f"{len(targets)} single calls", len(targets), single_calls, ""),
+            ("1 batched call", 1, batched, ""),
+            ("1 batched call, cached set", 1, batched, "default"),
+        ]
+        rows = []
+        for name, requests, run, following_cache in cases:
+            with override_settings(FOLLOWING_CACHE=following_cache):
+                cache.clear()
+                run()  # warm up (and fill the cache)
+                with CaptureQueriesContext(connection) as queries:
+                    run()
+                best = self.time(options["repeat"], run)
+            client_ms = best * 1000 + requests * options["rtt"]
+            rows.append([name, requests, len(queries), f"{best * 1000:.2f}", f"{client_ms:.0f}"])
+
+        cache.clear()
+        self.stdout.write(
+            f"Follow status of {len(targets)} users for a viewer following {options['following']} "
+            f"and followed by {options['followers']} of {options['users']}; server time best of "
+            f"{options['repeat']}, client time adds {options['rtt']:.0f} ms per sequential request\n"
+        )
+        self.write_table(["status lookups", "requests", "queries", "server ms", "client ms"], rows)
+
+    def time(self, repeat, run):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def seed(self, user_count, following, followers):
+        users = Profile.objects.bulk_create(
+            Profile(email=f"user{i}@example.com", username=f"user{i}", fullname=f"User {i}", password="!")
+            for i in range(user_count + 1)
+        )
+        viewer, others = users[0], users[1:]
+        picker = random.Random(0)
+        Follow.objects.bulk_create(
+            [Follow(follower=viewer, followed=user) for user in picker.sample(others, following)]
+            + [Follow(follower=user, followed=viewer) for user in picker.sample(others, followers)],
+            batch_size=5000,
+        )
+        return viewer, others
@@ -0,0 +1,85 @@
+import time
+
+from django.test import RequestFactory
+from rest_framework import serializers
+
+from auth_service.models import Follow, Profile
+from auth_service.serializers import UserSerializer
+from vibes_backend.benchmarking import BenchmarkCommand
+
+
+class LegacyUserSerializer(UserSerializer):
+    """UserSerializer as it was: counts and the follow flag queried per render."""
+    followers_count = serializers.SerializerMethodField()
+    following_count = serializers.SerializerMethodField()
+
+    def get_followers_count(self, obj):
+        return obj.followers.count()
+
+    def get_following_count(self, obj):
+        return obj.following.count()
+
+    def get_is_followed_by_me(self, obj):
+        return Follow.objects.filter(follower=self.context["request"].user, followed=obj).exists()
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Time to load and serialize a celebrity's profile (as ProfileView.get "
+        "does) as its follower count grows: COUNT queries per render versus the "
+        "denormalized counters and the annotated follow flag."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--followers", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--repeat", type=int, default=50, help="Renders timed per row.")
+
+    def run_benchmark(self, **options):
+        star = Profile.objects.create(email="star@example.com", username="star", fullname="Star")
+        request = RequestFactory().get(f"/auth/profile/{star.id}/")
+
+        def legacy():
+            profile = Profile.objects.get(id=star.id)
+            return LegacyUserSerializer(profile, context={"request": request}).data
+
+        def denormalized():
+            profile = Profile.objects.with_followed_by(request.user).get(id=star.id)
+            return UserSerializer(profile, context={"request": request}).data
+
+        rows = []
+        seeded = 0
+        for followers in sorted(options["followers"]):
+            self.seed_followers(star, seeded, followers)
+            seeded = followers
+            # The viewer is the newest follower
+            request.user = Profile.objects.get(username=f"fan{followers - 1}")
+            assert legacy() == denormalized()
+
+            before = self.time(options["repeat"], legacy)
+            after = self.time(options["repeat"], denormalized)
+            rows.append([followers, f"{before * 1000:.2f}", f"{after * 1000:.2f}", f"{before / after:.1f}x"])
+
+        self.stdout.write(f"ms per profile render, best of {options['repeat']}\n")
+        self.write_table(["followers", "COUNT per render", "denormalized", "speedup"], rows)
+
+    def seed_followers(self, star, start, stop, batch_size=5000):
+        """Create fans start..stop-1, each following the star, with counters kept in step."""
+        for low in range(start, stop, batch_size):
+            high = min(low + batch_size, stop)
+            fans = Profile.objects.bulk_create(
+                Profile(
+                    email=f"fan{i}@example.com", username=f"fan{i}", fullname=f"Fan {i}", following_count=1,
+                )
+                for i in range(low, high)
+            )
+            Follow.objects.bulk_create(Follow(follower=fan, followed=star) for fan in fans)
+        Profile.objects.filter(pk=star.pk).update(followers_count=stop)
+
+    def time(self, repeat, render):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
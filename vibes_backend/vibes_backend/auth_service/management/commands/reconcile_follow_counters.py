@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from auth_service.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Recompute Profile.followers_count / following_count and fix any rows that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without writing.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        max_id = Profile.objects.aggregate(m=Max("id"))["m"] or 0
+        fixed = 0
+
+        # Walk the table in primary-key ranges so each batch is a bounded scan.
+        # Rows are locked while recounting so concurrent F() increments queue
+        # behind the fix instead of being overwritten by it.
+        for start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                drifted = list(
+                    Profile.objects.select_for_update()
+                    .filter(id__gte=start, id__lt=start + batch_size)
+                    .with_actual_follow_counts()
+                    .filter(
+                        ~Q(followers_count=F("actual_followers_count"))
+                        | ~Q(following_count=F("actual_following_count"))
+                    )
+                    .only("id", "followers_count", "following_count")
+                )
+                for profile in drifted:
+                    profile.followers_count = profile.actual_followers_count
+                    profile.following_count = profile.actual_following_count
+                if drifted and not dry_run:
+                    Profile.objects.bulk_update(drifted, ["followers_count", "following_count"])
+
+            fixed += len(drifted)
+
+        verb = "Found" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} drifted profile(s) in id range 0..{max_id}."))
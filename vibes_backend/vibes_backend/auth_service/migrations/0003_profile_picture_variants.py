@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:43
+
+import vibes_backend.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_service', '0002_alter_profile_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='profile_picture_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_picture',
+            field=vibes_backend.images.VariantImageField(blank=True, null=True, upload_to='user/profile_pics/', variants_field='profile_picture_variants'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Profile = apps.get_model('auth_service', 'Profile')
+    Follow = apps.get_model('auth_service', 'Follow')
+
+    followers = (
+        Follow.objects.filter(followed=OuterRef('pk'))
+        .order_by().values('followed').annotate(c=Count('id')).values('c')
+    )
+    following = (
+        Follow.objects.filter(follower=OuterRef('pk'))
+        .order_by().values('follower').annotate(c=Count('id')).values('c')
+    )
+    Profile.objects.update(
+        followers_count=Coalesce(Subquery(followers), Value(0)),
+        following_count=Coalesce(Subquery(following), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_service', '0003_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
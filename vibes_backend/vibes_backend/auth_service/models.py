@@ -1,9 +1,38 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
+from vibes_backend.images import VariantImageField
+
 # Create your models here.
 
-class CustomUserManager(BaseUserManager):
+class ProfileQuerySet(models.QuerySet):
+    def with_followed_by(self, user):
+        """Annotate whether `user` follows each profile, for rendering lists of users."""
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_followed_by_me=Value(False))
+        return self.annotate(
+            is_followed_by_me=Exists(Follow.objects.filter(follower=user, followed=OuterRef("pk")))
+        )
+
+    def with_actual_follow_counts(self):
+        """Annotate the real follower/following counts, for reconciling the counters."""
+        followers = (
+            Follow.objects.filter(followed=OuterRef("pk"))
+            .order_by().values("followed").annotate(c=Count("id")).values("c")
+        )
+        following = (
+            Follow.objects.filter(follower=OuterRef("pk"))
+            .order_by().values("follower").annotate(c=Count("id")).values("c")
+        )
+        return self.annotate(
+            actual_followers_count=Coalesce(Subquery(followers), Value(0)),
+            actual_following_count=Coalesce(Subquery(following), Value(0)),
+        )
+
+
+class CustomUserManager(BaseUserManager.from_queryset(ProfileQuerySet)):
     def _create_user(self, email, password, fullname, username, **extra_fields):
         if not email:
             raise ValueError("Email must be provided")
@@ -38,7 +67,10 @@ class Profile(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(db_index=True, unique=True, max_length=255)
     fullname = models.CharField(max_length=255)
     username = models.CharField(max_length=150, unique=True)
-    profile_picture = models.ImageField(upload_to='user/profile_pics/', null=True, blank=True)
+    profile_picture = VariantImageField(
+        upload_to='user/profile_pics/', variants_field='profile_picture_variants', null=True, blank=True
+    )
+    profile_picture_variants = models.JSONField(null=True, blank=True, editable=False)
 
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -46,6 +78,11 @@ class Profile(AbstractBaseUser, PermissionsMixin):
     is_verified = models.BooleanField(default=False)
     online = models.BooleanField(default=False)
     last_seen = models.DateTimeField(null=True, blank=True)
+    # Denormalized counters, maintained with F() updates alongside the Follow
+    # writes (follow/unfollow). `manage.py reconcile_follow_counters` repairs drift.
+    # The database default keeps inserts that predate the columns working.
+    followers_count = models.PositiveIntegerField(default=0, db_default=0)
+    following_count = models.PositiveIntegerField(default=0, db_default=0)
 
     objects = CustomUserManager()
 
@@ -59,14 +96,64 @@ class Profile(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.username
 
+    def follow(self, other):
+        """Follow `other`. Returns True if a new follow was created."""
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(follower=self, followed=other)
+            if created:
+                Profile.objects.filter(pk=self.pk).update(following_count=F("following_count") + 1)
+                Profile.objects.filter(pk=other.pk).update(followers_count=F("followers_count") + 1)
+        return created
+
+    def unfollow(self, other):
+        """Stop following `other`. Returns True if a follow was deleted."""
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(follower=self, followed=other).delete()
+            if deleted:
+                Profile.objects.filter(pk=self.pk).update(
+                    following_count=Greatest(F("following_count") - 1, 0)
+                )
+                Profile.objects.filter(pk=other.pk).update(
+                    followers_count=Greatest(F("followers_count") - 1, 0)
+                )
+        return bool(deleted)
+
+
+class FollowQuerySet(models.QuerySet):
+    def relationships(self, user, profile_ids):
+        """
+        Both directions between `user` and each of `profile_ids`, in one query
+        on the (follower, followed) unique index. Returns (ids `user` follows,
+        ids that follow `user`).
+        """
+        following, followers = set(), set()
+        if user is None or not user.is_authenticated or not profile_ids:
+            return following, followers
+        pairs = self.filter(
+            Q(follower=user, followed__in=profile_ids) | Q(follower__in=profile_ids, followed=user)
+        ).values_list("follower_id", "followed_id")
+        for follower_id, followed_id in pairs:
+            if follower_id == user.pk:
+                following.add(followed_id)
+            if followed_id == user.pk:
+                followers.add(follower_id)
+        return following, followers
+
 
 class Follow(models.Model):
     follower = models.ForeignKey(Profile,related_name='following',on_delete=models.CASCADE)
     followed = models.ForeignKey(Profile,related_name='followers',on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         unique_together = ('follower', 'followed')
+        # Follower / following lists, newest first (keyset pagination)
+        indexes = [
+            models.Index(fields=['followed', '-created_at', '-id'], name='follow_followers_idx'),
+            models.Index(fields=['follower', '-created_at', '-id'], name='follow_following_idx'),
+        ]
         verbose_name = 'Follow'
         verbose_name_plural = 'Follows'
 
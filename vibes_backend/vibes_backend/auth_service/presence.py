@@ -0,0 +1,219 @@
+"""
+User presence: who has a socket open right now, and when they were last seen.
+
+Socket consumers report their authenticated user on connect and disconnect.
+Each process counts its own sockets per user and only touches the cache
+shared by all processes (PRESENCE_CACHE, the "shared" Redis alias) when a
+user opens their first or closes their last socket in that process:
+
+    presence:count:<id>  number of processes with a socket for the user
+    presence:seen:<id>   unix time of the last heartbeat, expiring after
+                         PRESENCE_TIMEOUT seconds
+
+A user is online while their seen key exists. Every
+PRESENCE_HEARTBEAT_INTERVAL seconds each process refreshes the seen keys of
+all its connected users in one set_many and writes Profile.online/last_seen
+for them in batched UPDATEs, instead of writing on every connect and
+disconnect. When the count drops to zero the seen key is deleted and the
+user goes offline at once; the users of a process that dies without
+disconnecting go offline when their seen keys expire.
+
+A dead process also leaves its share of the counts behind, so a later
+disconnect elsewhere can find the count above zero with nobody left
+online. The process that saw that keeps the user in `left` and, once the
+seen key has had time to expire, records them offline in the database if
+it did (and no other process has done so already).
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from django.db.models import Case, Value, When
+
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+# A count left behind by a crashed process heals after this long.
+COUNT_TTL = 24 * 60 * 60
+# Rows per UPDATE when flushing last_seen.
+FLUSH_BATCH_SIZE = 500
+
+
+def count_key(user_id):
+    return f"presence:count:{user_id}"
+
+
+def seen_key(user_id):
+    return f"presence:seen:{user_id}"
+
+
+def as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def save_last_seen(online_ids, went_offline, now, expired=None):
+    """
+    Write Profile.online/last_seen: `online_ids` were connected at `now`,
+    `went_offline` maps user ids to when their last socket closed. `expired`
+    maps users found offline after their seen key expired to when they left
+    this process; they are only updated while still marked online, so a
+    newer last_seen written by the process that saw them go is kept.
+    """
+    online_ids = list(online_ids)
+    for i in range(0, len(online_ids), FLUSH_BATCH_SIZE):
+        Profile.objects.filter(pk__in=online_ids[i:i + FLUSH_BATCH_SIZE]).update(
+            online=True, last_seen=as_datetime(now)
+        )
+
+    save_offline(Profile.objects.all(), went_offline)
+    if expired:
+        save_offline(Profile.objects.filter(online=True), expired)
+
+
+def save_offline(profiles, went_offline):
+    offline = list(went_offline.items())
+    for i in range(0, len(offline), FLUSH_BATCH_SIZE):
+        batch = offline[i:i + FLUSH_BATCH_SIZE]
+        profiles.filter(pk__in=[user_id for user_id, _ in batch]).update(
+            online=False,
+            last_seen=Case(
+                *[When(pk=user_id, then=Value(as_datetime(at))) for user_id, at in batch],
+                output_field=models.DateTimeField(),
+            ),
+        )
+
+
+class PresenceTracker:
+    """This process's sockets per user, and the heartbeat that reports them."""
+
+    def __init__(self):
+        self.sockets = Counter()
+        self.went_offline = {}
+        # {user_id: when their last socket here closed} while the shared
+        # count still said another process had one.
+        self.left = {}
+        self.heartbeat = None
+
+    @property
+    def cache(self):
+        return caches[settings.PRESENCE_CACHE]
+
+    async def connect(self, user_id):
+        self.sockets[user_id] += 1
+        if self.sockets[user_id] == 1:
+            self.went_offline.pop(user_id, None)
+            self.left.pop(user_id, None)
+            await sync_to_async(self.join)(user_id)
+        self.start_heartbeat()
+
+    async def disconnect(self, user_id):
+        self.sockets[user_id] -= 1
+        if self.sockets[user_id] > 0:
+            return
+        del self.sockets[user_id]
+        left_at = time.time()
+        if await sync_to_async(self.leave)(user_id):
+            self.went_offline[user_id] = left_at
+        else:
+            self.left[user_id] = left_at
+
+    def join(self, user_id):
+        cache = self.cache
+        cache.add(count_key(user_id), 0, COUNT_TTL)
+        try:
+            cache.incr(count_key(user_id))
+        except ValueError:
+            # Expired between add() and incr().
+            cache.set(count_key(user_id), 1, COUNT_TTL)
+        cache.set(seen_key(user_id), time.time(), settings.PRESENCE_TIMEOUT)
+
+    def leave(self, user_id):
+        """Returns True when no process has a socket for the user any more."""
+        cache = self.cache
+        try:
+            remaining = cache.decr(count_key(user_id))
+        except ValueError:
+            remaining = 0
+        if remaining > 0:
+            return False
+        cache.delete_many([count_key(user_id), seen_key(user_id)])
+        return True
+
+    def start_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        if self.heartbeat is None or self.heartbeat.done() or self.heartbeat.get_loop() is not loop:
+            self.heartbeat = loop.create_task(self.run_heartbeat())
+
+    async def run_heartbeat(self):
+        while self.sockets or self.went_offline or self.left:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Refresh the seen keys of connected users and write last_seen."""
+        online_ids, went_offline = list(self.sockets), self.went_offline
+        self.went_offline = {}
+        try:
+            expired = await database_sync_to_async(self.beat)(online_ids, went_offline, dict(self.left))
+        except Exception as e:
+            logger.warning(f"Presence heartbeat failed: {e}")
+            self.went_offline = {**went_offline, **self.went_offline}
+            return
+        for user_id, left_at in expired.items():
+            # Unless they came back (and maybe left again) meanwhile.
+            if self.left.get(user_id) == left_at:
+                del self.left[user_id]
+
+    def beat(self, online_ids, went_offline, left):
+        """Returns the users of `left` that were recorded offline."""
+        now = time.time()
+        if online_ids:
+            self.cache.set_many(
+                {seen_key(user_id): now for user_id in online_ids}, settings.PRESENCE_TIMEOUT
+            )
+        expired = self.expired(left, now)
+        save_last_seen(online_ids, went_offline, now, expired)
+        return expired
+
+    def expired(self, left, now):
+        """
+        Users of `left` whose seen key has expired by now: offline, though
+        the count said otherwise. Those still seen stay in `left` until
+        their key goes or they reconnect here.
+        """
+        due = [user_id for user_id, left_at in left.items() if now - left_at >= settings.PRESENCE_TIMEOUT]
+        if not due:
+            return {}
+        seen = self.cache.get_many([seen_key(user_id) for user_id in due])
+        return {user_id: left[user_id] for user_id in due if seen_key(user_id) not in seen}
+
+    def lookup(self, user_ids):
+        """
+        {user_id: {"online": bool, "last_seen": datetime | None}} for the
+        given users: one cache read, plus one query for the offline ones.
+        Unknown ids are left out.
+        """
+        seen = self.cache.get_many([seen_key(user_id) for user_id in user_ids])
+        presence, offline = {}, []
+        for user_id in user_ids:
+            at = seen.get(seen_key(user_id))
+            if at is None:
+                offline.append(user_id)
+            else:
+                presence[user_id] = {"online": True, "last_seen": as_datetime(at)}
+
+        if offline:
+            for user_id, last_seen in Profile.objects.filter(pk__in=offline).values_list("id", "last_seen"):
+                presence[user_id] = {"online": False, "last_seen": last_seen}
+        return presence
+
+
+presence = PresenceTracker()
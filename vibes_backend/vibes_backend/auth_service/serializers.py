@@ -1,11 +1,14 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+from vibes_backend.images import ImageVariantsField
+from vibes_backend.media import MediaImageField
 from .models import Profile, Follow
 
 class UserSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
     is_followed_by_me = serializers.SerializerMethodField()
+    profile_picture = MediaImageField(required=False, allow_null=True)
+    profile_picture_variants = ImageVariantsField('profile_picture')
     password = serializers.CharField(write_only=True, min_length=8, required=False)
 
     class Meta:
@@ -13,19 +16,19 @@ class UserSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'password', 'email', 'fullname', 'username',
             'followers_count', 'following_count', 'is_followed_by_me',
-            'is_active', 'is_verified', 'profile_picture'
+            'is_active', 'is_verified', 'profile_picture', 'profile_picture_variants'
         ]
-        read_only_fields = ['id', 'is_active']
-
-    def get_followers_count(self, obj):
-        return obj.followers.count()
+        read_only_fields = ['id', 'is_active', 'followers_count', 'following_count']
 
-    def get_following_count(self, obj):
-        return obj.following.count()
+    # Lists of users should come from Profile.objects.with_followed_by(user),
+    # which annotates the flag for all rows in the same query; single
+    # profiles fall back to one lookup.
 
     def get_is_followed_by_me(self, obj):
+        if hasattr(obj, 'is_followed_by_me'):
+            return obj.is_followed_by_me
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
+        if request and request.user.is_authenticated and request.user.pk != obj.pk:
             return Follow.objects.filter(follower=request.user, followed=obj).exists()
         return False    
 
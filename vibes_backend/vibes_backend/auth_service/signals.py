@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .following import invalidate_following
+from .models import Follow
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_following_on_follow_change(sender, instance, **kwargs):
+    # After the commit: dropped inside Profile.follow()'s transaction, the
+    # set could be reloaded from the old rows and cached again.
+    follower_id = instance.follower_id
+    transaction.on_commit(lambda: invalidate_following(follower_id))
@@ -1,3 +1,358 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from vibes_backend.testing import TEST_SETTINGS, image_upload, make_user
+from .models import Follow, Profile
+from .presence import PresenceTracker, presence, seen_key
+
+
+@override_settings(**TEST_SETTINGS)
+class PresenceTrackerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+
+    def is_online(self, tracker, user):
+        return tracker.lookup([user.id])[user.id]["online"]
+
+    def test_user_stays_online_until_their_last_socket_closes(self):
+        tracker = PresenceTracker()
+        async_to_sync(tracker.connect)(self.alice.id)
+        async_to_sync(tracker.connect)(self.alice.id)
+
+        async_to_sync(tracker.disconnect)(self.alice.id)
+        self.assertTrue(self.is_online(tracker, self.alice))
+
+        async_to_sync(tracker.disconnect)(self.alice.id)
+        self.assertFalse(self.is_online(tracker, self.alice))
+
+    def test_sockets_in_several_processes(self):
+        first, second = PresenceTracker(), PresenceTracker()
+        async_to_sync(first.connect)(self.alice.id)
+        async_to_sync(second.connect)(self.alice.id)
+
+        async_to_sync(first.disconnect)(self.alice.id)
+        self.assertTrue(self.is_online(second, self.alice))
+
+        async_to_sync(second.disconnect)(self.alice.id)
+        self.assertFalse(self.is_online(first, self.alice))
+
+    def test_user_left_counted_by_a_dead_process_goes_offline_once_unseen(self):
+        dead, live = PresenceTracker(), PresenceTracker()
+        async_to_sync(dead.connect)(self.alice.id)
+        async_to_sync(live.connect)(self.alice.id)
+        async_to_sync(live.flush)()
+        # `dead` dies without disconnecting, so the count stays above zero.
+        async_to_sync(live.disconnect)(self.alice.id)
+        left_at = live.left[self.alice.id]
+
+        # Still seen (as far as the cache knows, `dead` has a socket).
+        live.left[self.alice.id] -= settings.PRESENCE_TIMEOUT
+        async_to_sync(live.flush)()
+        self.alice.refresh_from_db()
+        self.assertTrue(self.alice.online)
+
+        cache.delete(seen_key(self.alice.id))  # expired: nobody refreshed it
+        async_to_sync(live.flush)()
+
+        self.alice.refresh_from_db()
+        self.assertFalse(self.alice.online)
+        self.assertAlmostEqual(self.alice.last_seen.timestamp(), left_at - settings.PRESENCE_TIMEOUT, places=3)
+        self.assertEqual(live.left, {})
+
+    def test_last_seen_is_written_on_heartbeat_not_on_connect(self):
+        bob = make_user("bob")
+        tracker = PresenceTracker()
+        with self.assertNumQueries(0):
+            async_to_sync(tracker.connect)(self.alice.id)
+            async_to_sync(tracker.connect)(bob.id)
+            async_to_sync(tracker.disconnect)(bob.id)
+
+        with self.assertNumQueries(2):
+            async_to_sync(tracker.flush)()
+
+        self.alice.refresh_from_db()
+        bob.refresh_from_db()
+        self.assertTrue(self.alice.online)
+        self.assertIsNotNone(self.alice.last_seen)
+        self.assertFalse(bob.online)
+        self.assertIsNotNone(bob.last_seen)
+
+    def test_lookup_reads_the_database_only_for_offline_users(self):
+        bob = make_user("bob")
+        tracker = PresenceTracker()
+        async_to_sync(tracker.connect)(self.alice.id)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_online(tracker, self.alice))
+        with self.assertNumQueries(1):
+            found = tracker.lookup([self.alice.id, bob.id, 999])
+
+        self.assertEqual(set(found), {self.alice.id, bob.id})
+        self.assertFalse(found[bob.id]["online"])
+
+
+@override_settings(**TEST_SETTINGS)
+class PresenceViewTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client.force_authenticate(self.alice)
+
+    def tearDown(self):
+        presence.sockets.clear()
+
+    def test_bulk_lookup(self):
+        async_to_sync(presence.connect)(self.bob.id)
+
+        response = self.client.get("/auth/presence/", {"ids": f"{self.bob.id},{self.alice.id},999"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual([r["user_id"] for r in results], [self.bob.id, self.alice.id])
+        self.assertEqual([r["online"] for r in results], [True, False])
+
+    @override_settings(PRESENCE_LOOKUP_MAX=2)
+    def test_rejects_too_many_ids(self):
+        response = self.client.get("/auth/presence/", {"ids": "1,2,3"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rejects_malformed_ids(self):
+        response = self.client.get("/auth/presence/", {"ids": "1,x"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+    MEDIA_URL="/media/",
+    IMAGE_VARIANTS={"thumb": 48, "feed": 128},
+    IMAGE_VARIANTS_ASYNC=False,
+)
+class ProfilePictureVariantTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = make_user("user")
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name="avatar.png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put("/auth/profile/", {"profile_picture": image_upload(name, size=(300, 300), color=(20, 120, 220), image_format="PNG")}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        return self.user.profile_picture_variants
+
+    def test_profile_exposes_avatar_variants(self):
+        meta = self.upload()
+
+        response = self.client.get("/auth/profile/")
+
+        variants = response.json()["profile_picture_variants"]
+        self.assertEqual(
+            variants["variants"]["thumb"]["jpeg"], f"http://testserver/media/{meta['variants']['thumb']['jpeg']}"
+        )
+        self.assertEqual((variants["variants"]["thumb"]["width"], variants["color"]), (48, "#1478dc"))
+
+    def test_replacing_the_picture_deletes_the_old_variants(self):
+        old = self.upload("first.png")
+
+        new = self.upload("second.png")
+
+        for files in old["variants"].values():
+            self.assertFalse(default_storage.exists(files["webp"]))
+            self.assertFalse(default_storage.exists(files["jpeg"]))
+        self.assertTrue(default_storage.exists(new["variants"]["thumb"]["webp"]))
+
+
+@override_settings(**TEST_SETTINGS)
+class FollowCounterTests(APITestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+        self.star = make_user("star")
+        self.client.force_authenticate(self.user)
+
+    def follow(self, view="follow"):
+        return self.client.post(
+            f"/auth/{view}/", {"follower_id": self.user.id, "followed_id": self.star.id}, format="json"
+        )
+
+    def counts(self):
+        self.user.refresh_from_db()
+        self.star.refresh_from_db()
+        return self.user.following_count, self.star.followers_count
+
+    def test_follow_and_unfollow_only_count_real_changes(self):
+        self.assertEqual(self.follow().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.follow().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.counts(), (1, 1))
+
+        self.assertEqual(self.follow("unfollow").status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.follow("unfollow").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_profile_does_not_count_rows(self):
+        self.follow()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/auth/profile/{self.star.id}/")
+
+        data = response.json()
+        self.assertEqual((data["followers_count"], data["following_count"], data["is_followed_by_me"]), (1, 0, True))
+        self.assertFalse(any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_with_followed_by_flags_a_list_in_one_query(self):
+        self.follow()
+
+        with self.assertNumQueries(1):
+            flags = {p.username: p.is_followed_by_me for p in Profile.objects.with_followed_by(self.user)}
+
+        self.assertEqual(flags, {"user": False, "star": True})
+
+    def test_reconcile_command_fixes_drift(self):
+        Follow.objects.create(follower=self.user, followed=self.star)
+        untouched = make_user("untouched")
+
+        out = StringIO()
+        call_command("reconcile_follow_counters", "--batch-size", "1", stdout=out)
+
+        self.assertEqual(self.counts(), (1, 1))
+        untouched.refresh_from_db()
+        self.assertEqual((untouched.followers_count, untouched.following_count), (0, 0))
+        self.assertIn("Fixed 2 drifted profile(s)", out.getvalue())
+
+
+@override_settings(**TEST_SETTINGS, FOLLOW_PAGE_SIZE=2, FOLLOW_MAX_PAGE_SIZE=3)
+class FollowListTests(APITestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+        self.fans = [make_user(f"fan{i}") for i in range(5)]
+        for fan in self.fans:
+            fan.follow(self.user)
+        self.user.follow(self.fans[0])
+        self.client.force_authenticate(self.user)
+
+    def test_followers_are_paged_newest_first(self):
+        usernames, cursor = [], None
+        while True:
+            response = self.client.get("/auth/followers/", {"cursor": cursor} if cursor else {})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.json()
+            self.assertLessEqual(len(page["results"]), 2)
+            usernames += [row["username"] for row in page["results"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(usernames, [f"fan{i}" for i in reversed(range(5))])
+
+    def test_page_size_is_capped(self):
+        response = self.client.get("/auth/followers/", {"page_size": 100})
+
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_relationship_flags_take_one_query_per_page(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/auth/followers/", {"page_size": 3, "relationships": "true"})
+
+        flags = {row["username"]: (row["is_followed_by_me"], row["follows_me"]) for row in response.json()["results"]}
+        self.assertEqual(flags, {"fan4": (False, True), "fan3": (False, True), "fan2": (False, True)})
+
+        following = self.client.get("/auth/following/", {"relationships": "1"}).json()["results"]
+        self.assertEqual(
+            [(row["username"], row["is_followed_by_me"], row["follows_me"]) for row in following],
+            [("fan0", True, True)],
+        )
+
+    def test_other_users_list_and_bad_cursor(self):
+        response = self.client.get("/auth/following/", {"user_id": self.fans[1].id})
+        self.assertEqual([row["username"] for row in response.json()["results"]], ["user"])
+        self.assertNotIn("follows_me", response.json()["results"][0])
+
+        response = self.client.get("/auth/followers/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(**TEST_SETTINGS, FOLLOW_STATUS_MAX_IDS=5, FOLLOWING_CACHE="")
+class FollowStatusBulkTests(APITestCase):
+    url = "/auth/status/bulk/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("user")
+        self.friend, self.fan, self.idol, self.stranger = (
+            make_user(name) for name in ("friend", "fan", "idol", "stranger")
+        )
+        self.user.follow(self.friend)
+        self.friend.follow(self.user)
+        self.fan.follow(self.user)
+        self.user.follow(self.idol)
+        self.client.force_authenticate(self.user)
+
+    def status(self, *users):
+        response = self.client.get(self.url, {"ids": ",".join(str(u.id) for u in users)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row["id"], row["is_followed_by_me"], row["follows_me"]) for row in response.json()["results"]]
+
+    def test_both_directions_in_one_query(self):
+        with self.assertNumQueries(1):
+            results = self.status(self.stranger, self.friend, self.fan, self.idol, self.friend)
+
+        self.assertEqual(results, [
+            (self.stranger.id, False, False),
+            (self.friend.id, True, True),
+            (self.fan.id, False, True),
+            (self.idol.id, True, False),
+        ])
+
+    @override_settings(FOLLOWING_CACHE="default")
+    def test_cached_following_set_is_dropped_on_follow(self):
+        self.status(self.stranger)
+        with self.assertNumQueries(1):  # only the follows-me direction
+            self.assertEqual(self.status(self.stranger, self.idol), [
+                (self.stranger.id, False, False), (self.idol.id, True, False),
+            ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.follow(self.stranger)
+            # Not before the commit, or a concurrent reader could cache the old set again.
+            self.assertEqual(self.status(self.stranger)[0], (self.stranger.id, False, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.unfollow(self.idol)
+
+        self.assertEqual(self.status(self.stranger, self.idol), [
+            (self.stranger.id, True, False), (self.idol.id, False, False),
+        ])
+
+    @override_settings(FOLLOWING_CACHE="default", FOLLOWING_CACHE_MAX_SIZE=1)
+    def test_large_following_sets_are_not_cached(self):
+        self.assertEqual(self.status(self.friend, self.idol)[1], (self.idol.id, True, False))
+        with self.assertNumQueries(1):
+            self.status(self.friend, self.idol)
+
+    def test_ids_are_validated(self):
+        self.assertEqual(self.client.get(self.url, {"ids": "1,x"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {"ids": "1,2,3,4,5,6"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url).json(), {"results": []})
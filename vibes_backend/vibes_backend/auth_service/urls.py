@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterUserView, MyTokenObtainPairView, FollowUserView,UnfollowUserView,FollowStatusView,ProfileView,FollowersListView,FollowingListView
+from .views import RegisterUserView, MyTokenObtainPairView, FollowUserView,UnfollowUserView,FollowStatusView,FollowStatusBulkView,ProfileView,FollowersListView,FollowingListView,PresenceView
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
@@ -13,9 +13,12 @@ urlpatterns = [
     path('follow/', FollowUserView.as_view(), name='follow'),
     path('unfollow/', UnfollowUserView.as_view(), name='unfollow'),
     path('status/', FollowStatusView.as_view(), name='status'),
+    path('status/bulk/', FollowStatusBulkView.as_view(), name='status-bulk'),
 
     path("followers/", FollowersListView.as_view(), name="followers-list"),
     path("following/", FollowingListView.as_view(), name="following-list"),
 
+    path("presence/", PresenceView.as_view(), name="presence"),
+
     
 ]
\ No newline at end of file
@@ -1,13 +1,21 @@
 import logging
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import RegisterSerializer,UserSerializer, MyTokenObtainPairSerializer, FollowSerializer
 from .models import Profile, Follow
+from .following import relationships
+from .presence import presence
+from post_service.pagination import KeysetPagination
+from vibes_backend import uploads
+from vibes_backend.images import process_variants
+from vibes_backend.media import media_url
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +33,8 @@ class ProfileView(APIView):
         """
         if user_id:
             try:
-                profile = Profile.objects.get(id=user_id)
+                # Counters are columns; the follow flag comes in the same query
+                profile = Profile.objects.with_followed_by(request.user).get(id=user_id)
             except Profile.DoesNotExist:
                 return Response({"error": "Profile not found."}, status=status.HTTP_404_NOT_FOUND)
         else:
@@ -46,8 +55,12 @@ class ProfileView(APIView):
         if fullname:
             profile.fullname = fullname
 
-        # Update profile picture if provided
+        # Update profile picture if provided, as a file or as a
+        # direct-to-storage upload (see vibes_backend/uploads.py)
         profile_picture = request.FILES.get('profile_picture')
+        picture_upload = request.data.get('profile_picture_upload')
+        if picture_upload:
+            profile_picture = uploads.claim(picture_upload, 'avatar', profile)
         if profile_picture:
             # Delete old profile picture if it exists
             if profile.profile_picture:
@@ -56,6 +69,8 @@ class ProfileView(APIView):
 
         try:
             profile.save()
+            if picture_upload:
+                process_variants(profile, 'profile_picture')
             serializer = UserSerializer(profile, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except Exception as e:
@@ -124,10 +139,9 @@ class FollowUserView(APIView):
             follower = Profile.objects.get(id=follower_id)
             followed = Profile.objects.get(id=followed_id)
 
-            if Follow.objects.filter(follower=follower, followed=followed).exists():
+            # Creates the follow and bumps both counters in one transaction
+            if not follower.follow(followed):
                 return Response({'detail': 'Already following.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            Follow.objects.create(follower=follower, followed=followed)
             return Response({'detail': 'Followed successfully.'}, status=status.HTTP_201_CREATED)
         except Profile.DoesNotExist:
             return Response({"error": "Follower or followed user not found."}, status=status.HTTP_404_NOT_FOUND)    
@@ -150,11 +164,8 @@ class UnfollowUserView(APIView):
             follower = Profile.objects.get(id=follower_id)
             followed = Profile.objects.get(id=followed_id)
 
-            follow_instance = Follow.objects.filter(follower=follower, followed=followed).first()
-            if not follow_instance:
+            if not follower.unfollow(followed):
                 return Response({'detail': 'Not following this user.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            follow_instance.delete()
             return Response({'detail': 'Unfollowed successfully.'}, status=status.HTTP_204_NO_CONTENT)
         except Profile.DoesNotExist:
             return Response({"error": "Follower or followed user not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -180,61 +191,126 @@ class FollowStatusView(APIView):
         return Response({'is_following': is_following}, status=status.HTTP_200_OK)
 
 
-class FollowersListView(APIView):
+class FollowStatusBulkView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get(self, request, format=None):
+        """
+        Follow relationships between the caller and many users at once, in
+        place of one FollowStatusView call per user.
+        Expected query parameter: ids, comma-separated (at most FOLLOW_STATUS_MAX_IDS)
+
+        Returns {"results": [{"id", "is_followed_by_me", "follows_me"}, ...]}
+        in the requested order, from one indexed query (see following.py).
+        """
+        try:
+            ids = list(dict.fromkeys(int(i) for i in request.query_params.get('ids', '').split(',') if i.strip()))
+        except ValueError:
+            return Response({"error": "ids must be comma-separated user IDs."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.FOLLOW_STATUS_MAX_IDS:
+            return Response(
+                {"error": f"At most {settings.FOLLOW_STATUS_MAX_IDS} ids per request."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        following, followers = relationships(request.user, ids)
+        results = [
+            {"id": user_id, "is_followed_by_me": user_id in following, "follows_me": user_id in followers}
+            for user_id in ids
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class FollowListView(APIView):
+    """
+    A user's followers or followed users, most recent follow first.
+
+    Query params: user_id (optional, defaults to the caller), cursor,
+    page_size, and relationships=true to add "is_followed_by_me" and
+    "follows_me" (relative to the caller) to every row.
+    Keyset-paginated on the Follow (user, created_at, id) indexes, so every
+    page costs the same however many followers the user has; the
+    relationship flags take one more query for the whole page.
+    """
+    permission_classes = [IsAuthenticated]
+    user_field = None     # Follow field holding the listed user
+    profile_field = None  # Follow field holding the profile of each row
+    error_message = None
+
     def get(self, request):
         try:
             user_id = request.query_params.get('user_id')
             if user_id:
                 try:
-                    user = Profile.objects.get(id=user_id)
+                    user = Profile.objects.only('id').get(id=user_id)
                 except Profile.DoesNotExist:
                     return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
             else:
                 user = request.user
 
-            followers = Follow.objects.filter(followed=user).select_related("follower")
+            follows = (
+                Follow.objects.filter(**{self.user_field: user})
+                .select_related(self.profile_field)
+                .only('created_at', *(f'{self.profile_field}__{f}' for f in ('fullname', 'username', 'profile_picture')))
+            )
+            paginator = KeysetPagination(settings.FOLLOW_PAGE_SIZE, settings.FOLLOW_MAX_PAGE_SIZE)
+            profiles = [getattr(f, self.profile_field) for f in paginator.paginate_queryset(follows, request)]
+
             data = [
                 {
-                    "id": f.follower.id,
-                    "fullname": f.follower.fullname,
-                    "username": f.follower.username,
-                    "profile_picture": request.build_absolute_uri(f.follower.profile_picture.url) if f.follower.profile_picture else None,
+                    "id": profile.id,
+                    "fullname": profile.fullname,
+                    "username": profile.username,
+                    "profile_picture": media_url(profile.profile_picture, request),
                 }
-                for f in followers
+                for profile in profiles
             ]
-            return Response(data, status=status.HTTP_200_OK)
+            if request.query_params.get('relationships', '').lower() in ('true', '1', 'yes'):
+                following, followers = relationships(request.user, [p.id for p in profiles])
+                for row in data:
+                    row["is_followed_by_me"] = row["id"] in following
+                    row["follows_me"] = row["id"] in followers
+            return Response(paginator.get_paginated_data(data), status=status.HTTP_200_OK)
+        except ValidationError:
+            raise
         except Exception as e:
-            logger.error("Error fetching followers: %s", str(e), exc_info=True)
-            return Response({"error": "Could not retrieve followers."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.error("%s %s", self.error_message, str(e), exc_info=True)
+            return Response({"error": self.error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
+class FollowersListView(FollowListView):
+    user_field = 'followed'
+    profile_field = 'follower'
+    error_message = "Could not retrieve followers."
 
-class FollowingListView(APIView):
+
+class FollowingListView(FollowListView):
+    user_field = 'follower'
+    profile_field = 'followed'
+    error_message = "Could not retrieve following users."
+
+class PresenceView(APIView):
+    """
+    Presence of many users at once.
+    Expected query parameter: ids, comma-separated user ids (at most PRESENCE_LOOKUP_MAX).
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         try:
-            user_id = request.query_params.get('user_id')
-            if user_id:
-                try:
-                    user = Profile.objects.get(id=user_id)
-                except Profile.DoesNotExist:
-                    return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-            else:
-                user = request.user
+            user_ids = list(dict.fromkeys(
+                int(user_id) for user_id in request.query_params.get('ids', '').split(',') if user_id
+            ))
+        except ValueError:
+            return Response({"error": "ids must be comma-separated integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > settings.PRESENCE_LOOKUP_MAX:
+            return Response(
+                {"error": f"At most {settings.PRESENCE_LOOKUP_MAX} ids can be looked up at once."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            following = Follow.objects.filter(follower=user).select_related("followed")
-            data = [
-                {
-                    "id": f.followed.id,
-                    "fullname": f.followed.fullname,
-                    "username": f.followed.username,
-                    "profile_picture": request.build_absolute_uri(f.followed.profile_picture.url) if f.followed.profile_picture else None,
-                }
-                for f in following
-            ]
-            return Response(data, status=status.HTTP_200_OK)
-        except Exception as e:
-            logger.error("Error fetching following: %s", str(e), exc_info=True)
-            return Response({"error": "Could not retrieve following users."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        found = presence.lookup(user_ids)
+        results = [
+            {"user_id": user_id, **found[user_id]} for user_id in user_ids if user_id in found
+        ]
+        return Response({"results": results}, status=status.HTTP_200_OK)
@@ -1,15 +1,21 @@
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import Conversation, ConversationParticipant, Message
+
+
+class ConversationParticipantInline(admin.TabularInline):
+    model = ConversationParticipant
+    extra = 0
+    raw_id_fields = ['profile', 'last_read_message']
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ['id', 'created_at', 'updated_at']
-    filter_horizontal = ['participants']
+    inlines = [ConversationParticipantInline]
 
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'conversation', 'sender', 'content', 'is_read', 'created_at']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['id', 'conversation', 'sender', 'content', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['content', 'sender__username']
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ChatServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_service'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals  # noqa: F401
+        from .ids import check_node_id
+
+        if settings.CHAT_WRITE_BEHIND:
+            check_node_id()
@@ -0,0 +1,131 @@
+"""
+The hot chat endpoints (message list/send, mark read), as async views (see
+vibes_backend/async_api.py). They also run under WSGI, where Django gives
+each request its own event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from drf_spectacular.utils import OpenApiParameter, extend_schema, inline_serializer
+from rest_framework import serializers, status
+
+from vibes_backend import uploads
+from vibes_backend.async_api import AsyncAPIView, json_response
+from vibes_backend.images import process_variants
+from .events import abroadcast_chat_event
+from .models import Conversation, ConversationParticipant, Message
+from post_service.pagination import PAGE_PARAMETERS, page_serializer
+from .pagination import MessagePagination
+from .serializers import MessageSerializer
+
+
+class MessageListView(AsyncAPIView):
+    """List messages in a conversation, a page at a time (see MessagePagination)."""
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("since", int, description="Only messages after this one (delta mode)"),
+            *PAGE_PARAMETERS,
+        ],
+        responses=page_serializer("MessagePage", MessageSerializer, has_more=serializers.BooleanField()),
+    )
+    async def get(self, request, conversation_id):
+        # {profile_id: last_read_message_id}; doubles as the participant check
+        cursors = {
+            profile_id: cursor
+            async for profile_id, cursor in ConversationParticipant.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('profile_id', 'last_read_message_id')
+        }
+        if request.user.id not in cursors:
+            raise Http404
+
+        paginator = MessagePagination()
+        messages = await paginator.apaginate_queryset(
+            Message.objects.filter(conversation_id=conversation_id).select_related('sender'),
+            request
+        )
+
+        # Mark the returned messages as read
+        newest = max((m.id for m in messages), default=None)
+        if newest and newest > (cursors[request.user.id] or 0):
+            await sync_to_async(ConversationParticipant.objects.mark_read)(
+                conversation_id, request.user.id, up_to=newest
+            )
+            cursors[request.user.id] = newest
+
+        serializer = MessageSerializer(
+            messages, many=True, context={'request': request, 'read_cursors': cursors}
+        )
+        return json_response(paginator.get_paginated_data(serializer.data))
+
+    @extend_schema(
+        request=inline_serializer("MessageCreate", {
+            "content": serializers.CharField(required=False),
+            "image": serializers.ImageField(required=False),
+            "image_upload": serializers.CharField(required=False, help_text="Token of a direct upload"),
+        }),
+        responses={201: MessageSerializer},
+    )
+    async def post(self, request, conversation_id):
+        conversation = await aget_object_or_404(
+            Conversation.objects.filter(participants=request.user),
+            pk=conversation_id
+        )
+
+        content = request.data.get('content', '').strip()
+        image = request.FILES.get('image')
+        # A direct-to-storage upload (see vibes_backend/uploads.py)
+        image_upload = request.data.get('image_upload')
+
+        if not content and not image and not image_upload:
+            return json_response(
+                {'error': 'Message content or image is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if image_upload:
+            # Storage round trips; blocking I/O.
+            image = await sync_to_async(uploads.claim)(image_upload, 'message', request.user)
+
+        # One transaction with the unread counters and conversation
+        # timestamp (and the image upload, which is blocking I/O).
+        message = await conversation.apost_message(request.user, content, image)
+        if image_upload:
+            await sync_to_async(process_variants)(message, 'image')
+
+        data = MessageSerializer(message, context={'request': request}).data
+
+        # Broadcast to WebSocket clients
+        await abroadcast_chat_event(conversation_id, {
+            "type": "chat_message",
+            "message": data,
+        })
+
+        return json_response(data, status=status.HTTP_201_CREATED)
+
+
+class MarkMessagesReadView(AsyncAPIView):
+    """Mark all messages in a conversation as read."""
+
+    @extend_schema(request=None, responses=inline_serializer("MarkedRead", {"marked_read": serializers.IntegerField()}))
+    async def post(self, request, conversation_id):
+        membership = await aget_object_or_404(
+            ConversationParticipant,
+            conversation_id=conversation_id,
+            profile=request.user
+        )
+
+        updated = membership.unread_count
+        if updated > 0:
+            await sync_to_async(ConversationParticipant.objects.mark_read)(
+                conversation_id, request.user.id
+            )
+
+        # Broadcast read receipt to WebSocket clients
+        if updated > 0:
+            await abroadcast_chat_event(conversation_id, {
+                "type": "chat_messages_read",
+                "reader_id": request.user.id,
+            })
+
+        return json_response({'marked_read': updated})
@@ -1,34 +1,328 @@
+import asyncio
 import json
+import logging
+import time
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-
-from .models import Conversation, Message
+from django.core import signing
+
+from auth_service.presence import presence
+from post_service.consumers import PostsConsumer
+from vibes_backend.frames import encode_frame
+from vibes_backend.outbox import OutboxMixin, read_resume_token
+
+from vibes_backend import metrics
+from .events import abroadcast_chat_event, chat_group, frame_text
+from .ids import next_message_id
+from .membership import is_member
+from .models import Conversation, ConversationParticipant, Message
+from .persistence import MESSAGE_WRITER_CHANNEL, message_payload
 from .serializers import MessageSerializer
 
+logger = logging.getLogger(__name__)
+
+
+def ack_frame(message_id, client_id):
+    return {"type": "message_ack", "id": message_id, "client_id": client_id}
+
+
+def failure_frame(message_id, client_id):
+    return {"type": "message_failed", "id": message_id, "client_id": client_id}
+
+
+class TypingState:
+    """Typing state last published for one conversation, and its pending expiry."""
+
+    def __init__(self):
+        self.is_typing = False
+        self.sent_at = 0.0
+        self.expiry = None
+
+
+class ChatSocketMixin:
+    """
+    Chat actions and chat event handlers shared by ChatConsumer and
+    LiveConsumer, for any conversation the user belongs to. Events go out
+    through the connection's send queue (vibes_backend/outbox.py): typing
+    may be dropped under backpressure, messages and receipts never are.
+
+    By default a message is stored before it is broadcast. With
+    CHAT_WRITE_BEHIND it is broadcast first and the sender gets a
+    "message_ack" once the MessageWriter worker has stored it, or a
+    "message_failed" if it never can be (see persistence.py).
+
+    Typing frames are throttled per connection and conversation: only
+    changes of state and a keepalive every CHAT_TYPING_KEEPALIVE seconds
+    are published, and typing stops by itself after CHAT_TYPING_TIMEOUT
+    seconds of silence, on disconnect and when the user sends a message.
+
+    A reconnecting client passes the seq of the last message it saw in each
+    conversation, or the resume token of its "evicted" frame (see
+    resume_points()), and gets only what it missed, replayed from the
+    database, before live delivery resumes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.typing = {}
+        # {conversation_id: last seq replayed}; live copies of those are skipped.
+        self.replayed_seq = {}
+
+    async def handle_send_message(self, conversation_id, data):
+        """Create message in DB (or queue it, write-behind) and broadcast it."""
+        content = data.get("content", "").strip()
+        if not content:
+            return
+        client_id = data.get("client_id")
+        await self.stop_typing(conversation_id)
+
+        if settings.CHAT_WRITE_BEHIND:
+            message_data = await self.queue_message(conversation_id, content, client_id)
+        else:
+            # Save message to database
+            message_data = await self.create_message(conversation_id, content)
+
+        await abroadcast_chat_event(conversation_id, {
+            "type": "chat_message",
+            "message": message_data,
+        })
+
+    async def queue_message(self, conversation_id, content, client_id):
+        """
+        Hand the message to the MessageWriter; no database access. Queued
+        before the broadcast so nothing is seen that isn't on its way to
+        storage. If the queue refuses it (full, unreachable) it is stored
+        inline instead. Either way it is broadcast without a seq, which is
+        only given when it is stored (see sequence.py).
+        """
+        message = Message(id=next_message_id(), conversation_id=conversation_id, sender=self.user, content=content)
+        message_data = message_payload(message)
+        try:
+            await self.channel_layer.send(MESSAGE_WRITER_CHANNEL, {
+                "type": "chat.persist",
+                "message": message_data,
+                "reply_channel": self.channel_name,
+                "client_id": client_id,
+            })
+        except Exception as e:
+            logger.warning(f"Message queue unavailable, storing inline: {e}")
+            await database_sync_to_async(Conversation.objects.store_messages)([message])
+            await self.send_ack(message.id, client_id)
+        return message_data
+
+    async def send_ack(self, message_id, client_id):
+        await self.send(text_data=encode_frame(ack_frame(message_id, client_id)))
+
+    async def handle_typing(self, conversation_id, data):
+        """Broadcast typing indicator, throttled (see class docstring)."""
+        metrics.incr("typing_frames_received")
+        is_typing = bool(data.get("is_typing", False))
+        state = self.typing.setdefault(conversation_id, TypingState())
+
+        if state.expiry is not None:
+            state.expiry.cancel()
+            state.expiry = None
+        if is_typing:
+            state.expiry = asyncio.ensure_future(self.expire_typing(conversation_id))
+
+        keepalive_due = time.monotonic() - state.sent_at >= settings.CHAT_TYPING_KEEPALIVE
+        if is_typing != state.is_typing or (is_typing and keepalive_due):
+            await self.send_typing(conversation_id, is_typing)
+        elif not is_typing:
+            del self.typing[conversation_id]
+
+    async def expire_typing(self, conversation_id):
+        await asyncio.sleep(settings.CHAT_TYPING_TIMEOUT)
+        self.typing[conversation_id].expiry = None
+        await self.send_typing(conversation_id, False)
+
+    async def stop_typing(self, conversation_id):
+        state = self.typing.get(conversation_id)
+        if state is None:
+            return
+        if state.expiry is not None:
+            state.expiry.cancel()
+            state.expiry = None
+        if state.is_typing:
+            await self.send_typing(conversation_id, False)
+
+    async def send_typing(self, conversation_id, is_typing):
+        state = self.typing[conversation_id]
+        state.is_typing = is_typing
+        state.sent_at = time.monotonic()
+        if not is_typing and state.expiry is None:
+            del self.typing[conversation_id]
+        metrics.incr("typing_frames_forwarded")
+        await abroadcast_chat_event(conversation_id, {
+            "type": "chat_typing",
+            "user_id": self.user.id,
+            "is_typing": is_typing,
+        })
+
+    async def handle_mark_read(self, conversation_id):
+        """Mark messages as read and notify the conversation."""
+        await self.mark_messages_read(conversation_id)
+
+        await abroadcast_chat_event(conversation_id, {
+            "type": "chat_messages_read",
+            "reader_id": self.user.id,
+        })
+
+    def resume_points(self, conversation_id=None):
+        """
+        {conversation_id: last_seq} from the handshake's query: the `resume`
+        token of an evicted connection (vibes_backend/outbox.py), if it is
+        valid and the user's, then last_seq parameters, which win:
+        "<conversation_id>:<seq>", or a bare "<seq>" meaning
+        `conversation_id`. Malformed values are ignored.
+        """
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        points = {}
+        for token in query.get("resume", [])[:1]:
+            try:
+                user_id, seqs = read_resume_token(token)
+            except signing.BadSignature:
+                continue
+            if user_id == self.user.id:
+                points.update(seqs)
+        for value in query.get("last_seq", []):
+            target, _, seq = value.rpartition(":")
+            try:
+                target = int(target) if target else conversation_id
+                if target is not None:
+                    points[target] = max(int(seq), 0)
+            except ValueError:
+                continue
+        return points
+
+    async def replay(self, conversation_id, last_seq):
+        """
+        Queue the conversation's messages after `last_seq`, oldest first,
+        then {"type": "resumed"}. Runs in connect(), after the socket joined
+        its groups: live events wait until it returns, and chat_message()
+        skips the ones that were replayed. A client more than
+        CHAT_REPLAY_LIMIT messages behind gets {"type": "resync"} instead
+        and refetches the history from MessageListView.
+        """
+        missed = await self.missed_messages(conversation_id, last_seq)
+        if missed is None:
+            metrics.incr("chat_resyncs")
+            await self.queue_frame(encode_frame({"type": "resync", "conversation_id": conversation_id}))
+            return
+
+        for message in missed:
+            await self.queue_frame(
+                encode_frame({"type": "new_message", "message": message}),
+                position=(conversation_id, message["seq"]),
+            )
+        if missed:
+            last_seq = self.replayed_seq[conversation_id] = missed[-1]["seq"]
+        metrics.incr("chat_messages_replayed", len(missed))
+        await self.queue_frame(encode_frame({
+            "type": "resumed", "conversation_id": conversation_id, "last_seq": last_seq,
+        }))
+
+    # ----- Group message handlers (receive from channel layer) -----
+
+    async def chat_message(self, event):
+        """Send new message to WebSocket (never dropped), unless it was replayed already."""
+        seq = event["message"].get("seq")
+        if seq is not None and seq <= self.replayed_seq.get(event["conversation_id"], 0):
+            return
+        position = (event["conversation_id"], seq) if seq is not None else None
+        await self.queue_frame(frame_text(event), position=position)
+
+    async def chat_persisted(self, event):
+        """The MessageWriter stored one of this socket's messages."""
+        await self.queue_frame(encode_frame(ack_frame(event["id"], event.get("client_id"))))
+
+    async def chat_persist_failed(self, event):
+        """The MessageWriter gave up on one of this socket's messages."""
+        await self.queue_frame(encode_frame(failure_frame(event["id"], event.get("client_id"))))
+
+    async def chat_typing(self, event):
+        """Send typing indicator to WebSocket (skip sender); droppable."""
+        if event["user_id"] != self.user.id:
+            await self.queue_frame(frame_text(event), droppable=True)
+
+    async def chat_messages_read(self, event):
+        """Send read receipt to WebSocket (skip reader)."""
+        if event["reader_id"] != self.user.id:
+            await self.queue_frame(frame_text(event))
+
+    # ----- Database operations -----
+
+    @database_sync_to_async
+    def check_participant(self, conversation_id):
+        """Check if user is a participant in the conversation (cached membership set)."""
+        return is_member(conversation_id, self.user.id)
+
+    @database_sync_to_async
+    def create_message(self, conversation_id, content):
+        """Create a new message in the database."""
+        # Membership was checked already; writes only from here on.
+        # Also bumps unread counters and the conversation timestamp.
+        message = Conversation.objects.post_message(conversation_id, self.user, content)
+
+        # Return serialized message data
+        return message_payload(message)
+
+    @database_sync_to_async
+    def missed_messages(self, conversation_id, last_seq):
+        """Payloads of the messages after `last_seq`; None if more than CHAT_REPLAY_LIMIT."""
+        limit = settings.CHAT_REPLAY_LIMIT
+        messages = list(
+            Message.objects.filter(conversation_id=conversation_id, seq__gt=last_seq)
+            .select_related('sender').order_by('seq')[:limit + 1]
+        )
+        if len(messages) > limit:
+            return None
+        return [message_payload(message) for message in messages]
+
+    @database_sync_to_async
+    def mark_messages_read(self, conversation_id):
+        """Move the user's read cursor to the newest message."""
+        ConversationParticipant.objects.mark_read(conversation_id, self.user.id)
+
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(ChatSocketMixin, OutboxMixin, AsyncWebsocketConsumer):
     """
-    WebSocket consumer for real-time chat messaging.
+    WebSocket consumer for real-time chat messaging in one conversation.
+    Clients that want all their conversations and the feed on one socket
+    use LiveConsumer instead.
 
-    URL pattern: ws/chat/<conversation_id>/
+    URL pattern: ws/chat/<conversation_id>/[?last_seq=<seq>][&resume=<token>]
     Group naming: chat_<conversation_id>
 
     Client -> Server messages:
-        {"type": "send_message", "content": "Hello!"}
+        {"type": "send_message", "content": "Hello!", "client_id": "optional"}
         {"type": "typing", "is_typing": true}
         {"type": "mark_read"}
 
     Server -> Client messages:
         {"type": "new_message", "message": {...}}
-        {"type": "typing", "user_id": 5, "is_typing": true}
-        {"type": "messages_read", "reader_id": 5}
+        {"type": "message_ack", "id": 123, "client_id": "optional"}
+        {"type": "message_failed", "id": 123, "client_id": "optional"}
+        {"type": "typing", "conversation_id": 1, "user_id": 5, "is_typing": true}
+        {"type": "messages_read", "conversation_id": 1, "reader_id": 5}
+        After a last_seq or resume handshake, the missed new_message frames, then:
+        {"type": "resumed", "conversation_id": 1, "last_seq": 42}
+        or, too far behind: {"type": "resync", "conversation_id": 1}
+        Before a slow consumer is closed (code 4008):
+        {"type": "evicted", "resume": "<token>"}
     """
 
+    # Set once the connection counts towards the user's presence.
+    presence_user_id = None
+
     async def connect(self):
         self.user = self.scope.get("user")
         self.conversation_id = self.scope["url_route"]["kwargs"]["conversation_id"]
-        self.room_group_name = f"chat_{self.conversation_id}"
+        self.room_group_name = chat_group(self.conversation_id)
 
         # Reject unauthenticated connections
         if isinstance(self.user, AnonymousUser) or not self.user:
@@ -36,7 +330,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Verify user is a participant in this conversation
-        is_participant = await self.check_participant()
+        is_participant = await self.check_participant(self.conversation_id)
         if not is_participant:
             await self.close()
             return
@@ -47,9 +341,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(self.scope.get("auth_subprotocol"))
+        self.presence_user_id = self.user.id
+        await presence.connect(self.presence_user_id)
+
+        last_seq = self.resume_points(self.conversation_id).get(self.conversation_id)
+        if last_seq is not None:
+            await self.replay(self.conversation_id, last_seq)
 
     async def disconnect(self, close_code):
+        if self.presence_user_id is not None:
+            await self.stop_typing(self.conversation_id)
+            await presence.disconnect(self.presence_user_id)
+
         # Leave room group
         if hasattr(self, "room_group_name"):
             await self.channel_layer.group_discard(
@@ -61,134 +365,78 @@ class ChatConsumer(AsyncWebsocketConsumer):
         """Handle incoming WebSocket messages from client."""
         try:
             data = json.loads(text_data)
+            if not isinstance(data, dict):
+                return
             message_type = data.get("type")
 
             if message_type == "send_message":
-                await self.handle_send_message(data)
+                await self.handle_send_message(self.conversation_id, data)
             elif message_type == "typing":
-                await self.handle_typing(data)
+                await self.handle_typing(self.conversation_id, data)
             elif message_type == "mark_read":
-                await self.handle_mark_read()
+                await self.handle_mark_read(self.conversation_id)
         except json.JSONDecodeError:
             pass
 
-    async def handle_send_message(self, data):
-        """Create message in DB and broadcast to group."""
-        content = data.get("content", "").strip()
-        if not content:
-            return
-
-        # Save message to database
-        message_data = await self.create_message(content)
-
-        # Broadcast to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message_data,
-            }
-        )
-
-    async def handle_typing(self, data):
-        """Broadcast typing indicator to group."""
-        is_typing = data.get("is_typing", False)
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_typing",
-                "user_id": self.user.id,
-                "is_typing": is_typing,
-            }
-        )
+class LiveConsumer(ChatSocketMixin, PostsConsumer):
+    """
+    One socket per client for everything: chat in all of the user's
+    conversations plus the feed. Authenticates and joins groups once,
+    instead of once per open conversation.
 
-    async def handle_mark_read(self):
-        """Mark messages as read and notify group."""
-        await self.mark_messages_read()
+    URL pattern: ws/live/[?last_seq=<conversation_id>:<seq>&last_seq=...][&resume=<token>]
+    Group naming: user_<user_id> (chat events of every conversation the
+    user is in, and new home timeline posts), post_<post_id> per
+    subscribed post.
 
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_messages_read",
-                "reader_id": self.user.id,
-            }
-        )
+    Client -> Server messages:
+        PostsConsumer's subscribe / unsubscribe / set_subscriptions frames
+        ChatConsumer's frames, each with the conversation it is for:
+        {"type": "send_message", "conversation_id": 1, "content": "Hello!", "client_id": "optional"}
+        {"type": "typing", "conversation_id": 1, "is_typing": true}
+        {"type": "mark_read", "conversation_id": 1}
 
-    # ----- Group message handlers (receive from channel layer) -----
+    Server -> Client messages:
+        PostsConsumer's and ChatConsumer's messages
+    """
 
-    async def chat_message(self, event):
-        """Send new message to WebSocket."""
-        await self.send(text_data=json.dumps({
-            "type": "new_message",
-            "message": event["message"],
-        }))
+    chat_frames = ("send_message", "typing", "mark_read")
 
-    async def chat_typing(self, event):
-        """Send typing indicator to WebSocket (skip sender)."""
-        if event["user_id"] != self.user.id:
-            await self.send(text_data=json.dumps({
-                "type": "typing",
-                "user_id": event["user_id"],
-                "is_typing": event["is_typing"],
-            }))
+    async def connect(self):
+        user = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+        await super().connect()
 
-    async def chat_messages_read(self, event):
-        """Send read receipt to WebSocket (skip reader)."""
-        if event["reader_id"] != self.user.id:
-            await self.send(text_data=json.dumps({
-                "type": "messages_read",
-                "reader_id": event["reader_id"],
-            }))
+        for conversation_id, last_seq in self.resume_points().items():
+            if await self.check_participant(conversation_id):
+                await self.replay(conversation_id, last_seq)
 
-    # ----- Database operations -----
+    async def disconnect(self, close_code):
+        for conversation_id in list(self.typing):
+            await self.stop_typing(conversation_id)
+        await super().disconnect(close_code)
+
+    async def handle_frame(self, data):
+        message_type = data.get("type")
+        if message_type not in self.chat_frames:
+            await super().handle_frame(data)
+            return
 
-    @database_sync_to_async
-    def check_participant(self):
-        """Check if user is a participant in the conversation."""
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return conversation.participants.filter(id=self.user.id).exists()
-        except Conversation.DoesNotExist:
-            return False
-
-    @database_sync_to_async
-    def create_message(self, content):
-        """Create a new message in the database."""
-        conversation = Conversation.objects.get(id=self.conversation_id)
-
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=self.user,
-            content=content,
-        )
-
-        # Update conversation timestamp
-        conversation.save()
-
-        # Return serialized message data
-        return {
-            "id": message.id,
-            "conversation": message.conversation.id,
-            "sender_id": message.sender.id,
-            "sender_username": message.sender.username,
-            "sender_fullname": message.sender.fullname,
-            "sender_profile_picture": message.sender.profile_picture.url if message.sender.profile_picture else None,
-            "content": message.content,
-            "image": None,
-            "created_at": message.created_at.isoformat(),
-            "is_read": message.is_read,
-        }
+            conversation_id = int(data.get("conversation_id"))
+        except (TypeError, ValueError):
+            await self.send_error("conversation_id must be an integer.")
+            return
+        if not await self.check_participant(conversation_id):
+            await self.send_error(f"Not a participant of conversation {conversation_id}.")
+            return
 
-    @database_sync_to_async
-    def mark_messages_read(self):
-        """Mark all messages from other user as read."""
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            conversation.messages.filter(
-                is_read=False
-            ).exclude(
-                sender=self.user
-            ).update(is_read=True)
-        except Conversation.DoesNotExist:
-            pass
+        if message_type == "send_message":
+            await self.handle_send_message(conversation_id, data)
+        elif message_type == "typing":
+            await self.handle_typing(conversation_id, data)
+        else:
+            await self.handle_mark_read(conversation_id)
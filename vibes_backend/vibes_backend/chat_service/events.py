@@ -0,0 +1,73 @@
+"""
+Chat event delivery.
+
+Every event goes to the conversation's chat_<id> group, for ws/chat/<id>/
+sockets, and to each participant's user_<id> group, for the multiplexed
+ws/live/ socket, tagged with its conversation_id. Participants come from
+the membership sets (membership.py), so with CHAT_MEMBERSHIP_CACHE set
+this adds no query per event.
+
+The frame the sockets send on is encoded here, once per event, as
+event["text"] (see vibes_backend/frames.py).
+"""
+import asyncio
+
+from channels.db import database_sync_to_async
+
+from post_service.events import broadcast_event, user_group
+from vibes_backend.async_api import abroadcast
+from vibes_backend.frames import encode_frame, with_text
+from .membership import conversation_members
+
+
+def chat_group(conversation_id):
+    """Group of the ws/chat/<id>/ sockets open on the conversation."""
+    return f"chat_{conversation_id}"
+
+
+def client_frame(event):
+    """The frame chat sockets send for a chat event."""
+    if event["type"] == "chat_message":
+        return {"type": "new_message", "message": event["message"]}
+    if event["type"] == "chat_typing":
+        return {
+            "type": "typing",
+            "conversation_id": event["conversation_id"],
+            "user_id": event["user_id"],
+            "is_typing": event["is_typing"],
+        }
+    return {
+        "type": "messages_read",
+        "conversation_id": event["conversation_id"],
+        "reader_id": event["reader_id"],
+    }
+
+
+def frame_text(event):
+    """The encoded frame of a chat event, encoding it if the sender didn't."""
+    return event.get("text") or encode_frame(client_frame(event))
+
+
+def prepare(conversation_id, event):
+    event = {**event, "conversation_id": int(conversation_id)}
+    return with_text(event, client_frame(event))
+
+
+def chat_event_groups(conversation_id):
+    return [chat_group(conversation_id)] + [
+        user_group(profile_id) for profile_id in conversation_members(conversation_id)
+    ]
+
+
+def broadcast_chat_event(conversation_id, event):
+    """Broadcast a chat event. Fails silently if Redis is unavailable."""
+    event = prepare(conversation_id, event)
+    for group in chat_event_groups(conversation_id):
+        broadcast_event(group, event)
+
+
+async def abroadcast_chat_event(conversation_id, event):
+    """broadcast_chat_event() for async callers; the group_sends run concurrently."""
+    event = prepare(conversation_id, event)
+    groups = await database_sync_to_async(chat_event_groups)(conversation_id)
+    await asyncio.gather(*(abroadcast(group, event) for group in groups))
@@ -0,0 +1,75 @@
+"""
+Time-ordered message ids for CHAT_WRITE_BEHIND, assigned by the server
+before the row exists so a message can be broadcast before it is written
+(see persistence.py). Otherwise the database assigns message ids.
+
+Layout, 53 bits so ids stay exact as JavaScript numbers:
+
+    41 bits  milliseconds since ID_EPOCH_MS (good until 2094)
+     5 bits  node: CHAT_NODE_ID, unique per running process (checked at
+             startup when write-behind is on, see check_node_id())
+     7 bits  sequence within the millisecond (128/ms per node)
+
+Ids sort by creation time across nodes to the millisecond, and are all
+larger than the auto-increment ids the database issues.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+ID_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+NODE_BITS = 5
+SEQUENCE_BITS = 7
+MAX_NODE = (1 << NODE_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+
+def check_node_id():
+    """The CHAT_NODE_ID setting as an int; ImproperlyConfigured if it is unset or out of range."""
+    try:
+        node = int(settings.CHAT_NODE_ID)
+    except (TypeError, ValueError):
+        raise ImproperlyConfigured(
+            f"CHAT_NODE_ID must be set to a node id (0-{MAX_NODE}) unique to this process."
+        )
+    if not 0 <= node <= MAX_NODE:
+        raise ImproperlyConfigured(f"CHAT_NODE_ID must be between 0 and {MAX_NODE}, not {node}.")
+    return node
+
+
+class MessageIdGenerator:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def __call__(self):
+        node = check_node_id()
+        with self._lock:
+            now = int(time.time() * 1000)
+            # Never go backwards, even if the wall clock does.
+            now = max(now, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond: borrow the next one.
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - ID_EPOCH_MS) << (NODE_BITS + SEQUENCE_BITS)) | (node << SEQUENCE_BITS) | self._sequence
+
+
+_generator = MessageIdGenerator()
+
+
+def next_message_id():
+    return _generator()
+
+
+def default_message_id():
+    """Message.id default: a server id under CHAT_WRITE_BEHIND, else None for the database to assign one."""
+    return next_message_id() if settings.CHAT_WRITE_BEHIND else None
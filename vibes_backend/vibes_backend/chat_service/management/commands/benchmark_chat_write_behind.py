@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from channels.testing import ApplicationCommunicator, WebsocketCommunicator
+from django.conf import settings
+from django.test.utils import override_settings
+
+from auth_service.models import Profile
+from chat_service.consumers import ChatConsumer
+from chat_service.models import Conversation, Message
+from chat_service.persistence import MESSAGE_WRITER_CHANNEL, MessageWriter
+from vibes_backend.benchmarking import BenchmarkCommand, summarize
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Compare chat message throughput and send-to-delivery latency with "
+        "messages stored before broadcast (default) and with CHAT_WRITE_BEHIND, "
+        "where the MessageWriter worker runs in-process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--conversations", type=int, default=50, help="Concurrent senders, one per conversation.")
+        parser.add_argument("--messages", type=int, default=40, help="Messages per sender.")
+        parser.add_argument(
+            "--layer-latency-ms", type=float, default=2.0,
+            help="Simulated channel-layer (Redis) round trip per group_send.",
+        )
+
+    def run_benchmark(self, **options):
+        conversations = []
+        for i in range(options["conversations"]):
+            sender = Profile.objects.create_user(
+                email=f"sender{i}@example.com", password="benchmark-password",
+                fullname=f"Sender {i}", username=f"sender{i}",
+            )
+            recipient = Profile.objects.create_user(
+                email=f"recipient{i}@example.com", password="benchmark-password",
+                fullname=f"Recipient {i}", username=f"recipient{i}",
+            )
+            conversation, _ = Conversation.objects.get_or_create_direct(sender, recipient)
+            conversations.append((conversation.id, sender))
+
+        channel_layers = {
+            "default": {
+                "BACKEND": "vibes_backend.benchmarking.LatencyChannelLayer",
+                "CONFIG": {"latency": options["layer_latency_ms"] / 1000, "capacity": 100000},
+            }
+        }
+        rows = []
+        for write_behind in (False, True):
+            with override_settings(
+                CHANNEL_LAYERS=channel_layers, CHAT_WRITE_BEHIND=write_behind, PRESENCE_CACHE="default",
+                CHAT_NODE_ID=settings.CHAT_NODE_ID or 0,
+            ):
+                summary, drained = asyncio.run(self.load(conversations, options))
+            rows.append([
+                "write-behind" if write_behind else "store first", summary["requests"],
+                f"{summary['rps']:.0f}", f"{summary['p50_ms']:.1f}", f"{summary['p99_ms']:.1f}",
+                f"{drained * 1000:.0f}",
+            ])
+
+        stored = Message.objects.count()
+        self.stdout.write(
+            f"{options['conversations']} senders x {options['messages']} messages per mode, "
+            f"{options['layer_latency_ms']}ms per group_send, {stored} messages stored\n"
+        )
+        self.write_table(["mode", "messages", "msg/s", "p50 ms", "p99 ms", "all stored ms"], rows)
+
+    async def load(self, conversations, options):
+        """
+        Every sender sends its messages one after another, each as soon as
+        its previous one comes back as a broadcast. Returns the latency
+        summary and how long after the first send the last message was stored.
+        """
+        layer = get_channel_layer()
+        writer = ApplicationCommunicator(
+            MessageWriter.as_asgi(), {"type": "channel", "channel": MESSAGE_WRITER_CHANNEL}
+        )
+
+        async def pump():
+            while True:
+                await writer.send_input(await layer.receive(MESSAGE_WRITER_CHANNEL))
+
+        sockets = []
+        for conversation_id, sender in conversations:
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/{conversation_id}/")
+            communicator.scope["user"] = sender
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": conversation_id}}
+            await communicator.connect()
+            sockets.append(communicator)
+
+        latencies = []
+
+        async def send_all(communicator):
+            acks = 0
+            for i in range(options["messages"]):
+                started = time.perf_counter()
+                await communicator.send_json_to({"type": "send_message", "content": f"message {i}"})
+                while True:
+                    event = await communicator.receive_json_from(timeout=30)
+                    if event["type"] == "new_message":
+                        break
+                    acks += 1
+                latencies.append(time.perf_counter() - started)
+            return acks
+
+        async def wait_for_acks(communicator, acks):
+            while acks < options["messages"]:
+                event = await communicator.receive_json_from(timeout=30)
+                acks += event["type"] == "message_ack"
+
+        pump_task = asyncio.ensure_future(pump())
+        started = time.perf_counter()
+        acks = await asyncio.gather(*(send_all(communicator) for communicator in sockets))
+        elapsed = time.perf_counter() - started
+        if settings.CHAT_WRITE_BEHIND:
+            await asyncio.gather(*(
+                wait_for_acks(communicator, n) for communicator, n in zip(sockets, acks)
+            ))
+        drained = time.perf_counter() - started
+
+        pump_task.cancel()
+        writer.stop()
+        for communicator in sockets:
+            await communicator.disconnect()
+        return summarize(latencies, elapsed), drained
@@ -0,0 +1,84 @@
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from auth_service.models import Profile
+from chat_service.models import Conversation, Message
+from chat_service.serializers import ConversationSerializer
+from chat_service.views import ConversationListView
+from vibes_backend.benchmarking import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Seed a user with thousands of conversations and compare query count and "
+        "latency of the per-row inbox serializer against Conversation.objects.for_inbox()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--conversations", type=int, default=2000)
+        parser.add_argument("--messages", type=int, default=5, help="Messages per conversation.")
+        parser.add_argument("--page-size", type=int, default=20)
+
+    def run_benchmark(self, **options):
+        user = self.seed(options["conversations"], options["messages"])
+        factory = APIRequestFactory()
+        request = factory.get("/chat/conversations/")
+        request.user = user
+
+        def per_row():
+            # The pre-annotation inbox: every conversation, lazy lookups per row.
+            conversations = Conversation.objects.filter(participants=user).distinct()
+            return ConversationSerializer(conversations, many=True, context={"request": request}).data
+
+        def annotated():
+            conversations = Conversation.objects.for_inbox(user)
+            return ConversationSerializer(conversations, many=True, context={"request": request}).data
+
+        def inbox_page():
+            page_request = factory.get("/chat/conversations/", {"page_size": options["page_size"]})
+            force_authenticate(page_request, user=user)
+            return ConversationListView.as_view()(page_request).data
+
+        rows = [
+            self.measure("per-row, all conversations", per_row),
+            self.measure("for_inbox, all conversations", annotated),
+            self.measure(f"for_inbox, one page of {options['page_size']}", inbox_page),
+        ]
+        self.stdout.write(
+            f"{options['conversations']} conversations, {options['messages']} messages each\n"
+        )
+        self.write_table(["inbox", "queries", "ms"], rows)
+
+    def measure(self, name, fn):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+        return [name, len(queries), f"{elapsed * 1000:.1f}"]
+
+    def seed(self, conversation_count, message_count):
+        users = Profile.objects.bulk_create(
+            Profile(email=f"user{i}@example.com", username=f"user{i}", fullname=f"User {i}", password="!")
+            for i in range(conversation_count + 1)
+        )
+        user, others = users[0], users[1:]
+
+        conversations = Conversation.objects.bulk_create(Conversation() for _ in others)
+        Membership = Conversation.participants.through
+        Membership.objects.bulk_create(
+            membership
+            for conversation, other in zip(conversations, others)
+            for membership in (
+                Membership(conversation=conversation, profile=user),
+                Membership(conversation=conversation, profile=other),
+            )
+        )
+        Message.objects.bulk_create(
+            Message(conversation=conversation, sender=user if i % 2 else other, content=f"message {i}")
+            for conversation, other in zip(conversations, others)
+            for i in range(message_count)
+        )
+        return user
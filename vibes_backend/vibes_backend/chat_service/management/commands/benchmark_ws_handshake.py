@@ -0,0 +1,74 @@
+import asyncio
+
+from channels.testing import WebsocketCommunicator
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auth_service.models import Profile
+from chat_service.middleware import JWTAuthMiddleware, user_cache
+from vibes_backend.benchmarking import BenchmarkCommand, run_load
+
+
+async def accept_and_close(scope, receive, send):
+    """Bare WebSocket app so the handshake cost is the middleware's."""
+    await receive()
+    await send({"type": "websocket.accept"})
+    while (await receive())["type"] != "websocket.disconnect":
+        pass
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measure WebSocket handshakes/sec through JWTAuthMiddleware during a "
+        "reconnect storm, with the user cache off and on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--handshakes", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=100)
+
+    def run_benchmark(self, **options):
+        users = Profile.objects.bulk_create(
+            Profile(email=f"user{i}@example.com", username=f"user{i}", fullname=f"User {i}", password="!")
+            for i in range(options["users"])
+        )
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        app = JWTAuthMiddleware(accept_and_close)
+
+        lookups = 0
+        load = user_cache.load
+
+        def counting_load(user_id):
+            nonlocal lookups
+            lookups += 1
+            return load(user_id)
+
+        async def handshake(i):
+            communicator = WebsocketCommunicator(app, f"/ws/?token={tokens[i % len(tokens)]}")
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return 101 if connected else 403
+
+        rows = []
+        user_cache.load = counting_load
+        try:
+            for name, ttl in [("off", 0), ("on", 60)]:
+                user_cache.clear()
+                lookups = 0
+                with override_settings(WS_AUTH_CACHE_TTL=ttl, WS_AUTH_SHARED_CACHE=""):
+                    summary, errors = asyncio.run(
+                        run_load(handshake, options["handshakes"], options["concurrency"])
+                    )
+                rows.append([
+                    name, summary["requests"], errors, lookups, f"{summary['rps']:.0f}",
+                    f"{summary['p50_ms']:.1f}", f"{summary['p99_ms']:.1f}",
+                ])
+        finally:
+            del user_cache.load
+
+        self.stdout.write(
+            f"{options['handshakes']} handshakes from {options['users']} users, "
+            f"concurrency {options['concurrency']}\n"
+        )
+        self.write_table(["cache", "handshakes", "errors", "user lookups", "per sec", "p50 ms", "p99 ms"], rows)
@@ -0,0 +1,103 @@
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+from auth_service.models import Profile
+from chat_service.consumers import ChatConsumer, LiveConsumer
+from chat_service.models import Conversation
+from post_service.consumers import PostsConsumer
+from vibes_backend.benchmarking import BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Compare sockets, handshake time and Python memory per connected user "
+        "for one ws/chat/<id>/ socket per open conversation plus ws/posts/, "
+        "versus a single multiplexed ws/live/ socket."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--open-conversations", type=int, default=5, help="Conversations each user has open.")
+
+    def run_benchmark(self, **options):
+        # Password hashing would dominate setup; nobody logs in here.
+        with override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]):
+            users = [
+                Profile.objects.create_user(
+                    email=f"user{i}@example.com", password="benchmark-password",
+                    fullname=f"User {i}", username=f"user{i}",
+                )
+                for i in range(options["users"])
+            ]
+        open_conversations = {user.id: [] for user in users}
+        for i, user in enumerate(users):
+            for step in range(1, options["open_conversations"] + 1):
+                other = users[(i + step) % len(users)]
+                conversation, _ = Conversation.objects.get_or_create_direct(user, other)
+                open_conversations[user.id].append(conversation.id)
+
+        def per_conversation(user):
+            sockets = [
+                (ChatConsumer, f"/ws/chat/{conversation_id}/", {"conversation_id": conversation_id})
+                for conversation_id in open_conversations[user.id]
+            ]
+            return sockets + [(PostsConsumer, "/ws/posts/", {})]
+
+        def multiplexed(user):
+            return [(LiveConsumer, "/ws/live/", {})]
+
+        channel_layers = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+        rows = []
+        with override_settings(CHANNEL_LAYERS=channel_layers, PRESENCE_CACHE="default"):
+            for name, sockets_for in (("socket per chat", per_conversation), ("multiplexed", multiplexed)):
+                cache.clear()
+                result = asyncio.run(self.measure(users, sockets_for))
+                rows.append([
+                    name, result["sockets"], result["groups"],
+                    f"{result['handshake_ms']:.2f}", f"{result['bytes'] / len(users) / 1024:.1f}",
+                ])
+
+        self.stdout.write(
+            f"{options['users']} users, {options['open_conversations']} open conversations each; "
+            "memory is Python heap per user (tracemalloc), including the in-process test transport\n"
+        )
+        self.write_table(["mode", "sockets", "group joins", "handshake ms", "KiB/user"], rows)
+
+    async def measure(self, users, sockets_for):
+        layer = get_channel_layer()
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+
+        communicators = []
+        started = time.perf_counter()
+        for user in users:
+            for consumer, path, kwargs in sockets_for(user):
+                communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+                communicator.scope["user"] = user
+                communicator.scope["url_route"] = {"kwargs": kwargs}
+                connected, _ = await communicator.connect()
+                assert connected, path
+                communicators.append(communicator)
+        elapsed = time.perf_counter() - started
+
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        groups = sum(len(channels) for channels in layer.groups.values())
+
+        for communicator in communicators:
+            await communicator.disconnect()
+        return {
+            "sockets": len(communicators),
+            "groups": groups,
+            "handshake_ms": elapsed / len(communicators) * 1000,
+            "bytes": used,
+        }
@@ -0,0 +1,48 @@
+"""
+Participant sets, for socket connects and chat event delivery.
+
+Without a cache each lookup queries the membership table. With
+CHAT_MEMBERSHIP_CACHE set to a CACHES alias shared by every process
+(Redis/Memcached), sets are kept there and dropped once a change to a
+conversation's participants commits (see signals.py), so a removed
+participant is refused everywhere straight away. A per-process cache
+would only be invalidated in the process that made the change.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ConversationParticipant
+
+
+def _cache():
+    alias = settings.CHAT_MEMBERSHIP_CACHE
+    return caches[alias] if alias else None
+
+
+def _key(conversation_id):
+    return f"chat-members:{conversation_id}"
+
+
+def conversation_members(conversation_id):
+    """Profile ids of the conversation's participants (empty if it doesn't exist)."""
+    cache = _cache()
+    members = cache.get(_key(conversation_id)) if cache is not None else None
+    if members is None:
+        members = set(
+            ConversationParticipant.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('profile_id', flat=True)
+        )
+        if cache is not None:
+            cache.set(_key(conversation_id), members, settings.CHAT_MEMBERSHIP_CACHE_TTL)
+    return members
+
+
+def is_member(conversation_id, user_id):
+    return user_id in conversation_members(conversation_id)
+
+
+def invalidate_members(*conversation_ids):
+    cache = _cache()
+    if cache is not None:
+        cache.delete_many([_key(conversation_id) for conversation_id in conversation_ids])
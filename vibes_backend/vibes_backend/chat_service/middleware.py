@@ -1,27 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from urllib.parse import parse_qs
+from django.core.cache import caches
 
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
 from auth_service.models import Profile
 
+# Subprotocol a browser client offers together with its token:
+#     new WebSocket(url, ["access_token", token])
+# The consumer echoes it back on accept, as browsers require.
+TOKEN_SUBPROTOCOL = "access_token"
+
+
+class UserCache:
+    """
+    In-process LRU of user id -> Profile with a TTL, bounded to
+    WS_AUTH_CACHE_SIZE entries. A TTL of 0 disables it.
+
+    When WS_AUTH_SHARED_CACHE names a Django cache alias, misses fall back
+    to it before the database, so a reconnect storm after a deploy costs
+    one query per user across all processes instead of one per handshake.
+
+    Profile saves and deletes invalidate the entry here and in the shared
+    cache (see signals.py); other processes' local copies expire within
+    the TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def ttl(self):
+        return settings.WS_AUTH_CACHE_TTL
+
+    @property
+    def shared(self):
+        alias = settings.WS_AUTH_SHARED_CACHE
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def shared_key(user_id):
+        return f"ws-auth-user:{user_id}"
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return None
+        user_id = str(user_id)  # the token claim is a string, pks are not
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        if self.ttl <= 0:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.WS_AUTH_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def load(self, user_id):
+        """Shared cache, then database. Returns None for an unknown user."""
+        shared = self.shared if self.ttl > 0 else None
+        if shared is not None:
+            user = shared.get(self.shared_key(user_id))
+            if user is not None:
+                return user
+
+        user = Profile.objects.filter(id=user_id).first()
+        if user is not None and shared is not None:
+            shared.set(self.shared_key(user_id), user, self.ttl)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.shared_key(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
 
 class JWTAuthMiddleware(BaseMiddleware):
     """
     JWT authentication middleware for WebSocket connections.
-    Extracts JWT token from query string and attaches user to scope.
+    Extracts JWT token from query string or subprotocol and attaches user to scope.
 
     Usage: ws://host/ws/chat/1/?token=<jwt_access_token>
+       or: new WebSocket("ws://host/ws/chat/1/", ["access_token", <jwt_access_token>])
     """
 
     async def __call__(self, scope, receive, send):
-        # Extract token from query string
-        query_string = scope.get("query_string", b"").decode("utf-8")
-        query_params = parse_qs(query_string)
-        token = query_params.get("token", [None])[0]
+        token = self.get_token(scope)
 
         if token:
             scope["user"] = await self.get_user_from_token(token)
@@ -30,16 +124,34 @@ class JWTAuthMiddleware(BaseMiddleware):
 
         return await super().__call__(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user_from_token(self, token):
+    def get_token(self, scope):
+        # Sec-WebSocket-Protocol: access_token, <jwt>
+        subprotocols = scope.get("subprotocols") or []
+        if TOKEN_SUBPROTOCOL in subprotocols:
+            index = subprotocols.index(TOKEN_SUBPROTOCOL)
+            if index + 1 < len(subprotocols):
+                scope["auth_subprotocol"] = TOKEN_SUBPROTOCOL
+                return subprotocols[index + 1]
+
+        # Extract token from query string
+        query_string = scope.get("query_string", b"").decode("utf-8")
+        query_params = parse_qs(query_string)
+        return query_params.get("token", [None])[0]
+
+    async def get_user_from_token(self, token):
         """Validate JWT token and return associated user."""
         try:
-            access_token = AccessToken(token)
-            user_id = access_token.get("user_id")
+            user_id = AccessToken(token).get(jwt_settings.USER_ID_CLAIM)
+        except TokenError:
+            return AnonymousUser()
+        if not user_id:
+            return AnonymousUser()
 
-            if user_id:
-                return Profile.objects.get(id=user_id)
-        except (TokenError, Profile.DoesNotExist):
-            pass
+        user = user_cache.get(user_id)
+        if user is None:
+            user = await database_sync_to_async(user_cache.load)(user_id)
+            if user is None:
+                return AnonymousUser()
+            user_cache.set(user_id, user)
 
-        return AnonymousUser()
+        return user if user.is_active else AnonymousUser()
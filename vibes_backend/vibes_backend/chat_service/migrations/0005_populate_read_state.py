@@ -0,0 +1,67 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def populate_read_state(apps, schema_editor):
+    """
+    Derive each participant's read cursor from the per-message is_read flags:
+    the cursor is the newest message before the first unread message from
+    someone else (or the newest message if there is none), and unread_count
+    is the number of messages from others after it.
+
+    Memberships are processed in pk batches, each in its own transaction, so
+    the migration can be interrupted and re-run on large tables.
+    """
+    ConversationParticipant = apps.get_model('chat_service', 'ConversationParticipant')
+    Message = apps.get_model('chat_service', 'Message')
+
+    messages = Message.objects.filter(conversation=OuterRef('conversation')).order_by()
+    from_others = messages.exclude(sender=OuterRef('profile'))
+
+    def count(queryset):
+        return Subquery(queryset.values('conversation').annotate(count=Count('id')).values('count'))
+
+    def newest(queryset):
+        return Subquery(queryset.values('conversation').annotate(newest=Max('id')).values('newest'))
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                ConversationParticipant.objects.filter(pk__gt=last_pk).order_by('pk').annotate(
+                    first_unread=Subquery(from_others.filter(is_read=False).order_by('id').values('id')[:1]),
+                ).annotate(
+                    newest_message=newest(messages),
+                    newest_before_unread=newest(messages.filter(id__lt=OuterRef('first_unread'))),
+                    unread=count(from_others.filter(id__gte=OuterRef('first_unread'))),
+                )[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+
+            for membership in batch:
+                if membership.first_unread is None:
+                    membership.last_read_message_id = membership.newest_message
+                    membership.unread_count = 0
+                else:
+                    membership.last_read_message_id = membership.newest_before_unread
+                    membership.unread_count = membership.unread
+            ConversationParticipant.objects.bulk_update(
+                batch, ['last_read_message', 'unread_count']
+            )
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Commit batch by batch instead of holding one transaction over the table.
+    atomic = False
+
+    dependencies = [
+        ('chat_service', '0004_conversation_participant'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_read_state, migrations.RunPython.noop),
+    ]
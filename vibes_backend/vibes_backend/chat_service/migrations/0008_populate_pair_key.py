@@ -0,0 +1,65 @@
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def populate_pair_key(apps, schema_editor):
+    """
+    Key existing 1:1 conversations by their participant pair, in pk batches.
+    Where racing creates left duplicate conversations for a pair, the oldest
+    one gets the key (and is what the create-or-get endpoint returns from now
+    on); the others keep a null key and stay listed in the inbox.
+    """
+    Conversation = apps.get_model('chat_service', 'Conversation')
+    Membership = apps.get_model('chat_service', 'ConversationParticipant')
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Conversation.objects.filter(pk__gt=last_pk, pair_key__isnull=True)
+                .order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+
+            participants = defaultdict(list)
+            for conversation_id, profile_id in Membership.objects.filter(
+                conversation_id__in=ids
+            ).values_list('conversation_id', 'profile_id'):
+                participants[conversation_id].append(profile_id)
+
+            keys = {}
+            for conversation_id in ids:
+                profile_ids = participants[conversation_id]
+                if len(profile_ids) == 2:
+                    low, high = sorted(profile_ids)
+                    keys.setdefault(f"{low}:{high}", conversation_id)
+
+            taken = set(
+                Conversation.objects.filter(pair_key__in=keys).values_list('pair_key', flat=True)
+            )
+            Conversation.objects.bulk_update(
+                [
+                    Conversation(pk=conversation_id, pair_key=key)
+                    for key, conversation_id in keys.items()
+                    if key not in taken
+                ],
+                ['pair_key'],
+            )
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Commit batch by batch instead of holding one transaction over the table.
+    atomic = False
+
+    dependencies = [
+        ('chat_service', '0007_conversation_pair_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_pair_key, migrations.RunPython.noop),
+    ]
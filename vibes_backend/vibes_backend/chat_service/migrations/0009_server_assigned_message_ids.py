@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:18
+
+import chat_service.ids
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_service', '0008_populate_pair_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.BigIntegerField(default=chat_service.ids.next_message_id, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
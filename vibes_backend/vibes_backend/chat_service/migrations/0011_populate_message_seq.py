@@ -0,0 +1,47 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 100
+
+
+def populate_message_seq(apps, schema_editor):
+    """
+    Number existing messages 1, 2, 3... within their conversation, in
+    history order (created_at, id), a batch of conversations at a time.
+    New messages continue from the highest number (see sequence.py).
+    """
+    Conversation = apps.get_model('chat_service', 'Conversation')
+    Message = apps.get_model('chat_service', 'Message')
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Conversation.objects.filter(pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+
+            numbered = []
+            seqs = {}
+            for message in Message.objects.filter(conversation_id__in=ids).order_by(
+                'conversation_id', 'created_at', 'id'
+            ).only('id', 'conversation_id'):
+                seqs[message.conversation_id] = seqs.get(message.conversation_id, 0) + 1
+                message.seq = seqs[message.conversation_id]
+                numbered.append(message)
+            Message.objects.bulk_update(numbered, ['seq'], batch_size=1000)
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Commit batch by batch instead of holding one transaction over the table.
+    atomic = False
+
+    dependencies = [
+        ('chat_service', '0010_message_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_message_seq, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:43
+
+import vibes_backend.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_service', '0011_populate_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='image_variants',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='image',
+            field=vibes_backend.images.VariantImageField(blank=True, null=True, upload_to='chat_images/', variants_field='image_variants'),
+        ),
+    ]
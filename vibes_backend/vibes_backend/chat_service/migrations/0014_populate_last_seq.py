@@ -0,0 +1,61 @@
+from django.db import migrations, transaction
+from django.db.models import Count, Max
+
+BATCH_SIZE = 100
+
+
+def populate_last_seq(apps, schema_editor):
+    """
+    Set each conversation's last_seq to its highest message seq, first
+    renumbering (in history order, as 0011 did) the conversations where
+    the old per-process counters issued a seq twice, so the unique
+    constraint added next can be created.
+    """
+    Conversation = apps.get_model('chat_service', 'Conversation')
+    Message = apps.get_model('chat_service', 'Message')
+
+    duplicated = set(
+        Message.objects.filter(seq__isnull=False).values('conversation_id', 'seq')
+        .annotate(n=Count('id')).filter(n__gt=1).values_list('conversation_id', flat=True)
+    )
+    for conversation_id in sorted(duplicated):
+        with transaction.atomic():
+            numbered = list(
+                Message.objects.filter(conversation_id=conversation_id)
+                .order_by('created_at', 'id').only('id')
+            )
+            for seq, message in enumerate(numbered, start=1):
+                message.seq = seq
+            # Clear first: renumbering in place can collide with itself.
+            Message.objects.filter(conversation_id=conversation_id).update(seq=None)
+            Message.objects.bulk_update(numbered, ['seq'], batch_size=1000)
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Conversation.objects.filter(pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+            last_seqs = (
+                Message.objects.filter(conversation_id__in=ids, seq__isnull=False)
+                .values('conversation_id').annotate(last=Max('seq'))
+            )
+            for row in last_seqs:
+                Conversation.objects.filter(pk=row['conversation_id']).update(last_seq=row['last'])
+        last_pk = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Commit batch by batch instead of holding one transaction over the table.
+    atomic = False
+
+    dependencies = [
+        ('chat_service', '0013_conversation_last_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_last_seq, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:31
+
+import chat_service.ids
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def reset_id_sequence(apps, schema_editor):
+    """Start the new id sequence after the server-assigned ids already stored."""
+    Message = apps.get_model('chat_service', 'Message')
+    for sql in schema_editor.connection.ops.sequence_reset_sql(no_style(), [Message]):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_service', '0015_message_seq_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=models.BigAutoField(default=chat_service.ids.default_message_id, primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(reset_id_sequence, migrations.RunPython.noop),
+    ]
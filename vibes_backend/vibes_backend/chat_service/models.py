@@ -1,15 +1,133 @@
-from django.db import models
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from auth_service.models import Profile
+from vibes_backend.images import VariantImageField
+from .ids import default_message_id
+from .sequence import reserve_seqs
+
+
+def direct_pair_key(user_id, other_id):
+    """Canonical key of the 1:1 conversation between two users, in either order."""
+    low, high = sorted((user_id, other_id))
+    return f"{low}:{high}"
+
+
+class ConversationQuerySet(models.QuerySet):
+
+    def get_or_create_direct(self, user, other):
+        """
+        Return (conversation, created) for the 1:1 conversation between two
+        users. The lookup is one equality match on the unique pair_key, and
+        concurrent creates converge on a single row: the loser of the
+        insert race gets the IntegrityError handled by get_or_create and
+        reads the winner's conversation.
+        """
+        pair_key = direct_pair_key(user.id, other.id)
+        try:
+            return self.get(pair_key=pair_key), False
+        except self.model.DoesNotExist:
+            pass
+
+        with transaction.atomic():
+            conversation, created = self.get_or_create(pair_key=pair_key)
+            if created:
+                conversation.participants.add(user, other)
+        return conversation, created
+
+    def post_message(self, conversation_id, sender, content, image=None):
+        """
+        Conversation.post_message() by id, for callers that have already
+        checked membership and don't need the row: writes only, no SELECT.
+        """
+        message = Message(conversation_id=conversation_id, sender=sender, content=content, image=image)
+        self.store_messages([message])
+        return message
+
+    def store_messages(self, messages):
+        """
+        Insert unsaved messages, possibly for many conversations, and account
+        for them: one INSERT, one UPDATE of the participants' read state and
+        one UPDATE of the conversations' timestamps and seq counters, whatever
+        the batch size, after locking the conversations to number the
+        messages (see sequence.py).
+        """
+        latest = {}
+        for message in messages:
+            latest[message.conversation_id] = max(
+                message.created_at, latest.get(message.conversation_id, message.created_at)
+            )
+
+        with transaction.atomic():
+            last_seqs = reserve_seqs(messages)
+            Message.objects.bulk_create(messages)
+            ConversationParticipant.objects.messages_posted(messages)
+            self.filter(pk__in=latest).update(
+                updated_at=Case(
+                    *[When(pk=pk, then=Value(at)) for pk, at in latest.items()],
+                    output_field=models.DateTimeField(),
+                ),
+                last_seq=Case(
+                    *[When(pk=pk, then=Value(seq)) for pk, seq in last_seqs.items()],
+                    output_field=models.PositiveBigIntegerField(),
+                ),
+            )
+        return messages
+
+    def for_inbox(self, user):
+        """
+        The user's conversations with everything the inbox shows fetched in
+        a fixed number of queries: the last message and the read cursors as
+        subqueries, the unread count from the user's membership row, and
+        the other participant as one prefetch.
+        """
+        last_message = Message.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-created_at', '-id')
+        others = ConversationParticipant.objects.filter(
+            conversation=OuterRef('pk')
+        ).exclude(profile=user)
+
+        return self.filter(memberships__profile=user).annotate(
+            unread=F('memberships__unread_count'),
+            read_cursor=F('memberships__last_read_message_id'),
+            other_read_cursor=Subquery(others.values('last_read_message_id')[:1]),
+            last_message_id=Subquery(last_message.values('id')[:1]),
+            last_message_content=Subquery(last_message.values('content')[:1]),
+            last_message_sender_id=Subquery(last_message.values('sender_id')[:1]),
+            last_message_created_at=Subquery(last_message.values('created_at')[:1]),
+        ).prefetch_related(
+            Prefetch(
+                'participants',
+                queryset=Profile.objects.exclude(id=user.id),
+                to_attr='other_participants',
+            )
+        )
 
 
 class Conversation(models.Model):
     """A conversation between two users."""
-    participants = models.ManyToManyField(Profile, related_name='conversations')
+    participants = models.ManyToManyField(
+        Profile, related_name='conversations', through='ConversationParticipant'
+    )
+    # direct_pair_key() of the two participants; null for legacy duplicates
+    pair_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Seq of the conversation's newest message (see sequence.py).
+    last_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    objects = ConversationQuerySet.as_manager()
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='conversation_inbox_idx'),
+        ]
 
     def __str__(self):
         participant_names = ', '.join([p.username for p in self.participants.all()[:2]])
@@ -17,11 +135,121 @@ class Conversation(models.Model):
 
     def get_other_participant(self, user):
         """Get the other participant in a 1-on-1 conversation."""
+        if hasattr(self, 'other_participants'):
+            return self.other_participants[0] if self.other_participants else None
         return self.participants.exclude(id=user.id).first()
 
+    def post_message(self, sender, content, image=None):
+        """
+        Create a message, bump the other participants' unread counters and
+        the conversation timestamp in one transaction.
+        """
+        message = Conversation.objects.post_message(self.pk, sender, content, image)
+        self.updated_at = message.created_at
+        return message
+
+    async def apost_message(self, sender, content, image=None):
+        return await sync_to_async(self.post_message)(sender, content, image)
+
+
+class ConversationParticipantQuerySet(models.QuerySet):
+
+    def messages_posted(self, messages):
+        """
+        Account for new messages in one UPDATE, as if applied in id order:
+        a sender's read cursor moves to their last message, after which only
+        later messages from others count as unread; participants who sent
+        nothing get every message added to their unread count.
+        """
+        by_conversation = defaultdict(list)
+        for message in sorted(messages, key=lambda m: m.id):
+            by_conversation[message.conversation_id].append(message)
+
+        unread, cursor = [], []
+        for conversation_id, posted in by_conversation.items():
+            last_sent = {message.sender_id: i for i, message in enumerate(posted)}
+            for sender_id, i in last_sent.items():
+                is_sender = Q(conversation_id=conversation_id, profile_id=sender_id)
+                later = sum(1 for message in posted[i + 1:] if message.sender_id != sender_id)
+                unread.append(When(is_sender, then=Value(later)))
+                cursor.append(When(is_sender, then=Value(posted[i].id)))
+            unread.append(When(conversation_id=conversation_id, then=F('unread_count') + len(posted)))
+
+        return self.filter(conversation_id__in=by_conversation).update(
+            unread_count=Case(
+                *unread, default=F('unread_count'), output_field=models.PositiveIntegerField()
+            ),
+            last_read_message_id=Case(
+                *cursor, default=F('last_read_message_id'), output_field=models.BigIntegerField()
+            ),
+        )
+
+    def mark_read(self, conversation_id, profile_id, up_to=None):
+        """
+        Move a participant's read cursor forward to message `up_to`, or to
+        the newest message when None. A single-row UPDATE; the unread count
+        left behind is counted in the same statement. Returns rows updated.
+        """
+        messages = Message.objects.filter(conversation_id=conversation_id)
+        membership = self.filter(conversation_id=conversation_id, profile_id=profile_id)
+
+        if up_to is None:
+            cursor = Subquery(messages.order_by('-id').values('id')[:1])
+            unread = Value(0)
+            membership = membership.filter(unread_count__gt=0)
+        else:
+            cursor = Value(up_to)
+            newer = messages.filter(id__gt=up_to).exclude(sender_id=profile_id)
+            unread = Coalesce(Subquery(
+                newer.order_by().values('conversation').annotate(count=Count('id')).values('count')
+            ), 0)
+            membership = membership.filter(
+                Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=up_to)
+            )
+
+        return membership.update(last_read_message_id=cursor, unread_count=unread)
+
+
+class ConversationParticipant(models.Model):
+    """
+    A user's membership in a conversation, with their read state: the id of
+    the newest message they have read and how many messages from others
+    arrived after it.
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='memberships'
+    )
+    profile = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name='conversation_memberships'
+    )
+    last_read_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+
+    objects = ConversationParticipantQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'chat_service_conversation_participants'
+        unique_together = ('conversation', 'profile')
+
+    def __str__(self):
+        return f"{self.profile_id} in conversation {self.conversation_id}"
+
 
 class Message(models.Model):
     """A message within a conversation."""
+    # Server-assigned under CHAT_WRITE_BEHIND (see ids.py), so a message can
+    # be broadcast before it is stored; by the database otherwise.
+    id = models.BigAutoField(primary_key=True, default=default_message_id)
     conversation = models.ForeignKey(
         Conversation,
         on_delete=models.CASCADE,
@@ -33,12 +261,37 @@ class Message(models.Model):
         related_name='sent_messages'
     )
     content = models.TextField()
-    image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
+    image = VariantImageField(upload_to='chat_images/', variants_field='image_variants', blank=True, null=True)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Position in the conversation, 1-based; assigned when stored (see sequence.py).
+    seq = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Message history pages and delta sync are range scans on this.
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ]
+        constraints = [
+            # One message per seq; socket resume replays seq ranges on its index.
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='message_conversation_seq_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username}: {self.content[:30]}"
+
+    def save(self, *args, **kwargs):
+        if self.seq is not None:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            last_seqs = reserve_seqs([self])
+            super().save(*args, **kwargs)
+            Conversation.objects.filter(pk=self.conversation_id).update(last_seq=last_seqs[self.conversation_id])
+
+    def is_read_by_recipient(self, cursors):
+        """True once any participant other than the sender has read up to this message."""
+        return any(
+            profile_id != self.sender_id and cursor is not None and cursor >= self.id
+            for profile_id, cursor in cursors.items()
+        )
@@ -0,0 +1,86 @@
+from django.db.models import OuterRef, Q, Subquery
+from rest_framework.exceptions import ValidationError
+
+from post_service.pagination import KeysetPagination
+from .models import Message
+
+
+class InboxPagination(KeysetPagination):
+    """Conversations by last activity, most recent first."""
+
+    position_field = "updated_at"
+
+
+class MessagePagination(KeysetPagination):
+    """
+    Message history for one conversation, in two modes:
+
+        history  pages backwards from the newest message; "next_cursor"
+                 fetches the next older page
+        delta    `since=<message_id>` returns the messages sent after that
+                 one, for a reconnecting client to catch up; while
+                 "has_more" is true, call again with the last returned id
+
+    Both are keyset range scans on (conversation, created_at, id). Each page
+    is returned oldest-first, the order the client renders it in.
+    """
+
+    def get_since(self, request):
+        since = request.query_params.get("since")
+        if since is None:
+            return None
+        try:
+            return int(since)
+        except ValueError:
+            raise ValidationError({"since": "Must be a message id."})
+
+    def page_queryset(self, queryset, request):
+        self.since = self.get_since(request)
+        if self.since is None:
+            return super().page_queryset(queryset, request)
+
+        self.page_size = self.get_page_size(request)
+
+        # Position of the `since` message, resolved inside the same query.
+        since_created_at = Subquery(
+            Message.objects.filter(pk=self.since, conversation=OuterRef("conversation")).values("created_at")[:1]
+        )
+        queryset = queryset.filter(
+            Q(created_at__gt=since_created_at) | Q(created_at=since_created_at, id__gt=self.since)
+        )
+        return queryset.order_by("created_at", "id")[: self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request):
+        page = super().paginate_queryset(queryset, request)
+        # An empty delta page means either "up to date" or a `since` that is
+        # not a message of this conversation (the subquery was NULL); only
+        # then is the message looked up, so a stale id is a 400, not silence.
+        if self.since is not None and not page and not queryset.filter(pk=self.since).exists():
+            raise self.unknown_since()
+        return page
+
+    async def apaginate_queryset(self, queryset, request):
+        page = await super().apaginate_queryset(queryset, request)
+        if self.since is not None and not page and not await queryset.filter(pk=self.since).aexists():
+            raise self.unknown_since()
+        return page
+
+    def unknown_since(self):
+        return ValidationError({"since": "No such message in this conversation."})
+
+    def paginate_rows(self, rows, key):
+        super().paginate_rows(rows, key)
+        if self.since is None:
+            self.page.reverse()
+        return self.page
+
+    def get_next_cursor(self):
+        if self.since is not None:
+            return None
+        return super().get_next_cursor()
+
+    def get_paginated_data(self, data):
+        return {
+            **super().get_paginated_data(data),
+            "has_more": self.has_next,
+        }
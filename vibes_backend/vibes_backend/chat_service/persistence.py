@@ -0,0 +1,169 @@
+"""
+Write-behind persistence for chat messages (CHAT_WRITE_BEHIND = True).
+
+ChatConsumer gives a message its id up front (see ids.py), queues it on the
+MESSAGE_WRITER_CHANNEL and broadcasts it straight away; delivery no longer
+waits on the database. The MessageWriter worker drains the queue in
+batches, storing each batch with one INSERT and two UPDATEs (participants'
+read state, conversation timestamps coalesced per conversation), and then
+acks every sender:
+
+    python manage.py runworker chat-persist
+
+Crash safety: a message is queued before it is broadcast, so a web process
+dying never loses a message that someone has seen. Queued messages live in
+Redis until the worker takes them (channel_capacity caps the queue; when
+it is full the consumer writes inline instead). Once taken, a message sits
+in the worker's memory for at most CHAT_WRITE_BEHIND_FLUSH_INTERVAL
+seconds or CHAT_WRITE_BEHIND_BATCH_SIZE messages, which bounds what a
+worker crash can lose. Clients treat a message without a "message_ack" as
+unsent and may retry it.
+
+Failed writes: a batch that hits a transient database error (connection
+lost, lock timeout) is retried after the flush interval, at most
+CHAT_WRITE_BEHIND_MAX_RETRIES times. Any other error is a bad row (say its
+conversation or sender was deleted meanwhile): the batch is split in halves
+until the rows that fail are isolated, the rest are stored and acked, and
+each bad row is logged and its sender gets a "message_failed". Messages
+that run out of retries are dropped the same way, so one bad message never
+holds up the ones queued behind it.
+"""
+import asyncio
+import logging
+
+from channels.consumer import AsyncConsumer
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+from django.utils.dateparse import parse_datetime
+
+from vibes_backend.images import variant_urls
+from vibes_backend.media import media_url
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_WRITER_CHANNEL = "chat-persist"
+
+# Errors worth retrying the same rows for; anything else is the rows' fault.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+def message_payload(message):
+    """The broadcast form of a message (MessageSerializer's fields), saved or not."""
+    sender = message.sender
+    return {
+        "id": message.id,
+        "conversation": message.conversation_id,
+        "sender_id": message.sender_id,
+        "sender_username": sender.username,
+        "sender_fullname": sender.fullname,
+        "sender_profile_picture": media_url(sender.profile_picture),
+        "content": message.content,
+        "image": media_url(message.image),
+        "image_variants": variant_urls(message.image, message.image_variants),
+        "created_at": message.created_at.isoformat(),
+        "is_read": False,
+        "seq": message.seq,
+    }
+
+
+def store_payloads(payloads):
+    """Store a batch of queued message payloads."""
+    Conversation.objects.store_messages([
+        Message(
+            id=payload["id"],
+            conversation_id=payload["conversation"],
+            sender_id=payload["sender_id"],
+            content=payload["content"],
+            created_at=parse_datetime(payload["created_at"]),
+        )
+        for payload in payloads
+    ])
+
+
+def store_events(events):
+    """
+    Store a batch of queued "chat.persist" events, splitting it around rows
+    that can't be stored. Returns (stored, failed, retry) lists of events:
+    failed rows are permanent errors, retry ones hit a transient error.
+    """
+    try:
+        store_payloads([event["message"] for event in events])
+        return events, [], []
+    except TRANSIENT_ERRORS as e:
+        logger.warning(f"Failed to store {len(events)} chat messages, will retry: {e}")
+        return [], [], events
+    except Exception as e:
+        if len(events) == 1:
+            logger.error(f"Dropping chat message that can't be stored: {e}; {events[0]['message']!r}")
+            return [], events, []
+    middle = len(events) // 2
+    first, second = store_events(events[:middle]), store_events(events[middle:])
+    return tuple(a + b for a, b in zip(first, second))
+
+
+def ack_event(event):
+    return {
+        "type": "chat.persisted",
+        "id": event["message"]["id"],
+        "client_id": event.get("client_id"),
+    }
+
+
+def failure_event(event):
+    return {
+        "type": "chat.persist_failed",
+        "id": event["message"]["id"],
+        "client_id": event.get("client_id"),
+    }
+
+
+class MessageWriter(AsyncConsumer):
+    """
+    Worker on MESSAGE_WRITER_CHANNEL. Buffers "chat.persist" events
+    ({"message": payload, "reply_channel": ..., "client_id": ...}) and
+    flushes when the batch is full or the flush interval has passed.
+    Events being retried keep their attempt count in event["attempts"].
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = []
+        self.flush_timer = None
+
+    async def chat_persist(self, event):
+        self.pending.append(event)
+        if len(self.pending) >= settings.CHAT_WRITE_BEHIND_BATCH_SIZE:
+            await self.flush()
+        elif self.flush_timer is None:
+            self.flush_timer = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL)
+        self.flush_timer = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        stored, failed, retry = await database_sync_to_async(store_events)(batch)
+
+        for event in retry:
+            event["attempts"] = event.get("attempts", 0) + 1
+            if event["attempts"] > settings.CHAT_WRITE_BEHIND_MAX_RETRIES:
+                logger.error(f"Dropping chat message after {event['attempts']} attempts: {event['message']!r}")
+                failed.append(event)
+        retry = [event for event in retry if event not in failed]
+        if retry:
+            # Ahead of anything queued meanwhile, so each conversation stays in order.
+            self.pending = retry + self.pending
+            if self.flush_timer is None:
+                self.flush_timer = asyncio.ensure_future(self.flush_later())
+
+        for events, reply in ((stored, ack_event), (failed, failure_event)):
+            for event in events:
+                if event.get("reply_channel"):
+                    await self.channel_layer.send(event["reply_channel"], reply(event))
@@ -1,6 +1,7 @@
 from django.urls import path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, LiveConsumer
 
 websocket_urlpatterns = [
     path("ws/chat/<int:conversation_id>/", ChatConsumer.as_asgi()),
+    path("ws/live/", LiveConsumer.as_asgi()),
 ]
@@ -0,0 +1,42 @@
+"""
+Per-conversation message sequence numbers: 1, 2, 3... in the order
+messages are stored. A client that remembers the last seq it saw can
+resume with exactly the messages it missed (see ChatSocketMixin.replay()),
+and a live frame that skips a number tells it something went missing.
+
+Seqs are issued by the database. Conversation.last_seq is the last one
+handed out; storing messages reads it with the conversation row locked
+(SELECT ... FOR UPDATE), numbers the new messages and writes it back in the
+same transaction. The lock is held until commit, so a conversation's
+messages commit one transaction at a time, in seq order: once seq N is
+visible every lower seq is too, and a replay never passes over a message
+that commits later. The (conversation, seq) unique constraint backs this
+up, and a rolled back write leaves no gap.
+
+With CHAT_WRITE_BEHIND a message is broadcast before it is stored, so its
+live frame has no seq yet ("seq": null); the MessageWriter numbers it when
+it stores the batch.
+"""
+
+
+def reserve_seqs(messages):
+    """
+    Number unsaved messages, possibly of many conversations, in list order
+    after each conversation's last_seq. Call inside the transaction that
+    stores them; the conversation rows stay locked until it ends. Returns
+    {conversation_id: new last_seq} to write back.
+    """
+    from .models import Conversation
+
+    conversation_ids = sorted({message.conversation_id for message in messages})
+    # Locked in id order, so two batches of the same conversations can't deadlock.
+    last_seqs = dict(
+        Conversation.objects.select_for_update()
+        .filter(pk__in=conversation_ids).order_by('pk').values_list('pk', 'last_seq')
+    )
+    for message in messages:
+        if message.conversation_id not in last_seqs:
+            raise Conversation.DoesNotExist(f"Conversation {message.conversation_id} does not exist.")
+        last_seqs[message.conversation_id] += 1
+        message.seq = last_seqs[message.conversation_id]
+    return last_seqs
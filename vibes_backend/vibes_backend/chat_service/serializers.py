@@ -1,4 +1,7 @@
 from rest_framework import serializers
+
+from vibes_backend.images import ImageVariantsField
+from vibes_backend.media import MediaImageField, MediaURLField
 from .models import Conversation, Message
 
 
@@ -6,35 +9,31 @@ class MessageSerializer(serializers.ModelSerializer):
     sender_id = serializers.IntegerField(source='sender.id', read_only=True)
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     sender_fullname = serializers.CharField(source='sender.fullname', read_only=True)
-    sender_profile_picture = serializers.SerializerMethodField()
+    sender_profile_picture = MediaURLField(source='sender.profile_picture')
+    image = MediaImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField('image')
+    is_read = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
         fields = [
             'id', 'conversation', 'sender_id', 'sender_username',
             'sender_fullname', 'sender_profile_picture', 'content',
-            'image', 'created_at', 'is_read'
+            'image', 'image_variants', 'created_at', 'is_read', 'seq'
         ]
-        read_only_fields = ['id', 'conversation', 'sender_id', 'created_at']
+        read_only_fields = ['id', 'conversation', 'sender_id', 'created_at', 'seq']
 
-    def get_sender_profile_picture(self, obj):
-        request = self.context.get('request')
-        if obj.sender.profile_picture and request:
-            return request.build_absolute_uri(obj.sender.profile_picture.url)
-        return None
+    def get_is_read(self, obj):
+        # {profile_id: last_read_message_id} of the conversation's participants
+        cursors = self.context.get('read_cursors')
+        return obj.is_read_by_recipient(cursors) if cursors else False
 
 
 class ParticipantSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     username = serializers.CharField()
     fullname = serializers.CharField()
-    profile_picture = serializers.SerializerMethodField()
-
-    def get_profile_picture(self, obj):
-        request = self.context.get('request')
-        if obj.profile_picture and request:
-            return request.build_absolute_uri(obj.profile_picture.url)
-        return None
+    profile_picture = MediaURLField()
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -58,18 +57,36 @@ class ConversationSerializer(serializers.ModelSerializer):
         return None
 
     def get_last_message(self, obj):
+        # Annotated by Conversation.objects.for_inbox()
+        if hasattr(obj, 'last_message_created_at'):
+            if obj.last_message_created_at is None:
+                return None
+            request = self.context.get('request')
+            own = request is not None and obj.last_message_sender_id == request.user.id
+            cursor = obj.other_read_cursor if own else obj.read_cursor
+            return {
+                'content': obj.last_message_content[:50],
+                'sender_id': obj.last_message_sender_id,
+                'created_at': obj.last_message_created_at,
+                'is_read': cursor is not None and cursor >= obj.last_message_id,
+            }
+
         last_msg = obj.messages.order_by('-created_at').first()
         if last_msg:
+            cursors = dict(obj.memberships.values_list('profile_id', 'last_read_message_id'))
             return {
                 'content': last_msg.content[:50],
-                'sender_id': last_msg.sender.id,
+                'sender_id': last_msg.sender_id,
                 'created_at': last_msg.created_at,
-                'is_read': last_msg.is_read,
+                'is_read': last_msg.is_read_by_recipient(cursors),
             }
         return None
 
     def get_unread_count(self, obj):
+        if hasattr(obj, 'unread'):
+            return obj.unread
         request = self.context.get('request')
         if request:
-            return obj.messages.filter(is_read=False).exclude(sender=request.user).count()
+            membership = obj.memberships.filter(profile=request.user).first()
+            return membership.unread_count if membership else 0
         return 0
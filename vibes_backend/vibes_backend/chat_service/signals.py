@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from auth_service.models import Profile
+from .membership import invalidate_members
+from .middleware import user_cache
+from .models import ConversationParticipant
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_socket_user(sender, instance, **kwargs):
+    # Deactivation and profile edits must reach new WebSocket handshakes.
+    user_cache.invalidate(instance.id)
+
+
+def invalidate_members_on_commit(*conversation_ids):
+    # Dropped before the commit, a set could be reloaded from the old rows
+    # by another process and cached again until it expires.
+    transaction.on_commit(lambda: invalidate_members(*conversation_ids))
+
+
+@receiver(post_save, sender=ConversationParticipant)
+@receiver(post_delete, sender=ConversationParticipant)
+def invalidate_members_on_membership_change(sender, instance, **kwargs):
+    # Read-state updates go through queryset.update() and don't fire this.
+    invalidate_members_on_commit(instance.conversation_id)
+
+
+@receiver(m2m_changed, sender=ConversationParticipant)
+def invalidate_members_on_participants_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_members_on_commit(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        # profile.conversations.add(...): pk_set holds conversation ids
+        invalidate_members_on_commit(*pk_set)
+    elif action == 'pre_clear':
+        invalidate_members_on_commit(*instance.conversations.values_list('pk', flat=True))
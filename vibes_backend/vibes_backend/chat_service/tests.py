@@ -0,0 +1,1334 @@
+import asyncio
+import json
+import threading
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from channels.testing import ApplicationCommunicator, WebsocketCommunicator
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auth_service.models import Profile
+from post_service.consumers import PostsConsumer
+from post_service.events import user_group
+from vibes_backend import metrics
+from vibes_backend.outbox import EVICTED_CLOSE_CODE, make_resume_token, read_resume_token
+from vibes_backend.testing import TEST_SETTINGS, image_upload, make_user
+from .consumers import ChatConsumer, LiveConsumer
+from .membership import is_member
+from .middleware import TOKEN_SUBPROTOCOL, JWTAuthMiddleware, user_cache
+from .models import Conversation, ConversationParticipant, Message
+from .events import broadcast_chat_event
+from .ids import MAX_NODE, SEQUENCE_BITS, check_node_id
+from .persistence import MESSAGE_WRITER_CHANNEL, MessageWriter, message_payload
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageViewTests(APITestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.client.force_authenticate(self.alice)
+
+        self.layer = get_channel_layer()
+        self.socket = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"chat_{self.conversation.id}", self.socket)
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def messages_url(self, conversation=None):
+        return f"/chat/conversations/{(conversation or self.conversation).id}/messages/"
+
+    @override_settings(
+        STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+        MEDIA_URL="/media/",
+        IMAGE_VARIANTS={"thumb": 32},
+        IMAGE_VARIANTS_ASYNC=False,
+    )
+    def test_image_message_gets_variants(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        photo = image_upload(size=(64, 48), color=(0, 0, 0))
+
+        # Messages are stored with bulk_create; the upload is still picked up.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.messages_url(), {"image": photo}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = Message.objects.get(id=response.json()["id"])
+        self.assertEqual(message.image_variants["variants"]["thumb"]["height"], 24)
+        self.assertEqual(
+            message_payload(message)["image_variants"]["variants"]["thumb"]["webp"],
+            f"/media/{message.image_variants['variants']['thumb']['webp']}",
+        )
+
+    @override_settings(
+        STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+        MEDIA_URL="/media/",
+        IMAGE_VARIANTS={"thumb": 32},
+        IMAGE_VARIANTS_ASYNC=False,
+    )
+    def test_image_message_from_a_direct_upload(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        slot = self.client.post(
+            "/api/uploads/", {"kind": "message", "content_type": "image/png", "size": 100}, format="json"
+        ).json()
+        upload = image_upload("a.png", size=(8, 8), color=(0, 0, 0), image_format="PNG")
+        self.client.post(slot["upload"]["url"], {"file": upload})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.messages_url(), {"image_upload": slot["token"]}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        message = Message.objects.get(id=response.json()["id"])
+        self.assertTrue(message.image.name.startswith("chat_images/"))
+        self.assertEqual(message.image_variants["source"], message.image.name)
+        event = async_to_sync(self.layer.receive)(self.socket)
+        self.assertEqual(event["message"]["image"], f"http://testserver/media/{message.image.name}")
+
+    def test_send_message_persists_and_broadcasts(self):
+        response = self.client.post(self.messages_url(), {"content": "hi bob"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["content"], "hi bob")
+        self.assertTrue(Message.objects.filter(conversation=self.conversation, sender=self.alice).exists())
+
+        event = async_to_sync(self.layer.receive)(self.socket)
+        self.assertEqual(event["type"], "chat_message")
+        self.assertEqual(event["message"]["id"], response.json()["id"])
+
+    def test_empty_message_is_rejected(self):
+        response = self.client.post(self.messages_url(), {"content": "  "}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_non_participant_gets_404(self):
+        self.client.force_authenticate(make_user("eve"))
+        response = self.client.get(self.messages_url())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_mark_read_broadcasts_receipt(self):
+        self.conversation.post_message(self.bob, "ping")
+
+        response = self.client.post(f"/chat/conversations/{self.conversation.id}/read/")
+
+        self.assertEqual(response.json(), {"marked_read": 1})
+        event = async_to_sync(self.layer.receive)(self.socket)
+        text = event.pop("text")
+        self.assertEqual(event, {
+            "type": "chat_messages_read", "reader_id": self.alice.id, "conversation_id": self.conversation.id,
+        })
+        # The frame sockets forward as-is, encoded once by the sender.
+        self.assertEqual(json.loads(text), {
+            "type": "messages_read", "conversation_id": self.conversation.id, "reader_id": self.alice.id,
+        })
+
+    @override_settings(CHAT_MEMBERSHIP_CACHE="default")
+    def test_mark_read_is_a_single_row_update(self):
+        for i in range(20):
+            self.conversation.post_message(self.bob, f"ping {i}")
+        is_member(self.conversation.id, self.alice.id)  # warm the membership cache
+
+        # Membership lookup, cursor update.
+        with self.assertNumQueries(2):
+            response = self.client.post(f"/chat/conversations/{self.conversation.id}/read/")
+
+        self.assertEqual(response.json(), {"marked_read": 20})
+        membership = ConversationParticipant.objects.get(conversation=self.conversation, profile=self.alice)
+        self.assertEqual(membership.unread_count, 0)
+        self.assertEqual(membership.last_read_message_id, self.conversation.messages.latest("id").id)
+
+
+@override_settings(**TEST_SETTINGS)
+class MessageHistoryTests(APITestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.messages = [
+            self.conversation.post_message(self.bob, f"m{i}")
+            for i in range(5)
+        ]
+        self.client.force_authenticate(self.alice)
+        self.url = f"/chat/conversations/{self.conversation.id}/messages/"
+
+    def contents(self, response):
+        return [m["content"] for m in response.json()["results"]]
+
+    def test_pages_backwards_from_newest(self):
+        first = self.client.get(self.url, {"page_size": 2})
+        self.assertEqual(self.contents(first), ["m3", "m4"])
+        self.assertTrue(first.json()["has_more"])
+
+        second = self.client.get(self.url, {"page_size": 2, "cursor": first.json()["next_cursor"]})
+        self.assertEqual(self.contents(second), ["m1", "m2"])
+
+        last = self.client.get(self.url, {"page_size": 2, "cursor": second.json()["next_cursor"]})
+        self.assertEqual(self.contents(last), ["m0"])
+        self.assertIsNone(last.json()["next_cursor"])
+
+    def test_since_returns_only_newer_messages(self):
+        response = self.client.get(self.url, {"since": self.messages[1].id, "page_size": 2})
+        self.assertEqual(self.contents(response), ["m2", "m3"])
+        self.assertTrue(response.json()["has_more"])
+
+        response = self.client.get(self.url, {"since": self.messages[3].id})
+        self.assertEqual(self.contents(response), ["m4"])
+        self.assertFalse(response.json()["has_more"])
+
+    def test_only_returned_window_is_marked_read(self):
+        membership = ConversationParticipant.objects.get(conversation=self.conversation, profile=self.alice)
+        self.assertEqual(membership.unread_count, 5)
+
+        # Reading m1..m2 moves the cursor to m2 and leaves m3, m4 unread.
+        response = self.client.get(self.url, {"page_size": 2, "since": self.messages[0].id})
+        self.assertTrue(all(m["is_read"] for m in response.json()["results"]))
+
+        membership.refresh_from_db()
+        self.assertEqual(membership.last_read_message_id, self.messages[2].id)
+        self.assertEqual(membership.unread_count, 2)
+
+        self.client.get(self.url, {"page_size": 2})
+        membership.refresh_from_db()
+        self.assertEqual(membership.last_read_message_id, self.messages[4].id)
+        self.assertEqual(membership.unread_count, 0)
+
+    def test_page_query_count_is_constant(self):
+        # Participant check, page, mark-as-read update.
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"page_size": 5})
+
+    def test_invalid_since_is_rejected(self):
+        response = self.client.get(self.url, {"since": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_since_from_another_conversation_is_rejected(self):
+        other = Conversation.objects.create()
+        other.participants.add(self.alice, self.bob)
+        foreign = other.post_message(self.bob, "elsewhere")
+
+        response = self.client.get(self.url, {"since": foreign.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Up to date is still an empty page, not an error.
+        response = self.client.get(self.url, {"since": self.messages[-1].id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.contents(response), [])
+
+
+@override_settings(**TEST_SETTINGS)
+class InboxTests(APITestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.client.force_authenticate(self.alice)
+
+    def start_conversation(self, other):
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.alice, other)
+        return conversation
+
+    def test_inbox_shows_last_message_and_unread_count(self):
+        bob = make_user("bob")
+        conversation = self.start_conversation(bob)
+        conversation.post_message(bob, "first")
+        conversation.post_message(self.alice, "reply")  # replying reads what came before
+        conversation.post_message(bob, "second")
+        conversation.post_message(bob, "third")
+
+        [entry] = self.client.get("/chat/conversations/").json()["results"]
+
+        self.assertEqual(entry["other_participant"]["username"], "bob")
+        self.assertEqual(entry["last_message"]["content"], "third")
+        self.assertEqual(entry["last_message"]["sender_id"], bob.id)
+        self.assertFalse(entry["last_message"]["is_read"])
+        self.assertEqual(entry["unread_count"], 2)
+
+        self.client.post(f"/chat/conversations/{conversation.id}/read/")
+
+        [entry] = self.client.get("/chat/conversations/").json()["results"]
+        self.assertTrue(entry["last_message"]["is_read"])
+        self.assertEqual(entry["unread_count"], 0)
+
+    def test_inbox_query_count_is_constant(self):
+        for i in range(10):
+            other = make_user(f"user{i}")
+            conversation = self.start_conversation(other)
+            conversation.post_message(other, "hi")
+
+        # Conversations with annotations, other participants.
+        with self.assertNumQueries(2):
+            response = self.client.get("/chat/conversations/", {"page_size": 10})
+        self.assertEqual(len(response.json()["results"]), 10)
+
+    def test_inbox_pages_by_recent_activity(self):
+        conversations = [self.start_conversation(make_user(f"user{i}")) for i in range(3)]
+        conversations[0].save()  # most recently active
+
+        first = self.client.get("/chat/conversations/", {"page_size": 2}).json()
+        self.assertEqual(
+            [c["id"] for c in first["results"]], [conversations[0].id, conversations[2].id]
+        )
+
+        second = self.client.get(
+            "/chat/conversations/", {"page_size": 2, "cursor": first["next_cursor"]}
+        ).json()
+        self.assertEqual([c["id"] for c in second["results"]], [conversations[1].id])
+        self.assertIsNone(second["next_cursor"])
+
+
+@override_settings(**TEST_SETTINGS)
+class ConversationCreateOrGetTests(APITestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+
+    def create(self, user, other):
+        self.client.force_authenticate(user)
+        return self.client.post("/chat/conversations/create/", {"user_id": other.id}, format="json")
+
+    def test_second_request_returns_existing_conversation(self):
+        first = self.create(self.alice, self.bob)
+        second = self.create(self.bob, self.alice)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.json()["id"], second.json()["id"])
+        self.assertEqual(
+            Conversation.objects.get().pair_key, f"{self.alice.id}:{self.bob.id}"
+        )
+
+    def test_lookup_is_a_single_query(self):
+        Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        with self.assertNumQueries(1):
+            _, created = Conversation.objects.get_or_create_direct(self.bob, self.alice)
+        self.assertFalse(created)
+
+
+@override_settings(**TEST_SETTINGS)
+class ConcurrentConversationCreateTests(TransactionTestCase):
+
+    def test_parallel_creates_make_one_conversation(self):
+        alice, bob = make_user("alice"), make_user("bob")
+        barrier = threading.Barrier(8)
+        responses = []
+
+        def create(user, other):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        response = client.post("/chat/conversations/create/", {"user_id": other.id}, format="json")
+                        break
+                    except OperationalError:
+                        # SQLite's shared-cache test database fails writers
+                        # with "table is locked" rather than making them wait.
+                        time.sleep(0.01)
+                responses.append((response.status_code, response.json()["id"]))
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=create, args=(alice, bob) if i % 2 else (bob, alice))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), 8)
+        self.assertTrue(all(code in (200, 201) for code, _ in responses))
+        conversation = Conversation.objects.get()
+        self.assertEqual({id for _, id in responses}, {conversation.id})
+        self.assertEqual(set(conversation.participants.all()), {alice, bob})
+
+
+@override_settings(**TEST_SETTINGS, WS_AUTH_CACHE_TTL=60, WS_AUTH_SHARED_CACHE="")
+class JWTAuthMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.alice = make_user("alice")
+        self.token = str(AccessToken.for_user(self.alice))
+        self.middleware = JWTAuthMiddleware(PostsConsumer.as_asgi())
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def resolve(self, token=None):
+        return async_to_sync(self.middleware.get_user_from_token)(token or self.token)
+
+    def test_repeat_handshakes_skip_the_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.resolve(), self.alice)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(), self.alice)
+
+    @override_settings(WS_AUTH_CACHE_TTL=0)
+    def test_zero_ttl_disables_the_cache(self):
+        self.resolve()
+        with self.assertNumQueries(1):
+            self.resolve()
+
+    def test_deactivation_invalidates_cached_user(self):
+        self.resolve()
+        self.alice.is_active = False
+        self.alice.save()
+
+        self.assertIsInstance(self.resolve(), AnonymousUser)
+
+    @override_settings(WS_AUTH_SHARED_CACHE="default")
+    def test_local_miss_falls_back_to_shared_cache(self):
+        self.resolve()
+        user_cache.clear()  # as in another process
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve().id, self.alice.id)
+
+    def test_invalid_token_is_anonymous(self):
+        self.assertIsInstance(self.resolve("not-a-jwt"), AnonymousUser)
+
+    def test_token_in_subprotocol_header(self):
+        async def handshake():
+            communicator = WebsocketCommunicator(
+                self.middleware, "/ws/posts/", subprotocols=[TOKEN_SUBPROTOCOL, self.token]
+            )
+            connected, subprotocol = await communicator.connect()
+            await communicator.disconnect()
+            return connected, subprotocol, communicator.scope["user"]
+
+        connected, subprotocol, user = async_to_sync(handshake)()
+
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, TOKEN_SUBPROTOCOL)
+        self.assertEqual(user, self.alice)
+
+
+@override_settings(**TEST_SETTINGS, CHAT_MEMBERSHIP_CACHE="default")
+class ChatConsumerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+
+    def connect(self, user):
+        """Connect and disconnect a socket; returns whether it was accepted."""
+        async def handshake():
+            communicator = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), f"/ws/chat/{self.conversation.id}/"
+            )
+            communicator.scope["user"] = user
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": self.conversation.id}}
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        return async_to_sync(handshake)()
+
+    def test_membership_is_cached_across_connects(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.connect(self.alice))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.connect(self.bob))
+
+    def test_non_participant_is_rejected(self):
+        self.assertFalse(self.connect(make_user("eve")))
+
+    def test_joining_invalidates_cached_membership(self):
+        eve = make_user("eve")
+        self.assertFalse(self.connect(eve))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(eve)
+
+        self.assertTrue(self.connect(eve))
+
+    def test_removal_is_applied_once_committed(self):
+        self.assertTrue(self.connect(self.bob))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.remove(self.bob)
+            # Still cached until the removal commits: a reload now would
+            # cache the old participants again.
+            self.assertTrue(is_member(self.conversation.id, self.bob.id))
+
+        self.assertFalse(self.connect(self.bob))
+
+    @override_settings(CHAT_MEMBERSHIP_CACHE="")
+    def test_without_a_cache_every_connect_checks_the_table(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.connect(self.alice))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.remove(self.bob)
+        with self.assertNumQueries(1):
+            self.assertFalse(self.connect(self.bob))
+
+    def test_sending_a_message_only_locks_the_conversation(self):
+        is_member(self.conversation.id, self.alice.id)  # warm the membership cache
+
+        async def chat():
+            communicator = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), f"/ws/chat/{self.conversation.id}/"
+            )
+            communicator.scope["user"] = self.alice
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": self.conversation.id}}
+            await communicator.connect()
+            await communicator.send_json_to({"type": "send_message", "content": "hi"})
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return event
+
+        with CaptureQueriesContext(connection) as queries:
+            event = async_to_sync(chat)()
+
+        self.assertEqual(event["message"]["content"], "hi")
+        statements = [
+            q["sql"].split()[0] for q in queries.captured_queries
+            if "SAVEPOINT" not in q["sql"]
+        ]
+        # Seq counter read (row locked), message INSERT, unread counters
+        # UPDATE, conversation timestamp and seq counter UPDATE.
+        self.assertEqual(statements, ["SELECT", "INSERT", "UPDATE", "UPDATE"])
+
+    @override_settings(CHAT_WRITE_BEHIND=True, CHAT_WRITE_BEHIND_FLUSH_INTERVAL=0.01, CHAT_NODE_ID="0")
+    def test_write_behind_broadcasts_before_storing(self):
+        is_member(self.conversation.id, self.alice.id)
+
+        async def chat():
+            communicator = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), f"/ws/chat/{self.conversation.id}/"
+            )
+            communicator.scope["user"] = self.alice
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": self.conversation.id}}
+            await communicator.connect()
+            await communicator.send_json_to({"type": "send_message", "content": "hi", "client_id": "c1"})
+            broadcast = await communicator.receive_json_from()
+            stored_before_flush = await Message.objects.filter(id=broadcast["message"]["id"]).aexists()
+
+            # Play the worker: hand it the queued event and wait for the ack.
+            queued = await get_channel_layer().receive(MESSAGE_WRITER_CHANNEL)
+            writer = ApplicationCommunicator(
+                MessageWriter.as_asgi(), {"type": "channel", "channel": MESSAGE_WRITER_CHANNEL}
+            )
+            await writer.send_input(queued)
+            ack = await communicator.receive_json_from(timeout=5)
+            writer.stop()
+            await communicator.disconnect()
+            return broadcast, stored_before_flush, ack
+
+        broadcast, stored_before_flush, ack = async_to_sync(chat)()
+
+        self.assertFalse(stored_before_flush)
+        # Numbered once stored.
+        self.assertIsNone(broadcast["message"]["seq"])
+        self.assertEqual(ack, {"type": "message_ack", "id": broadcast["message"]["id"], "client_id": "c1"})
+        message = Message.objects.get(id=ack["id"])
+        self.assertEqual((message.content, message.seq), ("hi", 1))
+        self.assertEqual(message.created_at.isoformat(), broadcast["message"]["created_at"])
+        bob = ConversationParticipant.objects.get(conversation=self.conversation, profile=self.bob)
+        self.assertEqual(bob.unread_count, 1)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.updated_at, message.created_at)
+
+    def typing_scenario(self, frames, settle=0.0):
+        """Alice sends typing frames; returns what Bob's socket receives."""
+        async def chat():
+            sockets = []
+            for user in (self.alice, self.bob):
+                communicator = WebsocketCommunicator(
+                    ChatConsumer.as_asgi(), f"/ws/chat/{self.conversation.id}/"
+                )
+                communicator.scope["user"] = user
+                communicator.scope["url_route"] = {"kwargs": {"conversation_id": self.conversation.id}}
+                await communicator.connect()
+                sockets.append(communicator)
+            alice, bob = sockets
+
+            for is_typing in frames:
+                await alice.send_json_to({"type": "typing", "is_typing": is_typing})
+            await asyncio.sleep(settle)
+            received = []
+            while not await bob.receive_nothing(timeout=0.1):
+                received.append(await bob.receive_json_from())
+            for communicator in sockets:
+                await communicator.disconnect()
+            return received
+
+        return async_to_sync(chat)()
+
+    def test_repeated_typing_frames_are_forwarded_once(self):
+        metrics.reset()
+
+        received = self.typing_scenario([True] * 10)
+
+        self.assertEqual(received, [{
+            "type": "typing", "conversation_id": self.conversation.id, "user_id": self.alice.id, "is_typing": True,
+        }])
+        counts = metrics.snapshot()
+        self.assertEqual(counts["typing_frames_received"], 10)
+        # The typing frame, and stopping it when Alice disconnects.
+        self.assertEqual(counts["typing_frames_forwarded"], 2)
+
+    def test_only_state_changes_are_forwarded(self):
+        received = self.typing_scenario([True, True, False, False, True])
+
+        self.assertEqual([event["is_typing"] for event in received], [True, False, True])
+
+    @override_settings(CHAT_TYPING_KEEPALIVE=0)
+    def test_keepalive_is_forwarded_while_typing(self):
+        received = self.typing_scenario([True, True, True])
+
+        self.assertEqual([event["is_typing"] for event in received], [True, True, True])
+
+    @override_settings(CHAT_TYPING_TIMEOUT=0.05)
+    def test_typing_expires_without_frames(self):
+        received = self.typing_scenario([True], settle=0.2)
+
+        self.assertEqual([event["is_typing"] for event in received], [True, False])
+
+
+@override_settings(**TEST_SETTINGS)
+class LiveConsumerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.carol = make_user("carol")
+        self.with_bob, _ = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        self.with_carol, _ = Conversation.objects.get_or_create_direct(self.alice, self.carol)
+
+    async def open(self, user, consumer=LiveConsumer, path="/ws/live/"):
+        communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        return communicator if connected else None
+
+    async def drain(self, communicator):
+        received = []
+        while not await communicator.receive_nothing(timeout=0.1):
+            received.append(await communicator.receive_json_from())
+        return received
+
+    def test_anonymous_is_rejected(self):
+        self.assertIsNone(async_to_sync(self.open)(AnonymousUser()))
+
+    def test_one_socket_carries_every_conversation(self):
+        async def chat():
+            alice, bob, carol = [await self.open(user) for user in (self.alice, self.bob, self.carol)]
+            await bob.send_json_to({"type": "send_message", "conversation_id": self.with_bob.id, "content": "hi"})
+            await carol.send_json_to({"type": "typing", "conversation_id": self.with_carol.id, "is_typing": True})
+            await carol.send_json_to({"type": "mark_read", "conversation_id": self.with_carol.id})
+            received = await self.drain(alice), await self.drain(bob), await self.drain(carol)
+            for communicator in (alice, bob, carol):
+                await communicator.disconnect()
+            return received
+
+        alice, bob, carol = async_to_sync(chat)()
+
+        self.assertCountEqual(
+            [(event["type"], event.get("conversation_id")) for event in alice],
+            [("new_message", None), ("typing", self.with_carol.id), ("messages_read", self.with_carol.id)],
+        )
+        new_message = next(event for event in alice if event["type"] == "new_message")
+        self.assertEqual(new_message["message"]["conversation"], self.with_bob.id)
+        # The sender's own sockets get the message too; nothing else reaches them.
+        self.assertEqual([event["type"] for event in bob], ["new_message"])
+        self.assertEqual(carol, [])
+
+    def test_frames_for_other_conversations_are_refused(self):
+        async def chat():
+            bob = await self.open(self.bob)
+            await bob.send_json_to({"type": "send_message", "conversation_id": self.with_carol.id, "content": "hi"})
+            event = await bob.receive_json_from()
+            await bob.disconnect()
+            return event
+
+        event = async_to_sync(chat)()
+
+        self.assertEqual(event["type"], "error")
+        self.assertFalse(Message.objects.exists())
+
+    def test_non_object_frames_get_an_error(self):
+        async def chat():
+            bob = await self.open(self.bob)
+            await bob.send_json_to([1])
+            event = await bob.receive_json_from()
+            await bob.send_json_to({"type": "subscribe", "post_ids": [1]})
+            subscribed = await bob.receive_json_from()
+            await bob.disconnect()
+            return event, subscribed
+
+        event, subscribed = async_to_sync(chat)()
+
+        self.assertEqual(event["type"], "error")
+        self.assertEqual(subscribed, {"type": "subscriptions", "post_ids": [1]})
+
+    def test_feed_subscriptions(self):
+        async def subscribe():
+            alice = await self.open(self.alice)
+            await alice.send_json_to({"type": "subscribe", "post_ids": [3, 1]})
+            event = await alice.receive_json_from()
+            await alice.disconnect()
+            return event
+
+        self.assertEqual(async_to_sync(subscribe)(), {"type": "subscriptions", "post_ids": [1, 3]})
+
+    def test_feed_only_socket_ignores_chat_events(self):
+        async def chat():
+            posts = await self.open(self.alice, PostsConsumer, "/ws/posts/")
+            bob = await self.open(self.bob)
+            await bob.send_json_to({"type": "send_message", "conversation_id": self.with_bob.id, "content": "hi"})
+            received = await self.drain(posts)
+            await posts.send_json_to({"type": "subscribe", "post_ids": [1]})
+            still_alive = await posts.receive_json_from()
+            await bob.disconnect()
+            await posts.disconnect()
+            return received, still_alive
+
+        received, still_alive = async_to_sync(chat)()
+
+        self.assertEqual(received, [])
+        self.assertEqual(still_alive["type"], "subscriptions")
+
+
+
+class StalledClient:
+    """
+    Runs a consumer with a client that stops reading: while `reading` is
+    clear, every websocket.send blocks, like a write to a full socket.
+    """
+
+    def __init__(self, consumer, path, user):
+        self.app = consumer.as_asgi()
+        self.scope = {
+            "type": "websocket", "path": path, "user": user, "url_route": {"kwargs": {}},
+            "headers": [], "query_string": b"", "subprotocols": [],
+        }
+        self.inbound = asyncio.Queue()
+        self.sent = []
+        self.reading = asyncio.Event()
+        self.reading.set()
+
+    async def send(self, message):
+        if message["type"] == "websocket.send":
+            await self.reading.wait()
+        self.sent.append(message)
+
+    async def connect(self):
+        self.task = asyncio.ensure_future(self.app(self.scope, self.inbound.get, self.send))
+        await self.inbound.put({"type": "websocket.connect"})
+        while not self.sent:
+            await asyncio.sleep(0.01)
+
+    async def disconnect(self):
+        await self.inbound.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 1)
+
+    def frames(self):
+        return [json.loads(m["text"]) for m in self.sent if m["type"] == "websocket.send"]
+
+    def close_message(self):
+        return next((m for m in self.sent if m["type"] == "websocket.close"), None)
+
+
+@override_settings(**TEST_SETTINGS, WS_FEED_QUEUE_SIZE=3, WS_SEND_QUEUE_LIMIT=5)
+class BackpressureTests(TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.alice = make_user("alice")
+
+    async def publish(self, *events):
+        layer = get_channel_layer()
+        for event in events:
+            await layer.group_send(user_group(self.alice.id), event)
+        await asyncio.sleep(0.1)  # let the consumer take them off the channel
+
+    def feed_event(self, n):
+        return {"type": "post_update", "text": json.dumps({"type": "post_update", "n": n})}
+
+    def chat_event(self, seq, conversation_id=1):
+        message = {"id": 1000 + seq, "conversation": conversation_id, "seq": seq}
+        return {
+            "type": "chat_message",
+            "conversation_id": conversation_id,
+            "message": message,
+            "text": json.dumps({"type": "new_message", "message": message}),
+        }
+
+    def test_stalled_client_loses_only_older_feed_updates(self):
+        async def scenario():
+            client = StalledClient(LiveConsumer, "/ws/live/", self.alice)
+            await client.connect()
+            client.reading.clear()
+            await self.publish(*(self.feed_event(n) for n in range(20)))
+            client.reading.set()
+            await asyncio.sleep(0.1)
+            await client.disconnect()
+            return client
+
+        client = async_to_sync(scenario)()
+
+        # The update being written when the client stalled, then the newest three.
+        self.assertEqual([frame["n"] for frame in client.frames()], [0, 17, 18, 19])
+        self.assertIsNone(client.close_message())
+        self.assertEqual(metrics.snapshot()["ws_frames_dropped"], 16)
+
+    async def evict(self, *written):
+        """Stall a live socket after `written` chat events and overflow its queue."""
+        client = StalledClient(LiveConsumer, "/ws/live/", self.alice)
+        await client.connect()
+        await self.publish(*written)
+        client.reading.clear()
+        # One write in flight, five queued, the seventh is one too many.
+        await self.publish(*(self.chat_event(101 + i) for i in range(7)))
+        client.reading.set()
+        await asyncio.sleep(0.05)
+        await client.disconnect()
+        return client
+
+    def test_stalled_client_is_evicted_with_a_resume_token(self):
+        client = async_to_sync(self.evict)(self.chat_event(100), self.chat_event(7, conversation_id=2))
+
+        self.assertEqual(client.close_message()["code"], EVICTED_CLOSE_CODE)
+        evicted = client.frames()[-1]
+        self.assertEqual(evicted["type"], "evicted")
+        # What was written before the stall, per conversation.
+        self.assertEqual(read_resume_token(evicted["resume"]), (self.alice.id, {1: 100, 2: 7}))
+        self.assertEqual(metrics.snapshot()["ws_slow_consumers_evicted"], 1)
+        self.assertNotIn("ws_frames_dropped", metrics.snapshot())
+
+    def test_resume_token_of_many_conversations_arrives_whole(self):
+        written = [self.chat_event(100 + n, conversation_id=n) for n in range(1, 21)]
+
+        client = async_to_sync(self.evict)(*written)
+
+        token = client.frames()[-1]["resume"]
+        # Longer than a close reason may be.
+        self.assertGreater(len(token.encode()), 123)
+        self.assertEqual(read_resume_token(token), (self.alice.id, {n: 100 + n for n in range(1, 21)}))
+
+    @mock.patch("vibes_backend.outbox.EVICTED_FRAME_TIMEOUT", 0.05)
+    def test_client_that_never_reads_is_closed_without_the_token(self):
+        async def scenario():
+            client = StalledClient(LiveConsumer, "/ws/live/", self.alice)
+            await client.connect()
+            client.reading.clear()
+            await self.publish(*(self.chat_event(101 + i) for i in range(7)))
+            await client.disconnect()
+            return client
+
+        client = async_to_sync(scenario)()
+
+        self.assertEqual(client.close_message()["code"], EVICTED_CLOSE_CODE)
+        self.assertEqual(client.frames(), [])
+
+
+@override_settings(**TEST_SETTINGS)
+class ResumeTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        self.messages = [self.conversation.post_message(self.bob, str(i)) for i in range(1, 6)]
+
+    async def resume(self, query, consumer=ChatConsumer, path=None):
+        """Connect with a last_seq handshake; returns the open communicator and what it got."""
+        path = path or f"/ws/chat/{self.conversation.id}/"
+        communicator = WebsocketCommunicator(consumer.as_asgi(), f"{path}?{query}")
+        communicator.scope["user"] = self.alice
+        communicator.scope["url_route"] = {"kwargs": {"conversation_id": self.conversation.id}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        received = []
+        while not await communicator.receive_nothing(timeout=0.1):
+            received.append(await communicator.receive_json_from())
+        return communicator, received
+
+    def test_replays_only_the_missed_messages(self):
+        async def reconnect():
+            communicator, received = await self.resume("last_seq=2")
+            await communicator.disconnect()
+            return received
+
+        with self.assertNumQueries(2):  # membership, then one range query for the replay
+            received = async_to_sync(reconnect)()
+
+        self.assertEqual(
+            [(frame["type"], frame["message"]["seq"]) for frame in received[:-1]],
+            [("new_message", 3), ("new_message", 4), ("new_message", 5)],
+        )
+        self.assertEqual(received[-1], {"type": "resumed", "conversation_id": self.conversation.id, "last_seq": 5})
+        self.assertEqual(received[0]["message"], message_payload(self.messages[2]))
+
+    def test_live_copies_of_replayed_messages_are_skipped(self):
+        async def reconnect():
+            communicator, replayed = await self.resume("last_seq=3")
+            # Stored and broadcast while the replay ran: already sent once.
+            broadcast = database_sync_to_async(broadcast_chat_event)
+            await broadcast(self.conversation.id, {
+                "type": "chat_message", "message": message_payload(self.messages[4]),
+            })
+            newer = await database_sync_to_async(self.conversation.post_message)(self.bob, "6")
+            await broadcast(self.conversation.id, {"type": "chat_message", "message": message_payload(newer)})
+            live = await communicator.receive_json_from()
+            nothing_else = await communicator.receive_nothing(timeout=0.1)
+            await communicator.disconnect()
+            return replayed, live, nothing_else
+
+        replayed, live, nothing_else = async_to_sync(reconnect)()
+
+        self.assertEqual([frame.get("message", {}).get("seq") for frame in replayed], [4, 5, None])
+        self.assertEqual(live["message"]["seq"], 6)
+        self.assertTrue(nothing_else)
+
+    def test_resume_token_replays_what_the_evicted_socket_missed(self):
+        token = make_resume_token(self.alice.id, {self.conversation.id: 3})
+        stolen = make_resume_token(self.bob.id, {self.conversation.id: 0})
+
+        async def reconnect(query):
+            communicator, received = await self.resume(query, consumer=LiveConsumer, path="/ws/live/")
+            await communicator.disconnect()
+            return [frame.get("message", {}).get("seq") for frame in received]
+
+        self.assertEqual(async_to_sync(reconnect)(f"resume={token}"), [4, 5, None])
+        # An explicit last_seq wins over the token.
+        self.assertEqual(async_to_sync(reconnect)(f"resume={token}&last_seq={self.conversation.id}:4"), [5, None])
+        # Someone else's token, or a tampered one, resumes nothing.
+        self.assertEqual(async_to_sync(reconnect)(f"resume={stolen}"), [])
+        self.assertEqual(async_to_sync(reconnect)(f"resume={token[:-2]}xx"), [])
+
+    def test_interleaved_senders_and_a_reconnect_see_every_message_once(self):
+        carol = make_user("carol")
+        group = Conversation.objects.create()
+        group.participants.add(self.alice, self.bob, carol)
+
+        def socket(user, query=""):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/{group.id}/?{query}")
+            communicator.scope["user"] = user
+            communicator.scope["url_route"] = {"kwargs": {"conversation_id": group.id}}
+            return communicator
+
+        async def drain(communicator):
+            frames = []
+            while not await communicator.receive_nothing(timeout=0.1):
+                frames.append(await communicator.receive_json_from())
+            return [frame["message"]["seq"] for frame in frames if frame["type"] == "new_message"]
+
+        async def send(communicator, sender, count):
+            for i in range(count):
+                await communicator.send_json_to({"type": "send_message", "content": f"{sender} {i}"})
+                await asyncio.sleep(0)
+
+        async def scenario():
+            alice, bob, watcher = socket(self.alice), socket(self.bob), socket(carol)
+            for communicator in (alice, bob, watcher):
+                await communicator.connect()
+            await asyncio.gather(send(alice, "alice", 5), send(bob, "bob", 5))
+            seen = await drain(watcher)
+            await watcher.disconnect()
+
+            # Carol is away while both keep sending, then resumes.
+            await asyncio.gather(send(alice, "alice", 5), send(bob, "bob", 5))
+            await drain(alice), await drain(bob)
+            watcher = socket(carol, f"last_seq={seen[-1]}")
+            await watcher.connect()
+            await asyncio.gather(send(alice, "alice", 3), send(bob, "bob", 3))
+            seen += await drain(watcher)
+            for communicator in (alice, bob, watcher):
+                await communicator.disconnect()
+            return seen
+
+        seen = async_to_sync(scenario)()
+
+        self.assertEqual(seen, list(range(1, 27)))
+        stored = list(group.messages.order_by("seq").values_list("seq", flat=True))
+        self.assertEqual(stored, list(range(1, 27)))
+        group.refresh_from_db()
+        self.assertEqual(group.last_seq, 26)
+
+    @override_settings(CHAT_REPLAY_LIMIT=3)
+    def test_too_far_behind_is_told_to_resync(self):
+        async def reconnect():
+            communicator, received = await self.resume("last_seq=1")
+            await communicator.disconnect()
+            return received
+
+        received = async_to_sync(reconnect)()
+
+        self.assertEqual(received, [{"type": "resync", "conversation_id": self.conversation.id}])
+
+    def test_live_socket_resumes_each_conversation(self):
+        carol = make_user("carol")
+        with_carol, _ = Conversation.objects.get_or_create_direct(self.alice, carol)
+        with_carol.post_message(carol, "hey")
+        strangers, _ = Conversation.objects.get_or_create_direct(self.bob, carol)
+        strangers.post_message(carol, "private")
+
+        async def reconnect():
+            communicator, received = await self.resume(
+                f"last_seq={self.conversation.id}:4&last_seq={with_carol.id}:0&last_seq={strangers.id}:0",
+                consumer=LiveConsumer, path="/ws/live/",
+            )
+            await communicator.disconnect()
+            return received
+
+        received = async_to_sync(reconnect)()
+
+        self.assertCountEqual(
+            [(frame["type"], frame.get("conversation_id") or frame["message"]["conversation"]) for frame in received],
+            [
+                ("new_message", self.conversation.id), ("resumed", self.conversation.id),
+                ("new_message", with_carol.id), ("resumed", with_carol.id),
+            ],
+        )
+
+
+@override_settings(**TEST_SETTINGS)
+class ChatMetricsViewTests(APITestCase):
+
+    def test_staff_only(self):
+        metrics.reset()
+        metrics.incr("typing_frames_received", 3)
+        user = make_user("alice")
+        self.client.force_authenticate(user)
+
+        self.assertEqual(self.client.get("/chat/metrics/").status_code, status.HTTP_403_FORBIDDEN)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get("/chat/metrics/")
+        self.assertEqual(response.data, {"typing_frames_received": 3})
+
+
+@override_settings(**TEST_SETTINGS)
+class StoreMessagesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.first, _ = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        self.second, _ = Conversation.objects.get_or_create_direct(self.alice, make_user("carol"))
+
+    def membership(self, conversation, profile):
+        return ConversationParticipant.objects.get(conversation=conversation, profile=profile)
+
+    def test_batch_is_accounted_as_if_posted_in_order(self):
+        batch = [
+            Message(conversation=self.first, sender=self.bob, content="1"),
+            Message(conversation=self.first, sender=self.alice, content="2"),
+            Message(conversation=self.first, sender=self.bob, content="3"),
+            Message(conversation=self.first, sender=self.bob, content="4"),
+            Message(conversation=self.second, sender=self.alice, content="5"),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            Conversation.objects.store_messages(batch)
+
+        statements = [
+            q["sql"].split()[0] for q in queries.captured_queries
+            if "SAVEPOINT" not in q["sql"]
+        ]
+        self.assertEqual(statements, ["SELECT", "INSERT", "UPDATE", "UPDATE"])
+
+        alice = self.membership(self.first, self.alice)
+        self.assertEqual((alice.last_read_message_id, alice.unread_count), (batch[1].id, 2))
+        bob = self.membership(self.first, self.bob)
+        self.assertEqual((bob.last_read_message_id, bob.unread_count), (batch[3].id, 0))
+        self.assertEqual(self.membership(self.second, self.alice).unread_count, 0)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.updated_at, batch[3].created_at)
+        self.assertEqual(self.second.updated_at, batch[4].created_at)
+        self.assertEqual([message.seq for message in batch], [1, 2, 3, 4, 1])
+        self.assertEqual((self.first.last_seq, self.second.last_seq), (4, 1))
+
+    def test_seqs_continue_across_batches_and_saves(self):
+        Conversation.objects.store_messages([Message(conversation=self.first, sender=self.bob, content="1")])
+        saved = Message.objects.create(conversation=self.first, sender=self.alice, content="2")
+        posted = self.first.post_message(self.bob, "3")
+
+        self.assertEqual((saved.seq, posted.seq), (2, 3))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.last_seq, 3)
+
+    def test_a_seq_is_stored_once(self):
+        message = self.first.post_message(self.alice, "1")
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Message.objects.create(conversation=self.first, sender=self.bob, content="copy", seq=message.seq)
+
+
+
+@override_settings(**TEST_SETTINGS, CHAT_WRITE_BEHIND_FLUSH_INTERVAL=60, CHAT_WRITE_BEHIND_MAX_RETRIES=1)
+class MessageWriterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation, _ = Conversation.objects.get_or_create_direct(self.alice, self.bob)
+        self.layer = get_channel_layer()
+        self.reply_channel = async_to_sync(self.layer.new_channel)()
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def queued(self, content, **fields):
+        message = Message(conversation=self.conversation, sender=self.alice, content=content, **fields)
+        return {
+            "type": "chat.persist", "message": message_payload(message),
+            "reply_channel": self.reply_channel, "client_id": content,
+        }
+
+    def flush(self, events, times=1):
+        """Run `times` flushes of `events` on a writer; returns (replies, events still pending)."""
+        async def run():
+            writer = MessageWriter()
+            writer.channel_layer = self.layer
+            writer.pending = events
+            for _ in range(times):
+                await writer.flush()
+                if writer.flush_timer is not None:
+                    writer.flush_timer.cancel()
+                    writer.flush_timer = None
+            replies = []
+            while len(replies) < len(events) - len(writer.pending):
+                reply = await self.layer.receive(self.reply_channel)
+                replies.append((reply["type"], reply["client_id"]))
+            return replies, writer.pending
+
+        return async_to_sync(run)()
+
+    def test_bad_row_is_isolated_and_the_rest_stored(self):
+        stored = self.conversation.post_message(self.alice, "already stored")
+        events = [self.queued("a"), self.queued("b"), self.queued("dup", id=stored.id), self.queued("c")]
+
+        with self.assertLogs("chat_service.persistence", "ERROR") as logs:
+            replies, pending = self.flush(events)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(pending, [])
+        self.assertEqual(sorted(replies), [
+            ("chat.persist_failed", "dup"),
+            ("chat.persisted", "a"), ("chat.persisted", "b"), ("chat.persisted", "c"),
+        ])
+        self.assertEqual(
+            list(self.conversation.messages.order_by("seq").values_list("content", flat=True)),
+            ["already stored", "a", "b", "c"],
+        )
+
+    def test_transient_errors_are_retried_a_limited_number_of_times(self):
+        events = [self.queued("a"), self.queued("b")]
+
+        locked = mock.patch("chat_service.persistence.store_payloads", side_effect=OperationalError("database is locked"))
+        with locked, self.assertLogs("chat_service.persistence", "WARNING"):
+            replies, pending = self.flush(events)
+            self.assertEqual((replies, [event["attempts"] for event in pending]), ([], [1, 1]))
+
+            replies, pending = self.flush(pending)
+
+        self.assertEqual(pending, [])
+        self.assertEqual(replies, [("chat.persist_failed", "a"), ("chat.persist_failed", "b")])
+        self.assertFalse(self.conversation.messages.exists())
+
+
+class MessageIdTests(SimpleTestCase):
+
+    def test_node_id_is_required(self):
+        for node_id in (None, "", "32", "node-a"):
+            with self.subTest(node_id=node_id), override_settings(CHAT_NODE_ID=node_id):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_node_id()
+        with override_settings(CHAT_NODE_ID="7"):
+            self.assertEqual(check_node_id(), 7)
+
+    @override_settings(CHAT_NODE_ID=None)
+    def test_node_id_is_only_needed_for_write_behind(self):
+        config = apps.get_app_config("chat_service")
+        config.ready()
+        # Left for the database to assign.
+        self.assertIsNone(Message().id)
+
+        with override_settings(CHAT_WRITE_BEHIND=True):
+            with self.assertRaises(ImproperlyConfigured):
+                config.ready()
+            with self.assertRaises(ImproperlyConfigured):
+                Message()
+            with override_settings(CHAT_NODE_ID="3"):
+                self.assertEqual(Message().id >> SEQUENCE_BITS & MAX_NODE, 3)
+
+
+class ReadStateMigrationTests(TransactionTestCase):
+    migrate_from = [("chat_service", "0004_conversation_participant")]
+    migrate_to = [("chat_service", "0005_populate_read_state")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_cursor_and_counter_come_from_is_read_flags(self):
+        apps = self.migrate(self.migrate_from)
+        Profile = apps.get_model("auth_service", "Profile")
+        Conversation = apps.get_model("chat_service", "Conversation")
+        Message = apps.get_model("chat_service", "Message")
+        Membership = apps.get_model("chat_service", "ConversationParticipant")
+
+        alice = Profile.objects.create(email="a@example.com", username="alice", fullname="Alice")
+        bob = Profile.objects.create(email="b@example.com", username="bob", fullname="Bob")
+        conversation = Conversation.objects.create()
+        Membership.objects.create(conversation=conversation, profile=alice)
+        Membership.objects.create(conversation=conversation, profile=bob)
+
+        read = Message.objects.create(conversation=conversation, sender=bob, content="1", is_read=True)
+        Message.objects.create(conversation=conversation, sender=bob, content="2", is_read=False)
+        third = Message.objects.create(conversation=conversation, sender=bob, content="3", is_read=False)
+        Message.objects.create(conversation=conversation, sender=alice, content="4", is_read=False)
+
+        apps = self.migrate(self.migrate_to)
+        Membership = apps.get_model("chat_service", "ConversationParticipant")
+
+        alice_state = Membership.objects.get(profile_id=alice.id)
+        self.assertEqual((alice_state.last_read_message_id, alice_state.unread_count), (read.id, 2))
+        bob_state = Membership.objects.get(profile_id=bob.id)
+        self.assertEqual((bob_state.last_read_message_id, bob_state.unread_count), (third.id, 1))
+
+
+class MessageSeqMigrationTests(TransactionTestCase):
+    migrate_from = [("chat_service", "0010_message_seq")]
+    migrate_to = [("chat_service", "0011_populate_message_seq")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_messages_are_numbered_in_history_order(self):
+        apps = self.migrate(self.migrate_from)
+        Profile = apps.get_model("auth_service", "Profile")
+        Conversation = apps.get_model("chat_service", "Conversation")
+        Message = apps.get_model("chat_service", "Message")
+
+        bob = Profile.objects.create(email="b@example.com", username="bob", fullname="Bob")
+        first, second = Conversation.objects.create(), Conversation.objects.create()
+        now = time.time()
+
+        def message(conversation, message_id, seconds_ago):
+            created_at = datetime.fromtimestamp(now - seconds_ago, tz=timezone.utc)
+            return Message.objects.create(
+                id=message_id, conversation=conversation, sender=bob, content="", created_at=created_at
+            )
+
+        # Ids issued before server-assigned ids don't follow creation time.
+        latest, earliest, middle = message(first, 1, 0), message(first, 2, 20), message(first, 3, 10)
+        other = message(second, 4, 30)
+
+        apps = self.migrate(self.migrate_to)
+        Message = apps.get_model("chat_service", "Message")
+
+        seqs = dict(Message.objects.values_list("id", "seq"))
+        self.assertEqual(
+            [seqs[m.id] for m in (earliest, middle, latest, other)], [1, 2, 3, 1]
+        )
+
+
+# Messages made at these migrations get the server-assigned ids of the time.
+@override_settings(CHAT_NODE_ID="0")
+class LastSeqMigrationTests(TransactionTestCase):
+    migrate_from = [("chat_service", "0013_conversation_last_seq")]
+    migrate_to = [("chat_service", "0015_message_seq_unique")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicate_seqs_are_renumbered_and_counters_set(self):
+        apps = self.migrate(self.migrate_from)
+        Profile = apps.get_model("auth_service", "Profile")
+        Conversation = apps.get_model("chat_service", "Conversation")
+        Message = apps.get_model("chat_service", "Message")
+
+        bob = Profile.objects.create(email="b@example.com", username="bob", fullname="Bob")
+        clashing, clean, empty = Conversation.objects.create(), Conversation.objects.create(), Conversation.objects.create()
+        now = time.time()
+
+        def message(conversation, seq, seconds_ago):
+            created_at = datetime.fromtimestamp(now - seconds_ago, tz=timezone.utc)
+            return Message.objects.create(
+                conversation=conversation, sender=bob, content="", created_at=created_at, seq=seq
+            )
+
+        # Two processes both issued seq 2.
+        first, second, third = message(clashing, 1, 30), message(clashing, 2, 20), message(clashing, 2, 10)
+        message(clean, 1, 30), message(clean, 2, 20)
+
+        apps = self.migrate(self.migrate_to)
+        Conversation = apps.get_model("chat_service", "Conversation")
+        Message = apps.get_model("chat_service", "Message")
+
+        seqs = dict(Message.objects.values_list("id", "seq"))
+        self.assertEqual([seqs[m.id] for m in (first, second, third)], [1, 2, 3])
+        self.assertEqual(
+            dict(Conversation.objects.values_list("id", "last_seq")),
+            {clashing.id: 3, clean.id: 2, empty.id: 0},
+        )
+
+    def test_database_ids_start_after_the_server_assigned_ones(self):
+        apps = self.migrate([("chat_service", "0015_message_seq_unique")])
+        Profile = apps.get_model("auth_service", "Profile")
+        Conversation = apps.get_model("chat_service", "Conversation")
+        Message = apps.get_model("chat_service", "Message")
+        bob = Profile.objects.create(email="b@example.com", username="bob", fullname="Bob")
+        conversation = Conversation.objects.create()
+        old = Message.objects.create(conversation=conversation, sender=bob, content="", seq=1)
+
+        apps = self.migrate([("chat_service", "0016_message_database_ids")])
+        Message = apps.get_model("chat_service", "Message")
+
+        with override_settings(CHAT_NODE_ID=None):
+            new = Message.objects.create(conversation_id=conversation.id, sender_id=bob.id, content="", seq=2)
+        self.assertGreater(new.id, old.id)
@@ -1,16 +1,17 @@
 from django.urls import path
+from . import async_views
 from .views import (
     ConversationListView,
     ConversationCreateOrGetView,
     ConversationDetailView,
-    MessageListView,
-    MarkMessagesReadView,
+    ChatMetricsView,
 )
 
 urlpatterns = [
     path('conversations/', ConversationListView.as_view(), name='conversation-list'),
     path('conversations/create/', ConversationCreateOrGetView.as_view(), name='conversation-create'),
     path('conversations/<int:pk>/', ConversationDetailView.as_view(), name='conversation-detail'),
-    path('conversations/<int:conversation_id>/messages/', MessageListView.as_view(), name='message-list'),
-    path('conversations/<int:conversation_id>/read/', MarkMessagesReadView.as_view(), name='mark-read'),
+    path('conversations/<int:conversation_id>/messages/', async_views.MessageListView.as_view(), name='message-list'),
+    path('conversations/<int:conversation_id>/read/', async_views.MarkMessagesReadView.as_view(), name='mark-read'),
+    path('metrics/', ChatMetricsView.as_view(), name='chat-metrics'),
 ]
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PostServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'post_service'
+
+    def ready(self):
+        from . import signals  # noqa: F401
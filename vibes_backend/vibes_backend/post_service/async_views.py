@@ -0,0 +1,141 @@
+"""
+The hot post endpoints (feed, create, like/unlike, comments), as async views
+(see vibes_backend/async_api.py). They also run under WSGI, where Django
+gives each request its own event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import aget_object_or_404
+from drf_spectacular.utils import OpenApiParameter, extend_schema, inline_serializer
+from rest_framework import serializers, status
+
+from vibes_backend import uploads
+from vibes_backend.async_api import AsyncAPIView, json_response
+from vibes_backend.images import process_variants
+from .events import post_events
+from .models import Post, Comment
+from .pagination import PAGE_PARAMETERS, KeysetPagination, page_serializer
+from .serializers import PostSerializer, CommentSerializer
+from . import timeline
+
+DETAIL = inline_serializer("Detail", {"detail": serializers.CharField()})
+
+
+# ------------------------------------------------------
+#   POST LIST + CREATE
+# ------------------------------------------------------
+class PostListCreateView(AsyncAPIView):
+
+    @extend_schema(
+        parameters=[OpenApiParameter("user_id", int, description="Only this user's posts"), *PAGE_PARAMETERS],
+        responses=page_serializer("PostPage", PostSerializer),
+    )
+    async def get(self, request):
+        """
+        Cursor-paginated feed, newest first.
+
+        Query params: user_id (optional), cursor, page_size.
+        Served in a constant number of queries per page: one for the posts
+        (with counts and liked flag annotated) and one for the comment preview.
+        """
+        user_id = request.query_params.get("user_id")
+
+        posts = Post.objects.for_feed(request.user, settings.FEED_COMMENTS_PREVIEW)
+        if user_id:
+            posts = posts.filter(user_id=user_id)
+
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(posts, request)
+        serializer = PostSerializer(page, many=True, context={"request": request})
+        return json_response(paginator.get_paginated_data(serializer.data))
+
+    @extend_schema(
+        request=inline_serializer("PostCreate", {
+            "content": serializers.CharField(required=False),
+            "image": serializers.ImageField(required=False),
+            "image_upload": serializers.CharField(required=False, help_text="Token of a direct upload"),
+        }),
+        responses={201: PostSerializer},
+    )
+    async def post(self, request):
+        # Uploads go through the storage backend synchronously; keep the
+        # whole create on one worker thread.
+        return await sync_to_async(self.create)(request)
+
+    def create(self, request):
+        data = request.data.copy()
+        data.update(request.FILES)
+        serializer = PostSerializer(data=data, context={"request": request})
+
+        if serializer.is_valid():
+            # A direct-to-storage upload (see vibes_backend/uploads.py) instead of a file
+            image_upload = data.get("image_upload")
+            if image_upload:
+                image = uploads.claim(image_upload, "post", request.user)
+                post = serializer.save(user=request.user, image=image)
+                process_variants(post, "image")
+            else:
+                post = serializer.save(user=request.user)
+            # Fan out to followers' home timelines and sockets on the worker
+            timeline.schedule_fanout(post, serializer.data)
+            return json_response(serializer.data, status=status.HTTP_201_CREATED)
+
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+# ------------------------------------------------------
+#   LIKE / UNLIKE
+# ------------------------------------------------------
+class PostLikeView(AsyncAPIView):
+
+    @extend_schema(request=None, responses=DETAIL)
+    async def post(self, request, pk):
+        post = await aget_object_or_404(Post, pk=pk)
+
+        created = await post.aadd_like(request.user)
+        await post_events.aadd(post.id)
+
+        return json_response({"detail": "Liked." if created else "Already liked."})
+
+
+class PostUnlikeView(AsyncAPIView):
+
+    @extend_schema(request=None, responses=DETAIL)
+    async def post(self, request, pk):
+        post = await aget_object_or_404(Post, pk=pk)
+
+        await post.aremove_like(request.user)
+        await post_events.aadd(post.id)
+
+        return json_response({"detail": "Unliked."})
+
+
+# ------------------------------------------------------
+#   COMMENTS
+# ------------------------------------------------------
+class CommentListCreateView(AsyncAPIView):
+
+    @extend_schema(responses=CommentSerializer(many=True))
+    async def get(self, request, pk):
+        comments = [
+            comment
+            async for comment in Comment.objects.filter(post_id=pk)
+            .select_related("user")
+            .order_by("-created_at")
+        ]
+        serializer = CommentSerializer(comments, many=True, context={"request": request})
+        return json_response(serializer.data)
+
+    @extend_schema(request=CommentSerializer, responses={201: CommentSerializer})
+    async def post(self, request, pk):
+        post = await aget_object_or_404(Post, pk=pk)
+
+        serializer = CommentSerializer(data=request.data, context={"request": request})
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        await post.aadd_comment(lambda: serializer.save(user=request.user, post=post))
+        data = serializer.data
+        await post_events.aadd(post.id, comment=data)
+
+        return json_response(data, status=status.HTTP_201_CREATED)
@@ -1,17 +1,149 @@
+import asyncio
 import json
+from channels.consumer import SyncConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
-class PostsConsumer(AsyncWebsocketConsumer):
+from auth_service.presence import presence
+from vibes_backend.frames import encode_frame
+from vibes_backend.outbox import OutboxMixin
+from . import timeline
+from .events import post_group, user_group
+
+
+class PostsConsumer(OutboxMixin, AsyncWebsocketConsumer):
+    """
+    WebSocket consumer for real-time feed updates.
+
+    URL pattern: ws/posts/
+    Group naming: post_<post_id> per subscribed post, user_<user_id> for the
+    authenticated user's home timeline.
+
+    Clients only receive updates for the posts they subscribe to (the ones on
+    screen). Subscription changes are sent as one frame per batch; the
+    server diffs against the current set and only joins/leaves the groups
+    that changed.
+
+    Client -> Server messages:
+        {"type": "subscribe", "post_ids": [1, 2, 3]}
+        {"type": "unsubscribe", "post_ids": [1]}
+        {"type": "set_subscriptions", "post_ids": [2, 3, 4]}
+
+    Server -> Client messages:
+        {"type": "subscriptions", "post_ids": [2, 3, 4]}
+        {"type": "post_update", "event": "posts_updated", "posts": [...]}
+        {"type": "post_update", "event": "new_post", "post": {...}}
+        {"type": "error", "detail": "..."}
+        Before a slow consumer is closed (code 4008):
+        {"type": "evicted", "resume": "<token>"}
+    """
+
+    # Set once the connection counts towards the user's presence.
+    presence_user_id = None
 
     async def connect(self):
-        # All users join the "posts" group
-        await self.channel_layer.group_add("posts", self.channel_name)
-        await self.accept()
+        self.user = self.scope.get("user")
+        self.post_ids = set()
+        self.user_group_name = None
+
+        if self.user and self.user.is_authenticated:
+            self.user_group_name = user_group(self.user.id)
+            await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+
+        await self.accept(self.scope.get("auth_subprotocol"))
+        if self.user_group_name:
+            self.presence_user_id = self.user.id
+            await presence.connect(self.presence_user_id)
 
     async def disconnect(self, close_code):
-        # Remove user from group
-        await self.channel_layer.group_discard("posts", self.channel_name)
+        await self.apply_subscriptions(set())
+        if self.user_group_name:
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        if self.presence_user_id is not None:
+            await presence.disconnect(self.presence_user_id)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(data, dict):
+            await self.send_error("Frames must be JSON objects.")
+            return
+        await self.handle_frame(data)
+
+    async def handle_frame(self, data):
+        """Handle subscription changes from the client."""
+        message_type = data.get("type")
+        try:
+            post_ids = data.get("post_ids", [])
+            if not isinstance(post_ids, list):
+                raise TypeError
+            post_ids = {int(post_id) for post_id in post_ids}
+        except (TypeError, ValueError):
+            await self.send_error("post_ids must be a list of integers.")
+            return
+
+        if message_type == "subscribe":
+            wanted = self.post_ids | post_ids
+        elif message_type == "unsubscribe":
+            wanted = self.post_ids - post_ids
+        elif message_type == "set_subscriptions":
+            wanted = post_ids
+        else:
+            return
+
+        if len(wanted) > settings.POSTS_MAX_SUBSCRIPTIONS:
+            await self.send_error(
+                f"At most {settings.POSTS_MAX_SUBSCRIPTIONS} posts can be subscribed at once."
+            )
+            return
+
+        await self.apply_subscriptions(wanted)
+        await self.send(text_data=json.dumps({
+            "type": "subscriptions",
+            "post_ids": sorted(self.post_ids),
+        }))
+
+    async def apply_subscriptions(self, wanted):
+        """Join/leave only the post groups that differ from the current set."""
+        added = wanted - self.post_ids
+        removed = self.post_ids - wanted
+        await asyncio.gather(
+            *(self.channel_layer.group_add(post_group(i), self.channel_name) for i in added),
+            *(self.channel_layer.group_discard(post_group(i), self.channel_name) for i in removed),
+        )
+        self.post_ids = wanted
+
+    async def send_error(self, detail):
+        await self.send(text_data=json.dumps({"type": "error", "detail": detail}))
 
     # Receive message from group_send
     async def post_update(self, event):
-        await self.send(text_data=json.dumps(event))
+        # Pre-encoded by the sender (see vibes_backend/frames.py). Droppable:
+        # a client that falls behind only loses older feed updates.
+        await self.queue_frame(event.get("text") or encode_frame(event), droppable=True)
+
+    # Chat events reach user_<id> too, for chat_service.consumers.LiveConsumer;
+    # a feed-only socket drops them.
+    async def chat_message(self, event):
+        pass
+
+    chat_typing = chat_messages_read = chat_message
+
+
+class TimelineWorker(SyncConsumer):
+    """
+    Background worker for home timeline fan-out, bound to timeline.TIMELINE_CHANNEL.
+
+    Run with: python manage.py runworker timeline-fanout
+    """
+
+    def timeline_fanout(self, message):
+        timeline.run(message)
+
+    def timeline_backfill(self, message):
+        timeline.run(message)
+
+    def timeline_unfill(self, message):
+        timeline.run(message)
@@ -0,0 +1,133 @@
+import logging
+import threading
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+
+from vibes_backend.frames import with_text
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def post_group(post_id):
+    """Group of sockets that have the post on screen."""
+    return f"post_{post_id}"
+
+
+def user_group(user_id):
+    """Personal group of every socket the user has open."""
+    return f"user_{user_id}"
+
+
+def broadcast_event(group: str, message: dict):
+    """Broadcast event to channel layer. Fails silently if Redis is unavailable."""
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer:
+            async_to_sync(channel_layer.group_send)(group, message)
+    except Exception as e:
+        logger.warning(f"Failed to broadcast event: {e}")
+
+
+def post_counts(post_ids):
+    """Current likes_count / comments_count of each post, keyed by id."""
+    rows = Post.objects.filter(id__in=post_ids).values("id", "likes_count", "comments_count")
+    return {row.pop("id"): row for row in rows}
+
+
+class PostEventCoalescer:
+    """
+    Buffers like/unlike/comment events for POST_EVENT_COALESCE_WINDOW seconds,
+    then broadcasts each changed post once to its post_<id> group:
+
+        {"type": "post_update", "event": "posts_updated",
+         "posts": [{"post_id": 1, "likes_count": 10, "comments_count": 2,
+                    "comments": [...]}]}
+
+    Only which posts changed is buffered; their counts are read when the
+    window is flushed, so a burst of N likes on a post costs one query and
+    one group_send per window instead of N, and always carries the newest
+    counts. Flushes run one at a time, so a later message never carries
+    older counts than an earlier one from the same process. Buffering is
+    per process; an event still in the buffer when the process dies is
+    lost, which bounds the loss to one window of counter updates.
+
+    Each message holds one post: the audience of a post_<id> group is the
+    sockets showing that post, which differs from post to post, so updates
+    are batched per post over time rather than per subscriber. "posts"
+    stays a list to keep the frame format open to the latter.
+
+    A window of 0 sends every update immediately (still in the batch format).
+    """
+
+    def __init__(self, send=broadcast_event, read_counts=post_counts):
+        self.send = send
+        self.read_counts = read_counts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    async def aadd(self, post_id, comment=None):
+        """add() for async views: with a zero window the broadcast is awaited."""
+        if settings.POST_EVENT_COALESCE_WINDOW > 0:
+            self.add(post_id, comment=comment)
+        else:
+            await sync_to_async(self.add)(post_id, comment=comment)
+
+    def add(self, post_id, comment=None):
+        """Record that a post's counts changed, with the comment that was added."""
+        with self._lock:
+            update = self._pending.setdefault(post_id, {"post_id": post_id})
+            if comment is not None:
+                comments = update.setdefault("comments", [])
+                comments.append(comment)
+                del comments[:-settings.FEED_COMMENTS_PREVIEW]
+
+            window = settings.POST_EVENT_COALESCE_WINDOW
+            if window > 0 and self._timer is None:
+                self._timer = threading.Timer(window, self.flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if window <= 0:
+            self.flush()
+
+    def flush(self):
+        """Broadcast everything buffered so far with its current counts, one message per post."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return
+
+            counts = self.read_counts(list(pending))
+            for post_id, update in pending.items():
+                if post_id in counts:
+                    update.update(counts[post_id])
+                    self.send(post_group(post_id), self.build_message(update))
+
+    def flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread is gone after this; don't leave its connection open.
+            connections.close_all()
+
+    @staticmethod
+    def build_message(update):
+        return with_text({
+            "type": "post_update",
+            "event": "posts_updated",
+            "posts": [update],
+        })
+
+
+post_events = PostEventCoalescer()
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIHandler
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from auth_service.models import Profile
+from chat_service.models import Conversation
+from post_service.models import Post
+from vibes_backend.benchmarking import BenchmarkCommand, asgi_request, run_load
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Requests/sec and latency of the hot post/chat endpoints (the async "
+        "views) under concurrent load, served in-process through Django's "
+        "ASGI handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300, help="Requests per endpoint.")
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument(
+            "--layer-latency-ms", type=float, default=2.0,
+            help="Simulated channel-layer (Redis) round trip per group_send.",
+        )
+
+    def run_benchmark(self, **options):
+        author = Profile.objects.create_user(
+            email="bench@example.com", password="benchmark-password", fullname="Bench", username="bench"
+        )
+        other = Profile.objects.create_user(
+            email="other@example.com", password="benchmark-password", fullname="Other", username="other"
+        )
+        Post.objects.bulk_create(Post(user=author, content=f"post {i}") for i in range(100))
+        post = Post.objects.first()
+        conversation = Conversation.objects.create()
+        conversation.participants.add(author, other)
+
+        headers = {
+            "Authorization": f"Bearer {AccessToken.for_user(author)}",
+            "Content-Type": "application/json",
+        }
+        endpoints = [
+            ("feed GET", "GET", "/api/posts/?page_size=20", b""),
+            ("like POST", "POST", f"/api/posts/{post.id}/like/", b""),
+            ("message POST", "POST", f"/chat/conversations/{conversation.id}/messages/",
+             json.dumps({"content": "hello"}).encode()),
+            ("mark-read POST", "POST", f"/chat/conversations/{conversation.id}/read/", b""),
+        ]
+
+        channel_layers = {
+            "default": {
+                "BACKEND": "vibes_backend.benchmarking.LatencyChannelLayer",
+                "CONFIG": {"latency": options["layer_latency_ms"] / 1000},
+            }
+        }
+        rows = []
+        with override_settings(
+            CHANNEL_LAYERS=channel_layers,
+            POST_EVENT_COALESCE_WINDOW=0,
+            TIMELINE_FANOUT_ASYNC=False,
+        ):
+            app = ASGIHandler()
+            for name, method, url, body in endpoints:
+                summary, errors = asyncio.run(self.load(app, method, url, headers, body, options))
+                rows.append([
+                    name, summary["requests"], errors, f"{summary['rps']:.0f}",
+                    f"{summary['p50_ms']:.1f}", f"{summary['p99_ms']:.1f}",
+                ])
+
+        self.stdout.write(
+            f"{options['requests']} requests per row, concurrency {options['concurrency']}, "
+            f"{options['layer_latency_ms']}ms per group_send\n"
+        )
+        self.write_table(["endpoint", "requests", "errors", "req/s", "p50 ms", "p99 ms"], rows)
+
+    async def load(self, app, method, url, headers, body, options):
+        async def make_request(i):
+            status, _ = await asgi_request(app, method, url, headers, body)
+            return status
+
+        return await run_load(make_request, options["requests"], options["concurrency"])
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+
+from auth_service.models import Profile
+from chat_service.consumers import ChatConsumer
+from chat_service.events import client_frame
+from post_service.consumers import PostsConsumer
+from vibes_backend.benchmarking import BenchmarkCommand
+from vibes_backend.frames import orjson, with_text
+
+
+async def discard(message):
+    pass
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "CPU time the consumer handlers spend delivering one broadcast to 1k and "
+        "10k sockets: encoding the event in every handler versus forwarding the "
+        "frame the sender encoded once. Both go through the sockets' send "
+        "queues and are timed until every frame is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=5, help="Broadcasts timed per row.")
+
+    def run_benchmark(self, **options):
+        user = Profile(id=1, username="bench", fullname="Bench")
+        comment = {
+            "id": 1, "user_id": 2, "username": "commenter", "fullname": "Commenter",
+            "profile_picture": "https://cdn.example.com/user/profile_pics/2.jpg",
+            "content": "Nice one! " * 5, "created_at": "2026-01-01T12:00:00+00:00",
+        }
+        post_event = {
+            "type": "post_update",
+            "event": "new_post",
+            "post": {
+                "id": 123, "user_id": 1, "username": "bench", "fullname": "Bench",
+                "profile_picture": "https://cdn.example.com/user/profile_pics/1.jpg",
+                "content": "Hello world " * 20, "image": "https://cdn.example.com/posts/123.jpg",
+                "likes_count": 42, "comments_count": 3, "is_liked": False,
+                "created_at": "2026-01-01T12:00:00+00:00", "comments": [comment] * 3,
+            },
+        }
+        chat_event = {
+            "type": "chat_message",
+            "conversation_id": 7,
+            "message": {
+                "id": 231849970189696, "conversation": 7, "sender_id": 1, "sender_username": "bench",
+                "sender_fullname": "Bench", "sender_profile_picture": None, "content": "See you at eight?",
+                "image": None, "created_at": "2026-01-01T12:00:00+00:00", "is_read": False,
+            },
+        }
+
+        # The handlers as they were, encoding per socket, on today's delivery path.
+        def legacy_post_update(consumer, event):
+            return consumer.queue_frame(json.dumps(event), droppable=True)
+
+        def legacy_chat_message(consumer, event):
+            return consumer.queue_frame(json.dumps({"type": "new_message", "message": event["message"]}))
+
+        cases = [
+            ("post_update", PostsConsumer, post_event, None, legacy_post_update, PostsConsumer.post_update),
+            ("chat_message", ChatConsumer, chat_event, client_frame(chat_event),
+             legacy_chat_message, ChatConsumer.chat_message),
+        ]
+        rows = []
+        for subscribers in options["subscribers"]:
+            for name, consumer_class, event, frame, legacy, handler in cases:
+                # Fresh sockets per run: their send queues belong to its event loop.
+                per_socket = self.time(
+                    options["repeat"], lambda: event, self.sockets(consumer_class, subscribers, user), legacy,
+                )
+                once = self.time(
+                    options["repeat"], lambda: with_text(event, frame),
+                    self.sockets(consumer_class, subscribers, user), handler,
+                )
+                rows.append([
+                    name, subscribers, f"{per_socket * 1000:.1f}", f"{once * 1000:.1f}",
+                    f"{per_socket / once:.1f}x",
+                ])
+
+        self.stdout.write(
+            f"CPU ms per broadcast, best of {options['repeat']}; frames encoded with "
+            f"{'orjson' if orjson is not None else 'json'}\n"
+        )
+        self.write_table(["event", "sockets", "encode per socket", "encode once", "speedup"], rows)
+
+    def sockets(self, consumer_class, count, user):
+        consumers = []
+        for _ in range(count):
+            consumer = consumer_class()
+            consumer.base_send = discard
+            consumer.user = user
+            consumers.append(consumer)
+        return consumers
+
+    def time(self, repeat, build_event, consumers, handler):
+        """
+        Best CPU time of building the event once, running `handler` for
+        every socket and writing the frames it queued.
+        """
+        async def deliver():
+            message = build_event()
+            for consumer in consumers:
+                await handler(consumer, message)
+            # Each socket's writer sends what it was woken for.
+            while any(consumer.outbox for consumer in consumers):
+                await asyncio.sleep(0)
+
+        async def run():
+            best = None
+            for _ in range(repeat):
+                started = time.process_time()
+                await deliver()
+                elapsed = time.process_time() - started
+                best = elapsed if best is None else min(best, elapsed)
+            for consumer in consumers:
+                consumer.outbox_writer.cancel()
+            return best
+
+        return asyncio.run(run())
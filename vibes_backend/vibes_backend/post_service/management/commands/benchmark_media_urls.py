@@ -0,0 +1,113 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.test import RequestFactory, override_settings
+
+from auth_service.models import Profile
+from post_service.models import Comment, Post
+from post_service.serializers import PostSerializer
+from vibes_backend.benchmarking import BenchmarkCommand
+from vibes_backend.media import media_urls
+from vibes_backend.storage import MediaStorage
+
+# Offline S3 storage: presigning is local computation, nothing is sent.
+S3_MEDIA = {"default": {
+    "BACKEND": "vibes_backend.storage.MediaStorage",
+    "OPTIONS": {"access_key": "bench", "secret_key": "bench", "bucket_name": "vibes-media", "region_name": "us-east-1"},
+}}
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Serialization time of one feed page (posts with images, variants and "
+        "avatars, plus the comment preview) on S3 storage: signing every media "
+        "URL per row versus the media URL cache and the public CDN domain."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=50, help="Posts on the page.")
+        parser.add_argument("--comments", type=int, default=3, help="Comments previewed per post.")
+        parser.add_argument("--repeat", type=int, default=20, help="Renders timed per row.")
+
+    def run_benchmark(self, **options):
+        viewer = self.populate(options["posts"], options["comments"])
+        request = RequestFactory().get("/api/posts/")
+        request.user = viewer
+        page = list(Post.objects.for_feed(viewer, options["comments"])[:options["posts"]])
+
+        def render():
+            return PostSerializer(page, many=True, context={"request": request}).data
+
+        cases = [
+            ("signed per row (before)", {"MEDIA_URL_CACHE_TTL": 0}, False),
+            ("cached, cold", {}, False),
+            ("cached, warm", {}, True),
+            ("cdn domain", {"MEDIA_CDN_DOMAIN": "cdn.example.com"}, True),
+        ]
+        rows = []
+        baseline = None
+        for name, overrides, warm in cases:
+            # STORAGES again, so default_storage is rebuilt for each case's settings.
+            with override_settings(STORAGES=S3_MEDIA, **{"MEDIA_CDN_DOMAIN": "", **overrides}):
+                media_urls.clear()
+                if warm:
+                    render()
+                with mock.patch.object(MediaStorage, "url", autospec=True, side_effect=MediaStorage.url) as url:
+                    render()
+                urls = url.call_count
+                best = self.time(options["repeat"], render, warm)
+            baseline = baseline or best
+            rows.append([name, urls, f"{best * 1000:.2f}", f"{baseline / best:.1f}x"])
+
+        media_urls.clear()
+        self.stdout.write(
+            f"ms to serialize a page of {options['posts']} posts with {options['comments']} "
+            f"comments each, best of {options['repeat']}\n"
+        )
+        self.write_table(["media urls", "url() calls/page", "ms/page", "speedup"], rows)
+
+    def time(self, repeat, render, warm):
+        best = None
+        for _ in range(repeat):
+            if not warm:
+                media_urls.clear()
+            started = time.perf_counter()
+            render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def populate(self, posts, comments):
+        variants = {
+            name: {"width": edge, "height": edge, "webp": f"variants/{name}.webp", "jpeg": f"variants/{name}.jpg"}
+            for name, edge in settings.IMAGE_VARIANTS.items()
+        }
+        authors = Profile.objects.bulk_create(
+            Profile(
+                email=f"author{i}@example.com", username=f"author{i}", fullname=f"Author {i}",
+                profile_picture=f"user/profile_pics/author{i}.jpg",
+            )
+            for i in range(posts + comments)
+        )
+        created = Post.objects.bulk_create(
+            Post(
+                user=authors[i], content=f"post {i}", image=f"posts/{i}.jpg",
+                image_variants={
+                    "source": f"posts/{i}.jpg", "width": 2048, "height": 1536, "blurhash": "LEHV6nWB2yk8",
+                    "color": "#aa7744",
+                    "variants": {
+                        name: {**files, "webp": f"posts/{i}/{files['webp']}", "jpeg": f"posts/{i}/{files['jpeg']}"}
+                        for name, files in variants.items()
+                    },
+                },
+            )
+            for i in range(posts)
+        )
+        # Comments by a handful of regulars, as on a real feed: their avatars repeat.
+        Comment.objects.bulk_create(
+            Comment(post=post, user=authors[posts + j], text="Nice!")
+            for post in created
+            for j in range(comments)
+        )
+        return authors[0]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from post_service.events import PostEventCoalescer, post_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test feed broadcasts on the in-memory channel layer: fire likes at "
+        "a fixed rate and report channel-layer messages per like for the old "
+        "global 'posts' group versus coalesced per-post groups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=100, help="Connected PostsConsumer sockets.")
+        parser.add_argument("--posts", type=int, default=20, help="Distinct posts receiving likes.")
+        parser.add_argument("--rate", type=int, default=2000, help="Likes per second.")
+        parser.add_argument("--duration", type=float, default=2.0, help="Seconds to generate likes for.")
+        parser.add_argument("--window", type=float, default=0.5, help="Coalescing window in seconds.")
+        parser.add_argument("--on-screen", type=int, default=5, help="Posts each socket is subscribed to.")
+
+    def handle(self, *args, **options):
+        likes = self.generate_likes(options)
+        post_ids = range(1, options["posts"] + 1)
+        everything = [["posts"] for _ in range(options["subscribers"])]
+        on_screen = [
+            [post_group(post_id) for post_id in random.sample(post_ids, options["on_screen"])]
+            for _ in range(options["subscribers"])
+        ]
+
+        baseline = [
+            ("posts", {"type": "post_update", "event": "like", "post_id": post_id, "likes_count": count})
+            for _, post_id, count in likes
+        ]
+        per_post = [
+            (post_group(post_id), {"type": "post_update", "event": "like", "post_id": post_id, "likes_count": count})
+            for _, post_id, count in likes
+        ]
+        coalesced = self.run_coalescer(likes, options)
+
+        rows = [
+            ("global, per-event", asyncio.run(self.deliver(baseline, everything))),
+            ("per-post, per-event", asyncio.run(self.deliver(per_post, on_screen))),
+            (f"per-post, {options['window']}s", asyncio.run(self.deliver(coalesced, on_screen))),
+        ]
+
+        self.stdout.write(
+            f"{len(likes)} likes on {options['posts']} posts over {options['duration']}s, "
+            f"{options['subscribers']} subscribers with {options['on_screen']} posts on screen\n"
+        )
+        self.stdout.write(f"{'mode':<24}{'group_sends':>12}{'delivered':>12}{'msgs/like':>12}{'bytes/socket':>14}")
+        for name, (group_sends, delivered, socket_bytes) in rows:
+            self.stdout.write(
+                f"{name:<24}{group_sends:>12}{delivered:>12}{delivered / len(likes):>12.3f}{socket_bytes:>14}"
+            )
+
+    def generate_likes(self, options):
+        """A (timestamp, post_id, likes_count) stream at a constant rate."""
+        counts = [0] * options["posts"]
+        total = int(options["rate"] * options["duration"])
+        likes = []
+        for i in range(total):
+            post_id = random.randrange(options["posts"])
+            counts[post_id] += 1
+            likes.append((i / options["rate"], post_id + 1, counts[post_id]))
+        return likes
+
+    def run_coalescer(self, likes, options):
+        """Feed the likes through a real PostEventCoalescer in real time."""
+        sent, lock = [], threading.Lock()
+        # Stands in for the posts table the coalescer reads counts from at flush time.
+        likes_counts = {}
+
+        def capture(group, message):
+            with lock:
+                sent.append((group, message))
+
+        def read_counts(post_ids):
+            with lock:
+                return {post_id: {"likes_count": likes_counts[post_id]} for post_id in post_ids}
+
+        with override_settings(POST_EVENT_COALESCE_WINDOW=options["window"]):
+            coalescer = PostEventCoalescer(send=capture, read_counts=read_counts)
+            start = time.monotonic()
+            for at, post_id, count in likes:
+                delay = at - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                with lock:
+                    likes_counts[post_id] = count
+                coalescer.add(post_id)
+            coalescer.flush()
+        return sent
+
+    async def deliver(self, messages, subscriptions):
+        """
+        Push (group, message) pairs through the in-memory layer and count
+        deliveries. `subscriptions` holds the groups joined by each socket.
+        """
+        layer = InMemoryChannelLayer(capacity=len(messages) + 1)
+        channels = []
+        for groups in subscriptions:
+            channel = await layer.new_channel()
+            channels.append(channel)
+            for group in groups:
+                await layer.group_add(group, channel)
+
+        for group, message in messages:
+            await layer.group_send(group, message)
+
+        queues = [layer.channels.get(channel) for channel in channels]
+        delivered = sum(queue.qsize() for queue in queues if queue)
+        # What an average client has to download and parse (PostsConsumer json.dumps each event).
+        socket_bytes = 0
+        for channel, queue in zip(channels, queues):
+            for _ in range(queue.qsize() if queue else 0):
+                socket_bytes += len(json.dumps(await layer.receive(channel)))
+        await layer.flush()
+        return len(messages), delivered, socket_bytes // len(channels)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, Q
+
+from post_service.models import Post
+
+
+class Command(BaseCommand):
+    help = "Recompute Post.likes_count / comments_count and fix any rows that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="Report drift without writing.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        max_id = Post.objects.aggregate(m=Max("id"))["m"] or 0
+        fixed = 0
+
+        # Walk the table in primary-key ranges so each batch is a bounded scan.
+        # Rows are locked while recounting so concurrent F() increments queue
+        # behind the fix instead of being overwritten by it.
+        for start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                drifted = list(
+                    Post.objects.select_for_update()
+                    .filter(id__gte=start, id__lt=start + batch_size)
+                    .with_actual_counts()
+                    .filter(
+                        ~Q(likes_count=F("actual_likes_count"))
+                        | ~Q(comments_count=F("actual_comments_count"))
+                    )
+                    .only("id", "likes_count", "comments_count")
+                )
+                for post in drifted:
+                    post.likes_count = post.actual_likes_count
+                    post.comments_count = post.actual_comments_count
+                if drifted and not dry_run:
+                    Post.objects.bulk_update(drifted, ["likes_count", "comments_count"])
+
+            fixed += len(drifted)
+
+        verb = "Found" if dry_run else "Fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} drifted post(s) in id range 0..{max_id}."))
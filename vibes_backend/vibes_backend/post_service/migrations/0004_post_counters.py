@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('post_service', 'Post')
+    Like = apps.get_model('post_service', 'Like')
+    Comment = apps.get_model('post_service', 'Comment')
+
+    likes = (
+        Like.objects.filter(post=OuterRef('pk'))
+        .order_by().values('post').annotate(c=Count('id')).values('c')
+    )
+    comments = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by().values('post').annotate(c=Count('id')).values('c')
+    )
+    Post.objects.update(
+        likes_count=Coalesce(Subquery(likes), Value(0)),
+        comments_count=Coalesce(Subquery(comments), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('post_service', '0003_home_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -1,17 +1,126 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth import get_user_model
 
+from vibes_backend.images import VariantImageField
+
 User = get_user_model()
 
+
+class PostQuerySet(models.QuerySet):
+    def with_liked_by(self, user):
+        """Annotate whether `user` has liked each post."""
+        if user is None or not user.is_authenticated:
+            return self.annotate(is_liked=Value(False))
+        return self.annotate(
+            is_liked=Exists(Like.objects.filter(post=OuterRef("pk"), user=user))
+        )
+
+    def with_latest_comments(self, limit):
+        """Prefetch at most `limit` newest comments per post into `latest_comments`."""
+        comments = Comment.objects.select_related("user").order_by("-created_at", "-id")
+        return self.prefetch_related(
+            Prefetch("comments", queryset=comments[:limit], to_attr="latest_comments")
+        )
+
+    def with_actual_counts(self):
+        """Annotate the real like/comment counts, for reconciling the counters."""
+        likes = (
+            Like.objects.filter(post=OuterRef("pk"))
+            .order_by().values("post").annotate(c=Count("id")).values("c")
+        )
+        comments = (
+            Comment.objects.filter(post=OuterRef("pk"))
+            .order_by().values("post").annotate(c=Count("id")).values("c")
+        )
+        return self.annotate(
+            actual_likes_count=Coalesce(Subquery(likes), Value(0)),
+            actual_comments_count=Coalesce(Subquery(comments), Value(0)),
+        )
+
+    def for_feed(self, user, comments_limit):
+        """Everything a feed page needs, in a constant number of queries."""
+        return (
+            self.select_related("user")
+            .with_liked_by(user)
+            .with_latest_comments(comments_limit)
+        )
+
+
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     content = models.TextField(blank=True)
-    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image = VariantImageField(upload_to='posts/', variants_field='image_variants', blank=True, null=True)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized counters, maintained with F() updates alongside the
+    # Like/Comment writes. `manage.py reconcile_post_counters` repairs drift.
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Set by the timeline worker when the author had too many followers to
+    # fan out to; such posts are merged into home timelines at read time.
+    fanout_on_read = models.BooleanField(default=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="post_feed_idx"),
+            models.Index(fields=["user", "-created_at", "-id"], name="post_user_feed_idx"),
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(fanout_on_read=True),
+                name="post_fanout_on_read_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.content[:30 ]}"
 
+    def add_like(self, user):
+        """Record a like by `user`. Returns True if a new like was created."""
+        with transaction.atomic():
+            _, created = Like.objects.get_or_create(post=self, user=user)
+            if created:
+                Post.objects.filter(pk=self.pk).update(likes_count=F("likes_count") + 1)
+        self.refresh_from_db(fields=["likes_count"])
+        return created
+
+    def remove_like(self, user):
+        """Remove `user`'s like. Returns True if a like was deleted."""
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(post=self, user=user).delete()
+            if deleted:
+                Post.objects.filter(pk=self.pk).update(
+                    likes_count=Greatest(F("likes_count") - 1, 0)
+                )
+        self.refresh_from_db(fields=["likes_count"])
+        return bool(deleted)
+
+    def add_comment(self, save_comment):
+        """
+        Create a comment via `save_comment()` (e.g. a bound serializer.save)
+        and bump comments_count in the same transaction.
+        """
+        with transaction.atomic():
+            comment = save_comment()
+            Post.objects.filter(pk=self.pk).update(comments_count=F("comments_count") + 1)
+        self.refresh_from_db(fields=["comments_count"])
+        return comment
+
+    # Async variants: each runs its transaction in a single thread hop.
+
+    async def aadd_like(self, user):
+        return await sync_to_async(self.add_like)(user)
+
+    async def aremove_like(self, user):
+        return await sync_to_async(self.remove_like)(user)
+
+    async def aadd_comment(self, save_comment):
+        return await sync_to_async(self.add_comment)(save_comment)
+
 
 class Like(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="likes")
@@ -33,3 +142,20 @@ class Comment(models.Model):
 
     def __str__(self):
         return f"{self.user.username} commented on {self.post.id}"
+
+
+class FeedEntry(models.Model):
+    """A post materialized into one user's home timeline (fan-out-on-write)."""
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="feed_entries")
+    # Copy of post.created_at so a timeline page is one index range scan.
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=["owner", "-created_at", "-post"], name="feedentry_timeline_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in {self.owner_id}'s timeline"
@@ -0,0 +1,124 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from drf_spectacular.utils import OpenApiParameter, inline_serializer
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+# Query parameters of KeysetPagination, for extend_schema
+PAGE_PARAMETERS = [
+    OpenApiParameter("cursor", str, description='"next_cursor" of the previous page'),
+    OpenApiParameter("page_size", int),
+]
+
+
+def encode_cursor(created_at, pk):
+    """Encode a (created_at, id) position into an opaque cursor string."""
+    raw = f"{created_at.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by `encode_cursor`. Raises ValidationError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, pk = raw.rsplit("|", 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValidationError({"cursor": "Invalid cursor."})
+    if created_at is None:
+        raise ValidationError({"cursor": "Invalid cursor."})
+    return created_at, pk
+
+
+def page_serializer(name, serializer, **fields):
+    """OpenAPI shape of get_paginated_data() around `serializer`, for extend_schema."""
+    return inline_serializer(name, {
+        "next_cursor": serializers.CharField(allow_null=True),
+        "results": serializer(many=True),
+        **fields,
+    })
+
+
+class KeysetPagination:
+    """
+    Keyset pagination over ("-<position_field>", "-id"), newest first.
+
+    Each page is a single indexed range scan: the cursor holds the
+    (<position_field>, id) of the last row returned and the next page starts
+    strictly after it, so deep pages cost the same as the first one.
+
+    Query params:
+        cursor     opaque value from the previous page's "next_cursor"
+        page_size  defaults to FEED_PAGE_SIZE, capped at FEED_MAX_PAGE_SIZE
+    """
+
+    position_field = "created_at"
+
+    def __init__(self, default_page_size=None, max_page_size=None):
+        self.default_page_size = default_page_size or settings.FEED_PAGE_SIZE
+        self.max_page_size = max_page_size or settings.FEED_MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get("page_size", self.default_page_size))
+        except (TypeError, ValueError):
+            size = self.default_page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_position(self, request):
+        """Return the (position, id) to continue after, or None for the first page."""
+        cursor = request.query_params.get("cursor")
+        return decode_cursor(cursor) if cursor else None
+
+    def paginate_queryset(self, queryset, request):
+        rows = list(self.page_queryset(queryset, request))
+        self.paginate_rows(rows, key=self.row_position)
+        return self.page
+
+    async def apaginate_queryset(self, queryset, request):
+        rows = [row async for row in self.page_queryset(queryset, request)]
+        self.paginate_rows(rows, key=self.row_position)
+        return self.page
+
+    def row_position(self, row):
+        return getattr(row, self.position_field), row.pk
+
+    def page_queryset(self, queryset, request):
+        self.page_size = self.get_page_size(request)
+
+        position = self.get_position(request)
+        field = self.position_field
+        if position:
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk})
+            )
+
+        # Fetch one extra row to learn whether another page exists.
+        return queryset.order_by(f"-{field}", "-id")[: self.page_size + 1]
+
+    def paginate_rows(self, rows, key):
+        """
+        Page an already-ordered list holding up to page_size + 1 rows.
+        `key` maps a row to its (position, id).
+        """
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        self.last_position = key(self.page[-1]) if self.page else None
+        return self.page
+
+    def get_next_cursor(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return encode_cursor(*self.last_position)
+
+    def get_paginated_data(self, data):
+        return {
+            "next_cursor": self.get_next_cursor(),
+            "results": data,
+        }
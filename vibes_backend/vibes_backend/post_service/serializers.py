@@ -1,56 +1,58 @@
+from django.conf import settings
 from rest_framework import serializers
+
+from vibes_backend.images import ImageVariantsField
+from vibes_backend.media import MediaImageField, MediaURLField
 from .models import Post, Comment, Like
 
 
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     user_id = serializers.IntegerField(source='user.id', read_only=True)
-    user_profile_picture = serializers.SerializerMethodField()
+    user_profile_picture = MediaURLField(source='user.profile_picture')
     post = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'user', 'user_id', 'user_profile_picture', 'text', 'created_at']
 
-    def get_user_profile_picture(self, obj):
-        request = self.context.get('request')
-        if obj.user.profile_picture and request:
-            return request.build_absolute_uri(obj.user.profile_picture.url)
-        return None
-
 
 class PostSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     user_id = serializers.IntegerField(source='user.id', read_only=True)
     user_fullname = serializers.CharField(source='user.fullname', read_only=True)
-    user_profile_picture = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    user_profile_picture = MediaURLField(source='user.profile_picture')
+    image = MediaImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField('image')
     liked_by_user = serializers.SerializerMethodField()
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = [
             'id', 'user', 'user_id', 'user_fullname', 'user_profile_picture',
-            'content', 'image', 'created_at', 'likes_count', 'comments_count',
+            'content', 'image', 'image_variants', 'created_at', 'likes_count', 'comments_count',
             'liked_by_user', 'comments'
         ]
+        read_only_fields = ['likes_count', 'comments_count']
 
-    def get_user_profile_picture(self, obj):
-        request = self.context.get('request')
-        if obj.user.profile_picture and request:
-            return request.build_absolute_uri(obj.user.profile_picture.url)
-        return None
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+    # Feed querysets (Post.objects.for_feed) annotate the liked flag and
+    # prefetch the latest comments up front; fall back to per-object queries
+    # only for single posts that were not loaded that way.
 
     def get_liked_by_user(self, obj):
+        if hasattr(obj, 'is_liked'):
+            return obj.is_liked
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
+
+    def get_comments(self, obj):
+        comments = getattr(obj, 'latest_comments', None)
+        if comments is None:
+            comments = (
+                obj.comments.select_related('user')
+                .order_by('-created_at', '-id')[:settings.FEED_COMMENTS_PREVIEW]
+            )
+        return CommentSerializer(comments, many=True, context=self.context).data
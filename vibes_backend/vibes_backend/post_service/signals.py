@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from auth_service.models import Follow
+from . import timeline
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline_on_follow(sender, instance, created, **kwargs):
+    if created:
+        timeline.schedule_backfill(instance.follower_id, instance.followed_id)
+
+
+@receiver(post_delete, sender=Follow)
+def unfill_timeline_on_unfollow(sender, instance, **kwargs):
+    timeline.schedule_unfill(instance.follower_id, instance.followed_id)
@@ -1,3 +1,858 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.throttling import UserRateThrottle
+from drf_spectacular.drainage import GENERATOR_STATS
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework_simplejwt.tokens import AccessToken
+from PIL import Image
+
+from auth_service.models import Profile, Follow
+from vibes_backend import images, uploads
+from vibes_backend.media import media_urls
+from vibes_backend.storage import MediaStorage
+from vibes_backend.testing import TEST_SETTINGS, image_upload, make_user
+from .models import Post, Like, Comment, FeedEntry
+from . import timeline
+from .async_views import PostLikeView
+from .consumers import PostsConsumer
+from .events import post_events, post_group, user_group
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    FEED_PAGE_SIZE=10,
+    FEED_MAX_PAGE_SIZE=50,
+    FEED_COMMENTS_PREVIEW=2,
+)
+class PostFeedTests(APITestCase):
+    url = "/api/posts/"
+
+    def setUp(self):
+        self.viewer = make_user("viewer")
+        self.author = make_user("author")
+        self.client.force_authenticate(self.viewer)
+
+    def make_posts(self, count, comments_per_post=0, likes_per_post=0):
+        likers = [make_user(f"liker{i}") for i in range(likes_per_post)]
+        posts = []
+        for i in range(count):
+            post = Post.objects.create(user=self.author, content=f"post {i}")
+            for j in range(comments_per_post):
+                post.add_comment(
+                    lambda: Comment.objects.create(post=post, user=self.viewer, text=f"comment {j}")
+                )
+            for liker in likers:
+                post.add_like(liker)
+            posts.append(post)
+        return posts
+
+    def test_returns_newest_first_with_cursor(self):
+        posts = self.make_posts(5)
+
+        response = self.client.get(self.url, {"page_size": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in response.json()["results"]], [posts[4].id, posts[3].id])
+        self.assertIsNotNone(response.json()["next_cursor"])
+
+    def test_walks_all_pages_without_gaps_or_duplicates(self):
+        posts = self.make_posts(7)
+        # Identical timestamps must still paginate deterministically via the id tiebreak.
+        Post.objects.update(created_at=posts[0].created_at)
+
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 3}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(self.url, params)
+            seen.extend(p["id"] for p in response.json()["results"])
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, sorted((p.id for p in posts), reverse=True))
+
+    def test_page_size_is_capped(self):
+        self.make_posts(3)
+
+        with self.settings(FEED_MAX_PAGE_SIZE=2):
+            response = self.client.get(self.url, {"page_size": 100})
+
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filters_by_user(self):
+        self.make_posts(2)
+        own = Post.objects.create(user=self.viewer, content="mine")
+
+        response = self.client.get(self.url, {"user_id": self.viewer.id})
+
+        self.assertEqual([p["id"] for p in response.json()["results"]], [own.id])
+
+    def test_annotated_counts_and_liked_flag(self):
+        post, = self.make_posts(1, comments_per_post=4, likes_per_post=3)
+        post.add_like(self.viewer)
+
+        data = self.client.get(self.url).json()["results"][0]
+
+        self.assertEqual(data["likes_count"], 4)
+        self.assertEqual(data["comments_count"], 4)
+        self.assertTrue(data["liked_by_user"])
+        # Only the newest FEED_COMMENTS_PREVIEW comments are embedded.
+        self.assertEqual([c["text"] for c in data["comments"]], ["comment 3", "comment 2"])
+
+    def test_query_count_is_constant_per_page(self):
+        """Regression guard against N+1: posts + comment preview, whatever the page size."""
+        self.make_posts(30, comments_per_post=3, likes_per_post=2)
+
+        for page_size in (1, 5, 30):
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, {"page_size": page_size})
+            self.assertEqual(len(response.json()["results"]), page_size)
+
+
+@override_settings(**TEST_SETTINGS)
+class PostCounterTests(APITestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+        self.post = Post.objects.create(user=self.user, content="hello")
+        self.client.force_authenticate(self.user)
+
+    def test_like_and_unlike_only_count_real_changes(self):
+        like_url = f"/api/posts/{self.post.id}/like/"
+        unlike_url = f"/api/posts/{self.post.id}/unlike/"
+
+        self.client.post(like_url)
+        self.client.post(like_url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        self.client.post(unlike_url)
+        self.client.post(unlike_url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_like_does_not_count_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(f"/api/posts/{self.post.id}/like/")
+        self.assertFalse(any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries))
+
+    def test_comment_increments_counter(self):
+        response = self.client.post(f"/api/posts/{self.post.id}/comments/", {"text": "nice"})
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_reconcile_command_fixes_drift(self):
+        other = make_user("other")
+        Like.objects.create(post=self.post, user=other)
+        Comment.objects.create(post=self.post, user=other, text="raw insert")
+        untouched = Post.objects.create(user=self.user, content="fine")
+
+        out = StringIO()
+        call_command("reconcile_post_counters", "--batch-size", "1", stdout=out)
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+        untouched.refresh_from_db()
+        self.assertEqual((untouched.likes_count, untouched.comments_count), (0, 0))
+        self.assertIn("Fixed 1 drifted post(s)", out.getvalue())
+
+
+@override_settings(**TEST_SETTINGS)
+class AsyncPostViewTests(APITestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+        self.post = Post.objects.create(user=self.user, content="hello")
+
+    def test_requires_authentication(self):
+        response = self.client.post(f"/api/posts/{self.post.id}/like/")
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+
+    def test_rejects_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer not-a-jwt")
+        response = self.client.get("/api/posts/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_bearer_token_like_and_json_comment(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        response = self.client.post(f"/api/posts/{self.post.id}/like/")
+        self.assertEqual(response.json(), {"detail": "Liked."})
+
+        response = self.client.post(
+            f"/api/posts/{self.post.id}/comments/", {"text": "json body"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["text"], "json body")
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+
+    def test_missing_post_is_404(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post("/api/posts/999/like/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_comment_is_400(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f"/api/posts/{self.post.id}/comments/", {})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("text", response.json())
+
+    def test_like_is_throttled(self):
+        class TwoPerMinute(UserRateThrottle):
+            rate = "2/minute"
+
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(PostLikeView, "throttle_classes", [TwoPerMinute]):
+            for _ in range(2):
+                self.client.post(f"/api/posts/{self.post.id}/like/")
+            response = self.client.post(f"/api/posts/{self.post.id}/like/")
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    def test_async_views_are_in_the_schema(self):
+        with GENERATOR_STATS.silence():
+            paths = SchemaGenerator().get_schema(public=True)["paths"]
+
+        self.assertIn("post", paths["/api/posts/{id}/like/"])
+        self.assertIn("get", paths["/api/posts/"])
+        self.assertIn("get", paths["/chat/conversations/{conversation_id}/messages/"])
+
+
+@override_settings(**TEST_SETTINGS)
+class PostEventCoalescingTests(APITestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+        self.other = make_user("other")
+        self.post = Post.objects.create(user=self.user, content="hello")
+        self.client.force_authenticate(self.user)
+
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        self.subscribe(self.post)
+
+    def tearDown(self):
+        post_events.flush()
+        async_to_sync(self.layer.flush)()
+
+    def subscribe(self, post):
+        async_to_sync(self.layer.group_add)(post_group(post.id), self.channel)
+
+    def pending_messages(self):
+        queue = self.layer.channels.get(self.channel)
+        return queue.qsize() if queue else 0
+
+    def receive(self):
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def test_burst_is_coalesced_into_one_message(self):
+        with self.settings(POST_EVENT_COALESCE_WINDOW=60):
+            self.client.post(f"/api/posts/{self.post.id}/like/")
+            self.client.force_authenticate(self.other)
+            self.client.post(f"/api/posts/{self.post.id}/like/")
+            self.client.post(f"/api/posts/{self.post.id}/comments/", {"text": "first"})
+            self.assertEqual(self.pending_messages(), 0)
+
+            post_events.flush()
+
+        self.assertEqual(self.pending_messages(), 1)
+        message = self.receive()
+        self.assertEqual(message["event"], "posts_updated")
+        update, = message["posts"]
+        self.assertEqual(update["post_id"], self.post.id)
+        self.assertEqual(update["likes_count"], 2)
+        self.assertEqual(update["comments_count"], 1)
+        self.assertEqual([c["text"] for c in update["comments"]], ["first"])
+
+    def test_updates_only_reach_subscribers_of_that_post(self):
+        second = Post.objects.create(user=self.user, content="again")
+        unwatched = Post.objects.create(user=self.user, content="off screen")
+        self.subscribe(second)
+
+        with self.settings(POST_EVENT_COALESCE_WINDOW=60):
+            self.client.post(f"/api/posts/{self.post.id}/like/")
+            self.client.post(f"/api/posts/{second.id}/like/")
+            self.client.post(f"/api/posts/{unwatched.id}/like/")
+            self.client.post(f"/api/posts/{self.post.id}/unlike/")
+            post_events.flush()
+
+        self.assertEqual(self.pending_messages(), 2)
+        updates = [self.receive()["posts"][0] for _ in range(2)]
+        self.assertEqual(
+            {u["post_id"]: u["likes_count"] for u in updates},
+            {self.post.id: 0, second.id: 1},
+        )
+
+    def test_zero_window_sends_immediately(self):
+        self.client.post(f"/api/posts/{self.post.id}/like/")
+
+        self.assertEqual(self.pending_messages(), 1)
+        self.assertEqual(
+            self.receive()["posts"],
+            [{"post_id": self.post.id, "likes_count": 1, "comments_count": 0}],
+        )
+
+    def test_flush_sends_the_counts_current_at_flush_time(self):
+        with self.settings(POST_EVENT_COALESCE_WINDOW=60):
+            self.client.post(f"/api/posts/{self.post.id}/like/")
+            # A like handled by another process lands before the window closes.
+            Post.objects.filter(pk=self.post.pk).update(likes_count=5)
+            post_events.flush()
+
+        self.assertEqual(self.pending_messages(), 1)
+        update, = self.receive()["posts"]
+        self.assertEqual((update["likes_count"], update["comments_count"]), (5, 0))
+
+
+@override_settings(**TEST_SETTINGS, POSTS_MAX_SUBSCRIPTIONS=3)
+class PostsConsumerTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("user")
+
+    async def connect(self, user=None):
+        communicator = WebsocketCommunicator(PostsConsumer.as_asgi(), "/ws/posts/")
+        communicator.scope["user"] = user or self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_subscriptions_are_diffed_in_one_frame(self):
+        communicator = await self.connect()
+        layer = get_channel_layer()
+
+        await communicator.send_json_to({"type": "subscribe", "post_ids": [1, 2]})
+        self.assertEqual(await communicator.receive_json_from(), {"type": "subscriptions", "post_ids": [1, 2]})
+
+        await communicator.send_json_to({"type": "set_subscriptions", "post_ids": [2, 3]})
+        self.assertEqual(await communicator.receive_json_from(), {"type": "subscriptions", "post_ids": [2, 3]})
+        self.assertNotIn(post_group(1), layer.groups)
+        self.assertEqual(len(layer.groups[post_group(3)]), 1)
+
+        await layer.group_send(post_group(1), {"type": "post_update", "event": "posts_updated", "posts": []})
+        await layer.group_send(post_group(3), {"type": "post_update", "event": "posts_updated", "posts": [{"post_id": 3}]})
+        self.assertEqual((await communicator.receive_json_from())["posts"], [{"post_id": 3}])
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_json_to({"type": "unsubscribe", "post_ids": [2]})
+        self.assertEqual(await communicator.receive_json_from(), {"type": "subscriptions", "post_ids": [3]})
+
+        await communicator.disconnect()
+        self.assertNotIn(post_group(3), layer.groups)
+
+    async def test_subscription_limit(self):
+        communicator = await self.connect()
+
+        await communicator.send_json_to({"type": "subscribe", "post_ids": [1, 2, 3, 4]})
+
+        self.assertEqual((await communicator.receive_json_from())["type"], "error")
+        await communicator.disconnect()
+
+    async def test_malformed_frames_get_an_error(self):
+        communicator = await self.connect()
+
+        for frame in ([1], "x", 3, {"type": "subscribe", "post_ids": "12"}):
+            await communicator.send_json_to(frame)
+            self.assertEqual((await communicator.receive_json_from())["type"], "error")
+
+        await communicator.send_json_to({"type": "subscribe", "post_ids": [1]})
+        self.assertEqual(await communicator.receive_json_from(), {"type": "subscriptions", "post_ids": [1]})
+        await communicator.disconnect()
+
+    async def test_pre_encoded_frames_are_forwarded_as_is(self):
+        communicator = await self.connect()
+        text = '{"type":"post_update","event":"new_post","post":{"id":9}}'
+
+        await get_channel_layer().group_send(
+            user_group(self.user.id), {"type": "post_update", "event": "new_post", "post": {"id": 9}, "text": text}
+        )
+
+        self.assertEqual(await communicator.receive_from(), text)
+        await communicator.disconnect()
+
+    async def test_user_receives_own_timeline_group(self):
+        communicator = await self.connect()
+
+        await get_channel_layer().group_send(
+            user_group(self.user.id), {"type": "post_update", "event": "new_post", "post": {"id": 9}}
+        )
+
+        self.assertEqual((await communicator.receive_json_from())["post"], {"id": 9})
+        await communicator.disconnect()
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    TIMELINE_FANOUT_ASYNC=False,
+    TIMELINE_FANOUT_MAX_FOLLOWERS=10,
+    TIMELINE_BACKFILL_LIMIT=2,
+)
+class HomeTimelineTests(APITestCase):
+    url = "/api/timeline/"
+
+    def setUp(self):
+        self.viewer = make_user("viewer")
+        self.friend = make_user("friend")
+        self.stranger = make_user("stranger")
+        self.client.force_authenticate(self.viewer)
+
+    def follow(self, follower, followed):
+        # Through Profile.follow(), so follower counts stay right.
+        with self.captureOnCommitCallbacks(execute=True):
+            follower.follow(followed)
+        return Follow.objects.get(follower=follower, followed=followed)
+
+    def create_post(self, user, content):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/posts/", {"content": content})
+        self.client.force_authenticate(self.viewer)
+        return Post.objects.get(pk=response.json()["id"])
+
+    def timeline_ids(self, **params):
+        return [p["id"] for p in self.client.get(self.url, params).json()["results"]]
+
+    def test_new_posts_fan_out_to_followers_only(self):
+        self.follow(self.viewer, self.friend)
+
+        friend_post = self.create_post(self.friend, "hi")
+        self.create_post(self.stranger, "not for you")
+        own_post = self.create_post(self.viewer, "me")
+
+        self.assertEqual(self.timeline_ids(), [own_post.id, friend_post.id])
+
+    def test_new_post_is_pushed_to_followers_sockets(self):
+        self.follow(self.viewer, self.friend)
+        layer = get_channel_layer()
+        viewer_socket = async_to_sync(layer.new_channel)()
+        stranger_socket = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(user_group(self.viewer.id), viewer_socket)
+        async_to_sync(layer.group_add)(user_group(self.stranger.id), stranger_socket)
+
+        post = self.create_post(self.friend, "hello followers")
+
+        message = async_to_sync(layer.receive)(viewer_socket)
+        self.assertEqual((message["event"], message["post"]["id"]), ("new_post", post.id))
+        self.assertNotIn(stranger_socket, layer.channels)
+        async_to_sync(layer.flush)()
+
+    def test_follow_backfills_and_unfollow_unfills(self):
+        old = [Post.objects.create(user=self.friend, content=str(i)) for i in range(3)]
+
+        follow = self.follow(self.viewer, self.friend)
+        # Only the newest TIMELINE_BACKFILL_LIMIT posts are copied.
+        self.assertEqual(self.timeline_ids(), [old[2].id, old[1].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.assertEqual(self.timeline_ids(), [])
+
+    def test_high_follower_accounts_are_merged_on_read(self):
+        followers = [make_user(f"fan{i}") for i in range(11)]
+        for fan in followers:
+            self.follow(fan, self.friend)
+        self.follow(self.viewer, self.friend)
+        self.follow(self.viewer, self.stranger)
+
+        before = self.create_post(self.stranger, "before")
+        celebrity_post = self.create_post(self.friend, "to the masses")
+        after = self.create_post(self.stranger, "after")
+
+        celebrity_post.refresh_from_db()
+        self.assertTrue(celebrity_post.fanout_on_read)
+        self.assertFalse(FeedEntry.objects.filter(post=celebrity_post).exists())
+
+        self.assertEqual(self.timeline_ids(), [after.id, celebrity_post.id, before.id])
+        self.client.force_authenticate(followers[0])
+        self.assertEqual(self.timeline_ids(), [celebrity_post.id])
+
+    def test_pages_across_materialized_and_pulled_posts(self):
+        for i in range(11):
+            self.follow(make_user(f"fan{i}"), self.friend)
+        self.follow(self.viewer, self.friend)
+        self.follow(self.viewer, self.stranger)
+
+        posts = []
+        for i in range(6):
+            author = self.friend if i % 2 else self.stranger
+            posts.append(self.create_post(author, str(i)))
+
+        seen, cursor = [], None
+        while True:
+            params = {"page_size": 4}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(self.url, params)
+            seen.extend(p["id"] for p in response.json()["results"])
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [p.id for p in reversed(posts)])
+
+    @override_settings(TIMELINE_FANOUT_ASYNC=True)
+    def test_fanout_is_handed_to_worker(self):
+        self.follow(self.viewer, self.friend)
+        post = self.create_post(self.friend, "queued")
+
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        message = async_to_sync(get_channel_layer().receive)(timeline.TIMELINE_CHANNEL)
+        self.assertEqual(message["type"], "timeline.backfill")
+        message = async_to_sync(get_channel_layer().receive)(timeline.TIMELINE_CHANNEL)
+        self.assertEqual(message["type"], "timeline.fanout")
+        self.assertEqual(message["post_id"], post.id)
+        self.assertEqual(message["post"]["content"], "queued")
+
+        timeline.run(message)
+        self.assertEqual(self.timeline_ids(), [post.id])
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+    MEDIA_URL="/media/",
+    IMAGE_VARIANTS={"thumb": 16, "feed": 64, "full": 256},
+    IMAGE_VARIANTS_ASYNC=False,
+    TIMELINE_FANOUT_ASYNC=False,
+)
+class ImageVariantTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = make_user("user")
+        self.client.force_authenticate(self.user)
+
+    def test_upload_gets_stripped_variants_after_commit(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees to display
+        exif[0x010F] = "PhoneMaker"
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/posts/", {"content": "look", "image": image_upload(exif=exif)}, format="multipart"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(response.json()["image_variants"])  # processed after the response
+
+        post = Post.objects.get(id=response.json()["id"])
+        meta = post.image_variants
+        self.assertEqual((meta["source"], meta["width"], meta["height"]), (post.image.name, 100, 200))
+        self.assertRegex(meta["color"], r"^#[0-9a-f]{6}$")
+        self.assertEqual(len(meta["blurhash"]), 28)
+        self.assertEqual(
+            {name: (files["width"], files["height"]) for name, files in meta["variants"].items()},
+            {"thumb": (8, 16), "feed": (32, 64), "full": (100, 200)},  # never upscaled
+        )
+        for files in meta["variants"].values():
+            for key, image_format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+                with default_storage.open(files[key]) as stored:
+                    variant = Image.open(stored)
+                    self.assertEqual(variant.format, image_format)
+                    self.assertEqual(dict(variant.getexif()), {})
+
+        # The original is served too: stored upright and without metadata.
+        with post.image.open() as stored:
+            original = Image.open(stored)
+            self.assertEqual((original.format, original.size), ("JPEG", (100, 200)))
+            self.assertEqual(dict(original.getexif()), {})
+
+        feed = self.client.get("/api/posts/").json()["results"][0]
+        thumb = feed["image_variants"]["variants"]["thumb"]
+        self.assertEqual(thumb["webp"], f"http://testserver/media/{meta['variants']['thumb']['webp']}")
+        self.assertEqual(feed["image_variants"]["blurhash"], meta["blurhash"])
+
+    def test_job_for_a_replaced_image_does_nothing(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            post = Post.objects.create(user=self.user, image=image_upload())
+        Post.objects.filter(id=post.id).update(image="posts/other.jpg")
+
+        for callback in callbacks:
+            callback()
+
+        post.refresh_from_db()
+        self.assertIsNone(post.image_variants)
+
+    def test_blurhash_of_a_flat_image(self):
+        red = Image.new("RGB", (40, 30), (255, 0, 0))
+        blurhash = images.blurhash(red)
+        # 4x3 components: size flag, AC scale, the average color, then 11 AC terms.
+        self.assertEqual((blurhash[0], blurhash[2:6], len(blurhash)), ("L", "TI:j", 28))
+        self.assertEqual(images.average_color(red), "#ff0000")
+
+    def test_transparent_png_gets_a_flattened_jpeg(self):
+        buffer = BytesIO()
+        Image.new("RGBA", (20, 20), (0, 0, 255, 0)).save(buffer, "PNG")
+        name = default_storage.save("posts/clear.png", SimpleUploadedFile("clear.png", buffer.getvalue()))
+
+        meta = images.build_variants(default_storage, name)
+
+        with default_storage.open(meta["variants"]["thumb"]["webp"]) as stored:
+            self.assertEqual(Image.open(stored).mode, "RGBA")
+        with default_storage.open(meta["variants"]["thumb"]["jpeg"]) as stored:
+            self.assertEqual(Image.open(stored).convert("RGB").getpixel((8, 8)), (255, 255, 255))
+
+
+@override_settings(
+    **TEST_SETTINGS,
+    STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+    MEDIA_URL="/media/",
+    IMAGE_VARIANTS={"thumb": 16},
+    IMAGE_VARIANTS_ASYNC=False,
+    TIMELINE_FANOUT_ASYNC=False,
+    UPLOAD_MAX_BYTES=50_000,
+)
+class DirectUploadTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.user = make_user("user")
+        self.client.force_authenticate(self.user)
+
+    def slot(self, kind="post", content_type="image/jpeg", size=1000):
+        response = self.client.post(
+            "/api/uploads/", {"kind": kind, "content_type": content_type, "size": size}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()
+
+    def upload(self, slot, file):
+        self.assertEqual(slot["upload"]["method"], "POST")
+        return self.client.post(slot["upload"]["url"], {**slot["upload"]["fields"], "file": file}, format="multipart")
+
+    def create_post(self, token):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/posts/", {"content": "direct", "image_upload": token}, format="json")
+
+    def test_upload_then_create_post(self):
+        slot = self.slot()
+        self.assertTrue(slot["key"].startswith("uploads/post/") and slot["key"].endswith(".jpg"))
+        self.assertEqual(self.upload(slot, image_upload()).status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.create_post(slot["token"])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        post = Post.objects.get(id=response.json()["id"])
+        # A copy under the field's upload_to is attached; the slot's object is gone.
+        self.assertTrue(post.image.name.startswith("posts/") and post.image.name.endswith(".jpg"))
+        self.assertFalse(default_storage.exists(slot["key"]))
+        self.assertEqual(response.json()["image"], f"http://testserver/media/{post.image.name}")
+        self.assertEqual(post.image_variants["source"], post.image.name)  # variants were queued
+
+    def test_claimed_original_loses_its_location(self):
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        exif.get_ifd(0x8825)[2] = (52.0, 22.0, 7.0)  # GPSLatitude
+        slot = self.slot()
+        self.upload(slot, image_upload(exif=exif))
+
+        post = Post.objects.get(id=self.create_post(slot["token"]).json()["id"])
+
+        with post.image.open() as stored:
+            original = Image.open(stored)
+            self.assertEqual((original.format, original.size), ("JPEG", (200, 100)))
+            self.assertEqual(dict(original.getexif()), {})
+
+    def test_upload_that_is_not_an_image_is_rejected(self):
+        slot = self.slot()
+        self.upload(slot, SimpleUploadedFile("x.jpg", b"\xff\xd8\xff" + b"not an image", content_type="image/jpeg"))
+
+        response = self.create_post(slot["token"])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(default_storage.listdir("posts")[1], [])
+
+    def test_replayed_slot_cannot_replace_an_attached_image(self):
+        slot = self.slot()
+        self.upload(slot, image_upload())
+        post = Post.objects.get(id=self.create_post(slot["token"]).json()["id"])
+        with post.image.open() as attached:
+            verified = attached.read()
+
+        # The slot is still open: upload arbitrary bytes to it again.
+        junk = SimpleUploadedFile("x.jpg", b"\xff\xd8\xff" + b"not an image", content_type="image/jpeg")
+        self.assertEqual(self.upload(slot, junk).status_code, status.HTTP_204_NO_CONTENT)
+
+        with post.image.open() as attached:
+            self.assertEqual(attached.read(), verified)
+
+    def test_token_is_single_use_and_bound_to_user_and_kind(self):
+        slot = self.slot()
+        self.upload(slot, image_upload())
+        self.assertEqual(self.create_post(slot["token"]).status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self.create_post(slot["token"]).status_code, status.HTTP_400_BAD_REQUEST)
+
+        avatar = self.slot(kind="avatar")
+        self.upload(avatar, image_upload())
+        self.assertEqual(self.create_post(avatar["token"]).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(make_user("other"))
+        other = self.slot()
+        self.client.force_authenticate(self.user)
+        self.upload(other, image_upload())
+        self.assertEqual(self.create_post(other["token"]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.create_post("forged").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_content_not_matching_the_declared_type_is_rejected_and_deleted(self):
+        slot = self.slot(content_type="image/jpeg")
+        self.upload(slot, image_upload(name="photo.png", image_format="PNG"))
+
+        response = self.create_post(slot["token"])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(default_storage.exists(slot["key"]))
+        self.assertFalse(Post.objects.exists())
+
+    def test_missing_upload_is_rejected(self):
+        self.assertEqual(self.create_post(self.slot()["token"]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_slot_requests_are_validated(self):
+        for data in (
+            {"kind": "banner", "content_type": "image/jpeg", "size": 10},
+            {"kind": "post", "content_type": "image/svg+xml", "size": 10},
+            {"kind": "post", "content_type": "image/jpeg", "size": 50_001},
+        ):
+            response = self.client.post("/api/uploads/", data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+    def test_local_target_enforces_the_size_limit(self):
+        slot = self.slot()
+        big = SimpleUploadedFile("big.jpg", b"\xff\xd8\xff" + b"0" * 50_000, content_type="image/jpeg")
+
+        self.assertEqual(self.upload(slot, big).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(default_storage.exists(slot["key"]))
+
+    @override_settings(STORAGES={"default": {
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        "OPTIONS": {
+            "access_key": "test", "secret_key": "test", "bucket_name": "vibes-media",
+            "region_name": "us-east-1", "location": "media",
+        },
+    }})
+    def test_s3_slot_is_a_presigned_post(self):
+        slot = self.slot(content_type="image/png")
+
+        upload = slot["upload"]
+        self.assertEqual(upload["url"], "https://vibes-media.s3.amazonaws.com/")
+        self.assertEqual(upload["fields"]["key"], f"media/{slot['key']}")
+        self.assertEqual(upload["fields"]["Content-Type"], "image/png")
+        policy = json.loads(base64.b64decode(upload["fields"]["policy"]))
+        self.assertIn(["content-length-range", 1, 50_000], policy["conditions"])
+
+    @override_settings(STORAGES={"default": {
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+        "OPTIONS": {
+            "access_key": "test", "secret_key": "test", "bucket_name": "vibes-media",
+            "region_name": "us-east-1", "location": "media",
+        },
+    }})
+    def test_s3_claim_attaches_a_server_side_copy(self):
+        slot = self.slot(content_type="image/png")
+        client = default_storage.connection.meta.client
+
+        with mock.patch.object(client, "copy_object") as copy_object:
+            key = uploads.copy_upload(default_storage, slot["key"], "posts/final.png")
+
+        self.assertEqual(key, "posts/final.png")
+        copy_object.assert_called_once_with(
+            Bucket="vibes-media", Key="media/posts/final.png",
+            CopySource={"Bucket": "vibes-media", "Key": f"media/{slot['key']}"},
+        )
+
+
+S3_MEDIA = {"default": {
+    "BACKEND": "vibes_backend.storage.MediaStorage",
+    "OPTIONS": {"access_key": "test", "secret_key": "test", "bucket_name": "vibes-media", "region_name": "us-east-1"},
+}}
+
+
+@override_settings(**TEST_SETTINGS, STORAGES=S3_MEDIA, MEDIA_URL_CACHE_TTL=600, MEDIA_CDN_DOMAIN="")
+class MediaURLTests(APITestCase):
+
+    def setUp(self):
+        media_urls.clear()
+        self.addCleanup(media_urls.clear)
+        self.author = make_user("author")
+        Profile.objects.filter(id=self.author.id).update(profile_picture="user/profile_pics/author.jpg")
+        for i in range(3):
+            post = Post.objects.create(user=self.author, content=f"post {i}", image=f"posts/photo{i}.jpg")
+            Comment.objects.create(post=post, user=self.author, text="me again")
+        self.client.force_authenticate(self.author)
+
+    def render_feed(self):
+        with mock.patch.object(MediaStorage, "url", autospec=True, side_effect=MediaStorage.url) as url:
+            response = self.client.get("/api/posts/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()["results"], url.call_count
+
+    def test_signed_urls_are_reused(self):
+        posts, signed = self.render_feed()
+
+        self.assertEqual(signed, 4)  # one avatar, three post images
+        avatar = posts[0]["user_profile_picture"]
+        self.assertTrue(avatar.startswith("https://vibes-media.s3.amazonaws.com/media/user/profile_pics/author.jpg?"))
+        self.assertIn("Signature=", avatar)
+        self.assertEqual({p["user_profile_picture"] for p in posts}, {avatar})
+        self.assertEqual(posts[0]["comments"][0]["user_profile_picture"], avatar)
+
+        again, signed = self.render_feed()
+        self.assertEqual(signed, 0)
+        self.assertEqual(again, posts)
+
+    @override_settings(MEDIA_URL_CACHE_TTL=0)
+    def test_zero_ttl_signs_every_url(self):
+        _, signed = self.render_feed()
+
+        self.assertEqual(signed, 9)  # an avatar per post and per comment, plus the images
+
+    @override_settings(AWS_QUERYSTRING_EXPIRE=60)
+    def test_ttl_stays_within_half_the_signature_lifetime(self):
+        self.assertEqual(media_urls.ttl, 30)
+
+    # STORAGES again, so default_storage is rebuilt with (and after) the domain.
+    @override_settings(MEDIA_CDN_DOMAIN="cdn.example.com", STORAGES=S3_MEDIA)
+    def test_cdn_domain_serves_unsigned_urls(self):
+        posts, _ = self.render_feed()
+
+        self.assertEqual(posts[0]["user_profile_picture"], "https://cdn.example.com/media/user/profile_pics/author.jpg")
+        self.assertEqual(
+            {p["image"] for p in posts},
+            {f"https://cdn.example.com/media/posts/photo{i}.jpg" for i in range(3)},
+        )
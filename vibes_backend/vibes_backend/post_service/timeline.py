@@ -0,0 +1,200 @@
+"""
+Home timelines ("posts from people I follow").
+
+Timelines are materialized: when a post is created it is fanned out into a
+FeedEntry row for each follower, so reading a timeline is a single index
+range scan on (owner, created_at) no matter how many accounts the reader
+follows. Authors above TIMELINE_FANOUT_MAX_FOLLOWERS are not fanned out;
+their posts are flagged `fanout_on_read` and merged in when a timeline is
+read.
+
+Fan-out also pushes the new post to each recipient's user_<id> group.
+Fan-out, backfill (on follow) and unfill (on unfollow) run on the
+TIMELINE_CHANNEL channels worker:
+
+    python manage.py runworker timeline-fanout
+
+With TIMELINE_FANOUT_ASYNC = False they run inline after commit instead.
+"""
+import heapq
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from auth_service.models import Follow
+from vibes_backend.frames import with_text
+from .events import broadcast_event, user_group
+from .models import FeedEntry, Post
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_CHANNEL = "timeline-fanout"
+
+
+# ------------------------------------------------------
+#   WORK (runs on the worker)
+# ------------------------------------------------------
+def fan_out_post(post_id, payload=None):
+    """
+    Write `post_id` into the timelines of its author and the author's
+    followers, and push `payload` as a new_post event to each of them.
+    """
+    post = (
+        Post.objects.filter(pk=post_id).select_related("user")
+        .only("id", "user_id", "created_at", "user__followers_count").first()
+    )
+    if post is None:
+        return 0
+
+    # The denormalized count: no COUNT over a celebrity's followers per post.
+    if post.user.followers_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+        # Followers pick these up from the timeline endpoint; only the
+        # author's own sockets are told about it.
+        Post.objects.filter(pk=post.pk).update(fanout_on_read=True)
+        _push_new_post(payload, [post.user_id])
+        return 0
+
+    owner_ids = Follow.objects.filter(followed_id=post.user_id).values_list(
+        "follower_id", flat=True
+    ).iterator(chunk_size=settings.TIMELINE_FANOUT_BATCH_SIZE)
+    written = _insert_entries(post, [post.user_id], payload)
+    batch = []
+    for owner_id in owner_ids:
+        batch.append(owner_id)
+        if len(batch) >= settings.TIMELINE_FANOUT_BATCH_SIZE:
+            written += _insert_entries(post, batch, payload)
+            batch = []
+    if batch:
+        written += _insert_entries(post, batch, payload)
+    return written
+
+
+def backfill(follower_id, followed_id):
+    """Copy the followed user's recent posts into the follower's timeline."""
+    posts = (
+        Post.objects.filter(user_id=followed_id, fanout_on_read=False)
+        .order_by("-created_at", "-id")
+        .only("id", "created_at")[: settings.TIMELINE_BACKFILL_LIMIT]
+    )
+    entries = [
+        FeedEntry(owner_id=follower_id, post_id=post.pk, created_at=post.created_at)
+        for post in posts
+    ]
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def unfill(follower_id, followed_id):
+    """Remove the unfollowed user's posts from the follower's timeline."""
+    deleted, _ = FeedEntry.objects.filter(
+        owner_id=follower_id, post__user_id=followed_id
+    ).delete()
+    return deleted
+
+
+def _insert_entries(post, owner_ids, payload=None):
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(owner_id=owner_id, post_id=post.pk, created_at=post.created_at) for owner_id in owner_ids],
+        ignore_conflicts=True,
+    )
+    _push_new_post(payload, owner_ids)
+    return len(owner_ids)
+
+
+def _push_new_post(payload, owner_ids):
+    if payload is None:
+        return
+    # Encoded once for every recipient's sockets.
+    message = with_text({"type": "post_update", "event": "new_post", "post": payload})
+    for owner_id in owner_ids:
+        broadcast_event(user_group(owner_id), message)
+
+
+# ------------------------------------------------------
+#   DISPATCH (runs on the request path)
+# ------------------------------------------------------
+_HANDLERS = {
+    "timeline.fanout": lambda m: fan_out_post(m["post_id"], m.get("post")),
+    "timeline.backfill": lambda m: backfill(m["follower_id"], m["followed_id"]),
+    "timeline.unfill": lambda m: unfill(m["follower_id"], m["followed_id"]),
+}
+
+
+def run(message):
+    """Execute a timeline job message (called by the worker)."""
+    return _HANDLERS[message["type"]](message)
+
+
+def enqueue(message):
+    """
+    Hand a timeline job to the worker once the current transaction commits.
+    Falls back to running it inline if the channel layer is unavailable.
+    """
+    transaction.on_commit(lambda: _dispatch(message))
+
+
+def _dispatch(message):
+    if settings.TIMELINE_FANOUT_ASYNC:
+        try:
+            channel_layer = get_channel_layer()
+            if channel_layer:
+                async_to_sync(channel_layer.send)(TIMELINE_CHANNEL, message)
+                return
+        except Exception as e:
+            logger.warning(f"Failed to enqueue {message['type']}, running inline: {e}")
+    run(message)
+
+
+def schedule_fanout(post, payload=None):
+    enqueue({"type": "timeline.fanout", "post_id": post.pk, "post": payload})
+
+
+def schedule_backfill(follower_id, followed_id):
+    enqueue({"type": "timeline.backfill", "follower_id": follower_id, "followed_id": followed_id})
+
+
+def schedule_unfill(follower_id, followed_id):
+    enqueue({"type": "timeline.unfill", "follower_id": follower_id, "followed_id": followed_id})
+
+
+# ------------------------------------------------------
+#   READ
+# ------------------------------------------------------
+def home_timeline_positions(user, after=None, limit=20):
+    """
+    Return up to `limit` (created_at, post_id) pairs for `user`'s home
+    timeline, newest first, strictly after the `after` position.
+
+    Merges the materialized FeedEntry rows with fan-out-on-read posts from
+    high-follower accounts the user follows. Two bounded queries.
+    """
+    entries = FeedEntry.objects.filter(owner=user)
+    pulled = Post.objects.filter(
+        Q(user__in=Follow.objects.filter(follower=user).values("followed_id")) | Q(user=user),
+        fanout_on_read=True,
+    )
+    if after:
+        created_at, pk = after
+        entries = entries.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=pk)
+        )
+        pulled = pulled.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    entries = entries.order_by("-created_at", "-post_id").values_list("created_at", "post_id")[:limit]
+    pulled = pulled.order_by("-created_at", "-id").values_list("created_at", "id")[:limit]
+
+    positions, seen = [], set()
+    for position in heapq.merge(list(entries), list(pulled), reverse=True):
+        if position[1] in seen:
+            continue
+        seen.add(position[1])
+        positions.append(position)
+        if len(positions) == limit:
+            break
+    return positions
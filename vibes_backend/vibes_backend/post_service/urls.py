@@ -1,14 +1,10 @@
 from django.urls import path
-from .views import (
-    PostListCreateView,
-    PostLikeView,
-    PostUnlikeView,
-    CommentListCreateView,
-)
+from . import async_views, views
 
 urlpatterns = [
-    path('posts/', PostListCreateView.as_view(), name='post-list-create'),
-    path('posts/<int:pk>/like/', PostLikeView.as_view(), name='post-like'),
-    path('posts/<int:pk>/unlike/', PostUnlikeView.as_view(), name='post-unlike'),
-    path('posts/<int:pk>/comments/', CommentListCreateView.as_view(), name='post-comments'),
+    path('posts/', async_views.PostListCreateView.as_view(), name='post-list-create'),
+    path('timeline/', views.HomeTimelineView.as_view(), name='home-timeline'),
+    path('posts/<int:pk>/like/', async_views.PostLikeView.as_view(), name='post-like'),
+    path('posts/<int:pk>/unlike/', async_views.PostUnlikeView.as_view(), name='post-unlike'),
+    path('posts/<int:pk>/comments/', async_views.CommentListCreateView.as_view(), name='post-comments'),
 ]
@@ -7,11 +7,15 @@ from django.core.asgi import get_asgi_application
 django_asgi_app = get_asgi_application()
 
 # Import channels components after Django is set up
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 
 import post_service.routing
 import chat_service.routing
 from chat_service.middleware import JWTAuthMiddleware
+from chat_service.persistence import MESSAGE_WRITER_CHANNEL, MessageWriter
+from post_service.consumers import TimelineWorker
+from post_service.timeline import TIMELINE_CHANNEL
+from vibes_backend.images import IMAGE_CHANNEL, ImageWorker
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -21,4 +25,10 @@ application = ProtocolTypeRouter({
             chat_service.routing.websocket_urlpatterns
         )
     ),
+    # Background workers: python manage.py runworker timeline-fanout chat-persist image-variants
+    "channel": ChannelNameRouter({
+        TIMELINE_CHANNEL: TimelineWorker.as_asgi(),
+        MESSAGE_WRITER_CHANNEL: MessageWriter.as_asgi(),
+        IMAGE_CHANNEL: ImageWorker.as_asgi(),
+    }),
 })
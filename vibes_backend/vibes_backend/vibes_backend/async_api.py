@@ -0,0 +1,157 @@
+"""
+Async-native API views.
+
+DRF's APIView only runs sync handlers, so under Daphne every request holds a
+threadpool worker for its whole duration, including each blocking
+async_to_sync(group_send) round trip to Redis. AsyncAPIView is an APIView
+with its own async dispatch: it authenticates with the same SimpleJWT
+tokens, applies DRF's throttles, runs `async def` handlers on the event
+loop and awaits the channel layer directly. Being an APIView, it is still
+in the drf-spectacular schema; handlers describe their request and
+response with extend_schema, as there is no serializer_class to infer them
+from.
+
+Handlers return `json_response(...)`; anything that must run in one
+transaction (ORM writes that touch several rows) is still wrapped in a
+single sync_to_async hop by the caller. Responses are always JSON: there is
+no content negotiation or browsable API.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException, AuthenticationFailed, NotAuthenticated, ParseError,
+)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return JsonResponse(data, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+async def abroadcast(group: str, message: dict):
+    """Await a group_send on the channel layer. Fails silently if Redis is unavailable."""
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer:
+            await channel_layer.group_send(group, message)
+    except Exception as e:
+        logger.warning(f"Failed to broadcast event: {e}")
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """SimpleJWT authentication with the user lookup done on the async ORM."""
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        try:
+            user = await self.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
+
+
+class AsyncAPIView(APIView):
+    """
+    Base class for async JSON endpoints. Requires an authenticated user,
+    checks the view's throttle_classes (DEFAULT_THROTTLE_CLASSES unless
+    set), exposes the parsed request body as `request.data` and the query
+    string as `request.query_params`, and maps DRF exceptions / Http404 to
+    JSON error responses the same way APIView does.
+    """
+    authentication = AsyncJWTAuthentication()
+    # What dispatch() enforces, declared for the schema: the same tokens
+    # as the sync views.
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args, self.kwargs, self.request = args, kwargs, request
+        try:
+            request.user = await self.authenticate(request)
+            request.data = self.parse_body(request)
+            request.query_params = request.GET
+            await self.acheck_throttles(request)
+
+            handler = getattr(self, request.method.lower(), None)
+            if request.method.lower() not in self.http_method_names or handler is None:
+                return self.http_method_not_allowed(request, *args, **kwargs)
+            return await handler(request, *args, **kwargs)
+        except Http404:
+            return json_response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, (dict, list)) else {"detail": e.detail}
+            response = json_response(detail, status=e.status_code)
+            if isinstance(e, (AuthenticationFailed, NotAuthenticated)):
+                response["WWW-Authenticate"] = self.authentication.authenticate_header(request)
+            if getattr(e, "wait", None):
+                response["Retry-After"] = "%d" % e.wait
+            return response
+
+    async def options(self, request, *args, **kwargs):
+        response = HttpResponse()
+        response.headers["Allow"] = ", ".join(self.allowed_methods)
+        response.headers["Content-Length"] = "0"
+        return response
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        return json_response(
+            {"detail": f'Method "{request.method}" not allowed.'},
+            status=status.HTTP_405_METHOD_NOT_ALLOWED,
+        )
+
+    async def authenticate(self, request):
+        # Honour APIClient.force_authenticate() so tests can target either path.
+        forced = getattr(request, "_force_auth_user", None)
+        if forced is not None:
+            return forced
+
+        result = await self.authentication.aauthenticate(request)
+        if result is None:
+            raise NotAuthenticated()
+        return result[0]
+
+    async def acheck_throttles(self, request):
+        if self.throttle_classes:
+            # Throttles keep their history in the cache, through the sync API.
+            await sync_to_async(self.check_throttles)(request)
+
+    def parse_body(self, request):
+        if request.method in ("GET", "HEAD", "OPTIONS", "DELETE"):
+            return {}
+        if request.content_type == "application/json":
+            try:
+                return json.loads(request.body or b"{}")
+            except ValueError:
+                raise ParseError("JSON parse error.")
+        return request.POST
@@ -0,0 +1,144 @@
+"""
+Helpers for the `benchmark_*` management commands.
+
+Benchmarks run against a throwaway test database (created and destroyed
+around the run, like `manage.py test`), never against real data, and drive
+the Django ASGI handler in-process so no server or Redis is needed.
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from abc import ABCMeta, abstractmethod
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class BenchmarkCommand(BaseCommand, metaclass=ABCMeta):
+    """Management command base that wraps `run_benchmark` in a test database."""
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            # The default in-memory SQLite test database uses a shared cache,
+            # which fails concurrent writers with "table is locked" instead
+            # of waiting; a file database waits on the busy timeout. Write
+            # transactions that read first (the locked seq counter, see
+            # chat_service/sequence.py) must take the write lock up front
+            # too: SQLite fails a deferred transaction's lock upgrade with
+            # "database is locked" at once instead of waiting.
+            test_settings = connection.settings_dict.setdefault("TEST", {})
+            test_settings["NAME"] = os.path.join(tempfile.gettempdir(), "vibes_benchmark.sqlite3")
+            database_options = connection.settings_dict.setdefault("OPTIONS", {})
+            database_options.setdefault("timeout", 30)
+            database_options.setdefault("transaction_mode", "IMMEDIATE")
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run_benchmark(**options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @abstractmethod
+    def run_benchmark(self, **options):
+        """Seed the test database and write the results table."""
+
+    def write_table(self, headers, rows):
+        widths = [max(len(str(v)) for v in column) for column in zip(headers, *rows)]
+        for row in [headers, *rows]:
+            self.stdout.write("  ".join(str(v).rjust(w) for v, w in zip(row, widths)))
+
+
+class LatencyChannelLayer(InMemoryChannelLayer):
+    """In-memory channel layer that charges a fixed round-trip time per
+    group_send, standing in for the Redis hop of channels_redis."""
+
+    def __init__(self, latency=0.002, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    async def group_send(self, group, message):
+        await asyncio.sleep(self.latency)
+        await super().group_send(group, message)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (ms) for a list of per-request seconds."""
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def asgi_request(app, method, path, headers=None, body=b""):
+    """Issue one HTTP request against an ASGI app; returns (status, body)."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-length", str(len(body)).encode())]
+        + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    request_sent = False
+    disconnect = asyncio.Event()
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    disconnect.set()
+    return response["status"], response["body"]
+
+
+async def run_load(make_request, total, concurrency):
+    """
+    Call `make_request(i)` `total` times with at most `concurrency` in flight.
+    Each call returns an HTTP status. Returns (summary, error_count).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            status = await make_request(i)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return summarize(latencies, time.perf_counter() - started), errors
@@ -0,0 +1,33 @@
+"""
+Outbound WebSocket frames, encoded once per broadcast.
+
+A group_send delivers the same event to every socket in the group, so
+encoding in the consumer handler serializes one payload once per socket.
+Senders encode the frame clients will receive when they build the event
+and attach it as event["text"]; the handlers forward it untouched.
+
+orjson is used when it is installed; both encoders produce compact JSON.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_frame(payload):
+    """JSON text of a frame."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            pass  # e.g. Decimal; the stdlib encoder below handles it
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":"))
+
+
+def with_text(event, frame=None):
+    """`event` plus its pre-encoded frame: `frame`, or the event itself."""
+    return {**event, "text": encode_frame(event if frame is None else frame)}
@@ -0,0 +1,353 @@
+"""
+Resized variants of uploaded images (post images, chat images, avatars).
+
+Models declare the image with VariantImageField and a JSONField for what
+the pipeline records:
+
+    image = VariantImageField(upload_to='posts/', variants_field='image_variants', ...)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
+
+When a new upload is committed to storage, once the transaction commits
+the field queues an "image.variants" job on the IMAGE_CHANNEL worker:
+
+    python manage.py runworker image-variants
+
+The worker re-encodes the image as WebP and JPEG per IMAGE_VARIANTS size
+(thumb, feed, full; never upscaled), applying the EXIF orientation and
+dropping all metadata (EXIF, GPS, ICC). It records the variant keys, the
+original dimensions, a blurhash and the average color in the JSON field.
+Jobs are keyed by the file name, so a job whose image was replaced in the
+meantime does nothing. If the channel layer is unavailable the job runs
+on a small in-process thread pool instead; with IMAGE_VARIANTS_ASYNC =
+False it runs inline.
+
+Serializers expose the result with ImageVariantsField. It is None until
+the variants exist, and the original stays available as before.
+
+The original is stored without metadata too: without_metadata() re-saves
+it, upright, in its own format before it is first stored, for files
+uploaded through the field (pre_save) and for direct uploads when they are
+claimed (uploads.claim()). Otherwise its URL would still hand out the
+EXIF/GPS data the variants drop.
+"""
+import io
+import logging
+import math
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.consumer import SyncConsumer
+from channels.layers import get_channel_layer
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, models, transaction
+from django.db.models.fields.files import ImageFieldFile
+from PIL import Image, ImageOps, JpegImagePlugin
+from rest_framework import serializers
+
+from .media import storage_url
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CHANNEL = "image-variants"
+FORMATS = (("webp", "WEBP", "webp"), ("jpeg", "JPEG", "jpg"))
+# Image.info entries that are metadata rather than pixels
+METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp", "comment")
+
+_pool = None
+
+
+# ------------------------------------------------------
+#   ORIGINALS (run before the upload is stored)
+# ------------------------------------------------------
+def without_metadata(file):
+    """
+    A ContentFile of the image in `file` re-saved in its own format without
+    metadata (EXIF, GPS, ICC, XMP, comments), turned upright by its EXIF
+    orientation first. Animated images keep their frames and are not turned;
+    multi-picture JPEGs keep their first picture. Raises what Pillow raises
+    for a file it can't read.
+    """
+    file.seek(0)
+    source = Image.open(file)
+    image_format = "JPEG" if source.format == "MPO" else source.format
+    options = {}
+    if getattr(source, "is_animated", False) and image_format != "JPEG":
+        image = source
+        options["save_all"] = True
+    else:
+        image = ImageOps.exif_transpose(source)
+    if image_format == "JPEG":
+        # The upload's own quantization, so re-saving loses as little as it can.
+        options.update(qtables=source.quantization, subsampling=JpegImagePlugin.get_sampling(source))
+    for key in METADATA_KEYS:
+        image.info.pop(key, None)
+
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+# ------------------------------------------------------
+#   PROCESSING (runs on the worker)
+# ------------------------------------------------------
+def build_variants(storage, name):
+    """Write the variants of the stored image `name`; returns the metadata to record."""
+    with storage.open(name) as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    prefix = posixpath.join(posixpath.dirname(name), "variants", stem)
+    variants = {}
+    for variant, edge in settings.IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        files = {"width": resized.width, "height": resized.height}
+        for key, image_format, extension in FORMATS:
+            encoded = resized if image_format == "WEBP" or not has_alpha else flatten(resized)
+            buffer = io.BytesIO()
+            # No exif/icc_profile arguments: the variants carry no metadata.
+            encoded.save(buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY)
+            files[key] = storage.save(f"{prefix}/{variant}.{extension}", ContentFile(buffer.getvalue()))
+        variants[variant] = files
+
+    return {
+        "source": name,
+        "width": image.width,
+        "height": image.height,
+        "blurhash": blurhash(image),
+        "color": average_color(image),
+        "variants": variants,
+    }
+
+
+def flatten(image, background=(255, 255, 255)):
+    """An RGBA image composited on `background`, for formats without alpha."""
+    flat = Image.new("RGB", image.size, background)
+    flat.paste(image, mask=image.getchannel("A"))
+    return flat
+
+
+def average_color(image):
+    red, green, blue = image.convert("RGB").resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    return f"#{red:02x}{green:02x}{blue:02x}"
+
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value, length):
+    return "".join(BASE83[value // 83 ** (length - i) % 83] for i in range(1, length + 1))
+
+
+def _to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value):
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """The BlurHash (blurha.sh) of an image, computed on a 32px copy."""
+    small = image.convert("RGB")
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(_to_linear(channel) for channel in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            total = [0.0, 0.0, 0.0]
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[x] * cos_y[y]
+                    pixel = pixels[row + x]
+                    total[0] += basis * pixel[0]
+                    total[1] += basis * pixel[1]
+                    total[2] += basis * pixel[2]
+            factors.append([channel * scale for channel in total])
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(v) for f in ac for v in f) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        signed_root = math.copysign(abs(value / max_value) ** 0.5, value)
+        return max(0, min(18, int(signed_root * 9 + 9.5)))
+
+    for factor in ac:
+        red, green, blue = (quantise(value) for value in factor)
+        result += _base83(red * 19 * 19 + green * 19 + blue, 2)
+    return result
+
+
+def run(message):
+    """Execute an "image.variants" job (called by the worker)."""
+    model = apps.get_model(message["model"])
+    field = model._meta.get_field(message["field"])
+    current = model.objects.filter(**{field.attname: message["name"]})
+    if not current.exists():
+        return None  # replaced or deleted since the upload
+
+    try:
+        meta = build_variants(field.storage, message["name"])
+    except Exception as e:
+        logger.warning(f"Failed to build variants of {message['name']}: {e}")
+        return None
+    current.update(**{field.variants_field: meta})
+    return meta
+
+
+class ImageWorker(SyncConsumer):
+    """
+    Background worker for image variants, bound to IMAGE_CHANNEL.
+
+    Run with: python manage.py runworker image-variants
+    """
+
+    def image_variants(self, message):
+        run(message)
+
+
+# ------------------------------------------------------
+#   DISPATCH (runs on the request path)
+# ------------------------------------------------------
+def schedule_variants(model_label, field_name, name):
+    """Queue the variants of an uploaded file once the current transaction commits."""
+    message = {"type": "image.variants", "model": model_label, "field": field_name, "name": name}
+    transaction.on_commit(lambda: _dispatch(message))
+
+
+def process_variants(instance, field_name):
+    """
+    Queue the variants of a saved instance's image that was stored without
+    going through the field, e.g. uploaded straight to storage (uploads.py).
+    """
+    file = getattr(instance, field_name)
+    if file:
+        schedule_variants(instance._meta.label, field_name, file.name)
+
+
+def _dispatch(message):
+    if settings.IMAGE_VARIANTS_ASYNC:
+        try:
+            channel_layer = get_channel_layer()
+            if channel_layer:
+                async_to_sync(channel_layer.send)(IMAGE_CHANNEL, message)
+                return
+        except Exception as e:
+            logger.warning(f"Failed to enqueue image variants, using the local pool: {e}")
+        _local_pool().submit(_run_in_pool, message)
+        return
+    run(message)
+
+
+def _local_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(settings.IMAGE_WORKER_THREADS, thread_name_prefix="image-variants")
+    return _pool
+
+
+def _run_in_pool(message):
+    try:
+        run(message)
+    finally:
+        close_old_connections()
+
+
+# ------------------------------------------------------
+#   MODEL AND SERIALIZER FIELDS
+# ------------------------------------------------------
+class VariantImageFieldFile(ImageFieldFile):
+
+    def delete(self, save=True):
+        """Delete the variants along with the image."""
+        meta = getattr(self.instance, self.field.variants_field)
+        if meta and meta.get("source") == self.name:
+            for files in meta["variants"].values():
+                for key, _, _ in FORMATS:
+                    self.storage.delete(files[key])
+        setattr(self.instance, self.field.variants_field, None)
+        super().delete(save)
+
+
+class VariantImageField(models.ImageField):
+    """An ImageField whose new uploads get resized variants, recorded in `variants_field`."""
+    attr_class = VariantImageFieldFile
+
+    def __init__(self, *args, variants_field=None, **kwargs):
+        self.variants_field = variants_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["variants_field"] = self.variants_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        uploaded = bool(file) and not file._committed
+        if uploaded:
+            file.file = without_metadata(file)
+        file = super().pre_save(model_instance, add)
+        if uploaded:
+            schedule_variants(model_instance._meta.label, self.name, file.name)
+        return file
+
+
+def variant_urls(file, meta, request=None):
+    """A processed image's metadata with variant URLs; None until its variants exist."""
+    if not file or not meta or meta.get("source") != file.name:
+        return None
+
+    return {
+        "width": meta["width"],
+        "height": meta["height"],
+        "blurhash": meta["blurhash"],
+        "color": meta["color"],
+        "variants": {
+            variant: {
+                "width": files["width"],
+                "height": files["height"],
+                **{key: storage_url(file.storage, files[key], request) for key, _, _ in FORMATS},
+            }
+            for variant, files in meta["variants"].items()
+        },
+    }
+
+
+class ImageVariantsField(serializers.Field):
+    """Read-only: variant_urls() of the object's VariantImageField `image_field`."""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(source="*", read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        field = instance._meta.get_field(self.image_field)
+        return variant_urls(
+            getattr(instance, field.attname),
+            getattr(instance, field.variants_field),
+            self.context.get("request"),
+        )
@@ -0,0 +1,106 @@
+"""
+URLs of stored media (post and chat images, avatars and their variants).
+
+Serializers, views and socket payloads build these URLs with media_url()
+(or MediaImageField / MediaURLField in serializers) rather than calling
+`file.url` row by row. With S3 every storage url() call presigns the URL,
+so a feed page with avatars, post images and variants would otherwise
+sign hundreds of URLs per request.
+
+- Signed mode (default): each file's URL is kept in an in-process LRU for
+  MEDIA_URL_CACHE_TTL seconds, capped at half the signature lifetime
+  (AWS_QUERYSTRING_EXPIRE) so a cached URL is always handed out with at
+  least half of its validity left. MEDIA_URL_CACHE_TTL = 0 turns it off.
+- CDN mode: with MEDIA_CDN_DOMAIN set, MediaStorage builds plain unsigned
+  https://<domain>/media/<key> URLs (storage.py). They are cached the same
+  way; building them is cheap anyway.
+
+Entries are keyed by file name: all media fields share the default storage,
+and a name keeps its URL for as long as the file exists.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import serializers
+
+
+class MediaURLCache:
+    """In-process LRU of file name -> URL with a TTL, bounded to MEDIA_URL_CACHE_SIZE entries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def ttl(self):
+        expire = getattr(settings, "AWS_QUERYSTRING_EXPIRE", 3600)
+        return min(settings.MEDIA_URL_CACHE_TTL, expire // 2)
+
+    def get(self, name):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            expires_at, url = entry
+            if expires_at <= time.monotonic():
+                del self._entries[name]
+                return None
+            self._entries.move_to_end(name)
+            return url
+
+    def set(self, name, url):
+        ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[name] = (time.monotonic() + ttl, url)
+            self._entries.move_to_end(name)
+            while len(self._entries) > settings.MEDIA_URL_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+media_urls = MediaURLCache()
+
+
+def storage_url(storage, name, request=None):
+    """The (cached) URL of `name` in `storage`; absolute when `request` is given."""
+    url = media_urls.get(name)
+    if url is None:
+        url = storage.url(name)
+        media_urls.set(name, url)
+    # S3 and CDN URLs are absolute already; only local MEDIA_URL paths need the host.
+    if request is not None and url.startswith("/"):
+        return request.build_absolute_uri(url)
+    return url
+
+
+def media_url(file, request=None):
+    """The URL of a FieldFile, or None when it is empty."""
+    if not file:
+        return None
+    return storage_url(file.storage, file.name, request)
+
+
+class MediaImageField(serializers.ImageField):
+    """An ImageField represented by media_url(), for writable image fields."""
+
+    def to_representation(self, value):
+        return media_url(value, self.context.get("request"))
+
+
+class MediaURLField(serializers.Field):
+    """Read-only: media_url() of the file at `source`, e.g. source='user.profile_picture'."""
+
+    def __init__(self, **kwargs):
+        super().__init__(read_only=True, **kwargs)
+
+    def to_representation(self, value):
+        return media_url(value, self.context.get("request"))
@@ -0,0 +1,32 @@
+"""
+In-process counters for the WebSocket layer. Each worker process keeps
+its own; staff can read this process's at GET /chat/metrics/.
+
+    typing_frames_received   typing frames sent by clients
+    typing_frames_forwarded  typing events published to conversation groups
+    ws_frames_queued         frames put on a connection's send queue
+    ws_frames_dropped        feed/typing frames dropped for a newer one
+    ws_slow_consumers_evicted  connections closed for falling behind
+    chat_messages_replayed   missed messages sent to resuming chat sockets
+    chat_resyncs             resumes too far behind, told to refetch history
+"""
+import threading
+from collections import Counter
+
+_lock = threading.Lock()
+_counts = Counter()
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counts[name] += amount
+
+
+def snapshot():
+    with _lock:
+        return dict(_counts)
+
+
+def reset():
+    with _lock:
+        _counts.clear()
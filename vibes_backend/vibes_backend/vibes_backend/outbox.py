@@ -0,0 +1,135 @@
+"""
+Bounded per-connection send queues for WebSocket consumers.
+
+Group events are queued on the connection and written by one task, so a
+consumer keeps draining its channel-layer queue however slowly the client
+reads. The task lives as long as the connection and is woken per frame;
+starting one per frame instead cost more than the broadcast itself on
+sockets that are keeping up. What the queue may hold is bounded:
+
+- Droppable frames (feed updates, typing) are capped at WS_FEED_QUEUE_SIZE;
+  a new one pushes out the oldest queued droppable frame.
+- Other frames (chat messages, receipts, acks) are never dropped. A
+  connection with WS_SEND_QUEUE_LIMIT frames queued is a slow consumer: it
+  is sent {"type": "evicted", "resume": <token>} and closed with code 4008.
+
+The resume token (see read_resume_token()) is signed and names the user
+and, per conversation, the seq of the last chat message written to the
+socket. The client reconnects with it as the handshake's `resume`
+parameter and is replayed what it missed, as with `last_seq` (see
+ChatSocketMixin.resume_points()). It goes in a frame, not the close
+reason: servers cut close reasons to 123 bytes, which the token passes
+once the socket has seen a handful of conversations. A client that can't
+read even that frame within EVICTED_FRAME_TIMEOUT seconds is closed
+without it and resumes from the seqs it saw itself.
+
+The queue only backs up when the server applies write backpressure to
+`send` (e.g. uvicorn with websockets). Daphne hands each frame to its
+transport and returns at once, buffering what the client hasn't read
+itself, so under Daphne the queue drains as fast as it fills and no
+connection is evicted; the queue is then only the bound on frames waiting
+between two writes.
+"""
+import asyncio
+from collections import deque
+
+from django.conf import settings
+from django.core import signing
+
+from . import metrics
+from .frames import encode_frame
+
+EVICTED_CLOSE_CODE = 4008
+EVICTED_FRAME_TIMEOUT = 5
+RESUME_TOKEN_SALT = "ws-resume"
+
+
+def make_resume_token(user_id, seqs):
+    return signing.dumps([user_id, seqs], salt=RESUME_TOKEN_SALT, compress=True)
+
+
+def read_resume_token(token):
+    """
+    (user_id, {conversation_id: last seq written}); raises
+    signing.BadSignature when invalid or expired.
+    """
+    user_id, seqs = signing.loads(token, salt=RESUME_TOKEN_SALT, max_age=settings.WS_RESUME_TOKEN_MAX_AGE)
+    # JSON made the conversation ids strings.
+    return user_id, {int(conversation_id): seq for conversation_id, seq in seqs.items()}
+
+
+class OutboxMixin:
+    """
+    For AsyncWebsocketConsumer subclasses: queue_frame() instead of send()
+    for group events. Replies to the client's own frames can still use
+    send() directly.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (droppable, text, (conversation_id, seq) of a chat message or None)
+        self.outbox = deque()
+        self.droppable_queued = 0
+        self.outbox_writer = None
+        self.outbox_ready = asyncio.Event()
+        # {conversation_id: seq of the last chat message written}
+        self.written_seqs = {}
+        self.evicted = False
+
+    async def queue_frame(self, text, droppable=False, position=None):
+        if self.evicted:
+            return
+
+        if droppable and self.droppable_queued >= settings.WS_FEED_QUEUE_SIZE:
+            for index, (queued_droppable, _, _) in enumerate(self.outbox):
+                if queued_droppable:
+                    del self.outbox[index]
+                    self.droppable_queued -= 1
+                    metrics.incr("ws_frames_dropped")
+                    break
+
+        if len(self.outbox) >= settings.WS_SEND_QUEUE_LIMIT:
+            await self.evict()
+            return
+
+        self.outbox.append((droppable, text, position))
+        self.droppable_queued += droppable
+        metrics.incr("ws_frames_queued")
+        if self.outbox_writer is None or self.outbox_writer.done():
+            self.outbox_writer = asyncio.ensure_future(self.write_outbox())
+        self.outbox_ready.set()
+
+    async def write_outbox(self):
+        while True:
+            await self.outbox_ready.wait()
+            self.outbox_ready.clear()
+            while self.outbox:
+                droppable, text, position = self.outbox.popleft()
+                self.droppable_queued -= droppable
+                await self.send(text_data=text)
+                if position is not None:
+                    conversation_id, seq = position
+                    self.written_seqs[conversation_id] = max(seq, self.written_seqs.get(conversation_id, 0))
+
+    def resume_token(self):
+        return make_resume_token(self.user.id if self.user else None, self.written_seqs)
+
+    async def evict(self):
+        """Close a connection that can't keep up, handing it a resume token first."""
+        self.evicted = True
+        metrics.incr("ws_slow_consumers_evicted")
+        self.outbox.clear()
+        self.droppable_queued = 0
+        if self.outbox_writer is not None:
+            self.outbox_writer.cancel()
+        frame = encode_frame({"type": "evicted", "resume": self.resume_token()})
+        try:
+            await asyncio.wait_for(self.send(text_data=frame), EVICTED_FRAME_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        await self.close(code=EVICTED_CLOSE_CODE)
+
+    async def websocket_disconnect(self, message):
+        if self.outbox_writer is not None:
+            self.outbox_writer.cancel()
+        await super().websocket_disconnect(message)
@@ -93,6 +93,20 @@ DATABASES = {
     )
 }
 
+# "default" is local to each process. "shared" lives on the channel
+# layer's Redis and is seen by every process: anything processes must agree
+# on (presence, and the optional shared caches below) goes there.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379'),
+        'KEY_PREFIX': 'vibes',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -178,12 +192,128 @@ SPECTACULAR_SETTINGS = {
         "VERSION": "2.0.0",
 	}
 
+# Feed pagination
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', '20'))
+FEED_MAX_PAGE_SIZE = int(os.getenv('FEED_MAX_PAGE_SIZE', '50'))
+FEED_COMMENTS_PREVIEW = int(os.getenv('FEED_COMMENTS_PREVIEW', '3'))
+
+# Follower / following list pagination
+FOLLOW_PAGE_SIZE = int(os.getenv('FOLLOW_PAGE_SIZE', '50'))
+FOLLOW_MAX_PAGE_SIZE = int(os.getenv('FOLLOW_MAX_PAGE_SIZE', '200'))
+
+# Home timeline fan-out
+# Authors with more followers than this are merged in at read time instead.
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.getenv('TIMELINE_FANOUT_MAX_FOLLOWERS', '5000'))
+TIMELINE_FANOUT_BATCH_SIZE = int(os.getenv('TIMELINE_FANOUT_BATCH_SIZE', '1000'))
+TIMELINE_BACKFILL_LIMIT = int(os.getenv('TIMELINE_BACKFILL_LIMIT', '50'))
+# Run fan-out on the "timeline-fanout" channels worker; False runs it inline.
+TIMELINE_FANOUT_ASYNC = os.getenv('TIMELINE_FANOUT_ASYNC', 'True').lower() in ('true', '1', 'yes')
+
+# Seconds to buffer like/unlike/comment events per post before broadcasting
+# them as one "posts_updated" message; 0 broadcasts immediately.
+POST_EVENT_COALESCE_WINDOW = float(os.getenv('POST_EVENT_COALESCE_WINDOW', '0.5'))
+
+# Maximum number of posts one feed socket can subscribe to at a time.
+POSTS_MAX_SUBSCRIPTIONS = int(os.getenv('POSTS_MAX_SUBSCRIPTIONS', '200'))
+
+# WebSocket handshake user cache: seconds a resolved user is reused (0 turns
+# it off), per-process entry limit, and an optional CACHES alias shared
+# between processes.
+WS_AUTH_CACHE_TTL = int(os.getenv('WS_AUTH_CACHE_TTL', '60'))
+WS_AUTH_CACHE_SIZE = int(os.getenv('WS_AUTH_CACHE_SIZE', '10000'))
+WS_AUTH_SHARED_CACHE = os.getenv('WS_AUTH_SHARED_CACHE', '')
+
+# Per-conversation participant sets ChatConsumer checks on connect and chat
+# events are delivered to: a CACHES alias shared by all processes
+# (Redis/Memcached, never a per-process cache; empty turns it off and each
+# lookup queries the membership table) and their lifetime (seconds).
+CHAT_MEMBERSHIP_CACHE = os.getenv('CHAT_MEMBERSHIP_CACHE', '')
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.getenv('CHAT_MEMBERSHIP_CACHE_TTL', '300'))
+
+# Bulk follow status (auth_service/following.py): most ids per request, and
+# an optional CACHES alias (empty turns it off), lifetime (seconds) and size
+# limit of the cached per-user following sets.
+FOLLOW_STATUS_MAX_IDS = int(os.getenv('FOLLOW_STATUS_MAX_IDS', '200'))
+FOLLOWING_CACHE = os.getenv('FOLLOWING_CACHE', '')
+FOLLOWING_CACHE_TTL = int(os.getenv('FOLLOWING_CACHE_TTL', '300'))
+FOLLOWING_CACHE_MAX_SIZE = int(os.getenv('FOLLOWING_CACHE_MAX_SIZE', '5000'))
+
+# Write-behind chat messages: broadcast socket messages straight away and
+# persist them in batches on the "chat-persist" worker. A worker crash
+# loses at most one unflushed batch (BATCH_SIZE messages / FLUSH_INTERVAL s).
+# Message ids are then assigned by the server, not the database, and every
+# process running at the same time (web and workers, at most 32) needs its
+# own CHAT_NODE_ID (0-31), or their ids collide; processes refuse to start
+# without one (chat_service/ids.py). Turning write-behind off again needs
+# the id sequence moved past those ids first (manage.py sqlsequencereset
+# chat_service), or new ids sort before them.
+CHAT_NODE_ID = os.getenv('CHAT_NODE_ID')
+CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'False').lower() in ('true', '1', 'yes')
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv('CHAT_WRITE_BEHIND_BATCH_SIZE', '500'))
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', '0.05'))
+# Flushes a message is retried for after transient database errors.
+CHAT_WRITE_BEHIND_MAX_RETRIES = int(os.getenv('CHAT_WRITE_BEHIND_MAX_RETRIES', '5'))
+
+# Typing indicators: ChatConsumer forwards state changes, plus a keepalive
+# every KEEPALIVE seconds while typing goes on; typing ends by itself after
+# TIMEOUT seconds without a frame from the client.
+CHAT_TYPING_KEEPALIVE = float(os.getenv('CHAT_TYPING_KEEPALIVE', '3'))
+CHAT_TYPING_TIMEOUT = float(os.getenv('CHAT_TYPING_TIMEOUT', '6'))
+
+# Image variants (vibes_backend/images.py): longest edge in pixels of each
+# WebP/JPEG variant made of uploaded post, chat and profile images, and the
+# encoder quality. Processing runs on the "image-variants" channels worker,
+# or on IMAGE_WORKER_THREADS local threads when the channel layer is down;
+# IMAGE_VARIANTS_ASYNC = False runs it inline after commit.
+IMAGE_VARIANTS = {"thumb": 160, "feed": 1080, "full": 2048}
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', '80'))
+IMAGE_VARIANTS_ASYNC = os.getenv('IMAGE_VARIANTS_ASYNC', 'True').lower() in ('true', '1', 'yes')
+IMAGE_WORKER_THREADS = int(os.getenv('IMAGE_WORKER_THREADS', '2'))
+
+# Direct-to-storage uploads (vibes_backend/uploads.py): largest accepted
+# image, seconds an upload slot stays open, and seconds the client then has
+# to attach the upload to a post, message or profile.
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_SLOT_EXPIRY = int(os.getenv('UPLOAD_SLOT_EXPIRY', '900'))
+UPLOAD_TOKEN_MAX_AGE = int(os.getenv('UPLOAD_TOKEN_MAX_AGE', '3600'))
+
+# Media URLs (vibes_backend/media.py): seconds a file's signed URL is reused
+# (0 turns it off; never more than half of AWS_QUERYSTRING_EXPIRE) and the
+# per-process entry limit. MEDIA_CDN_DOMAIN, e.g. a CloudFront distribution
+# in front of the bucket, switches media to unsigned URLs on that domain.
+MEDIA_URL_CACHE_TTL = int(os.getenv('MEDIA_URL_CACHE_TTL', '1800'))
+MEDIA_URL_CACHE_SIZE = int(os.getenv('MEDIA_URL_CACHE_SIZE', '10000'))
+MEDIA_CDN_DOMAIN = os.getenv('MEDIA_CDN_DOMAIN', '')
+
+# Most missed messages a reconnecting socket gets replayed (by seq, see
+# chat_service/sequence.py) before it is told to refetch history.
+CHAT_REPLAY_LIMIT = int(os.getenv('CHAT_REPLAY_LIMIT', '500'))
+
+# Per-connection WebSocket send queues (vibes_backend/outbox.py): queued
+# feed/typing frames kept before the oldest is dropped, total frames queued
+# before the client is disconnected, and how long the resume token it gets
+# stays valid.
+WS_FEED_QUEUE_SIZE = int(os.getenv('WS_FEED_QUEUE_SIZE', '100'))
+WS_SEND_QUEUE_LIMIT = int(os.getenv('WS_SEND_QUEUE_LIMIT', '1000'))
+WS_RESUME_TOKEN_MAX_AGE = int(os.getenv('WS_RESUME_TOKEN_MAX_AGE', '600'))
+
+# Presence (auth_service/presence.py): CACHES alias shared by all processes
+# (never a per-process cache, or each process sees only its own sockets),
+# how often each process refreshes its users and flushes last_seen, how long
+# a user stays online without a heartbeat, and the bulk lookup limit.
+PRESENCE_CACHE = os.getenv('PRESENCE_CACHE', 'shared')
+PRESENCE_HEARTBEAT_INTERVAL = float(os.getenv('PRESENCE_HEARTBEAT_INTERVAL', '30'))
+PRESENCE_TIMEOUT = int(os.getenv('PRESENCE_TIMEOUT', '75'))
+PRESENCE_LOOKUP_MAX = int(os.getenv('PRESENCE_LOOKUP_MAX', '200'))
+
 ASGI_APPLICATION = "vibes_backend.asgi.application"
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
             "hosts": [os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')],
+            # Queued chat messages wait here for the write-behind worker.
+            "channel_capacity": {"chat-persist": 10000},
         },
     },
 }
@@ -193,7 +323,6 @@ CHANNEL_LAYERS = {
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
-AWS_s3_CUSTOM_DOMAIN = f"{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com"
 AWS_S3_SIGNATURE_NAME = "s3v4"
 AWS_S3_REGION_NAME = "us-east-1"
 AWS_S3_FILE_OVERWRITE = False
@@ -4,6 +4,12 @@ from django.conf import settings
 class MediaStorage(S3Boto3Storage):
     location = 'media'
 
+    def __init__(self, **kwargs):
+        # Public CDN mode: unsigned URLs on MEDIA_CDN_DOMAIN (see media.py).
+        if settings.MEDIA_CDN_DOMAIN:
+            kwargs.setdefault('custom_domain', settings.MEDIA_CDN_DOMAIN)
+        super().__init__(**kwargs)
+
 
 class StaticFileStorage(S3Boto3Storage):
     location = 'static'    
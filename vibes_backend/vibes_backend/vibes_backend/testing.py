@@ -0,0 +1,31 @@
+"""
+Fixtures shared by the apps' test modules.
+"""
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+TEST_SETTINGS = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    "PASSWORD_HASHERS": ["django.contrib.auth.hashers.MD5PasswordHasher"],
+    # One process: the local cache stands in for the shared Redis one.
+    "PRESENCE_CACHE": "default",
+    "POST_EVENT_COALESCE_WINDOW": 0,
+}
+
+
+def make_user(username):
+    return get_user_model().objects.create_user(
+        email=f"{username}@example.com",
+        password="password123",
+        fullname=username.title(),
+        username=username,
+    )
+
+
+def image_upload(name="photo.jpg", size=(200, 100), color=(200, 30, 30), image_format="JPEG", exif=None):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, image_format, **({"exif": exif} if exif else {}))
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{image_format.lower()}")
@@ -0,0 +1,224 @@
+"""
+Direct-to-storage uploads for post images, chat images and avatars.
+
+Instead of sending image bytes through the API (and on to S3 from there),
+a client:
+
+1. asks for an upload slot, POST /api/uploads/
+       {"kind": "post" | "message" | "avatar", "content_type": "image/jpeg", "size": 123456}
+   and gets {"key", "token", "expires_in", "upload": {"method", "url", "fields"}};
+2. uploads the file straight to storage: a multipart POST of the `fields`
+   plus the file (as "file", last) to `url`, before `expires_in` seconds;
+3. creates the post / message / avatar with the token in place of the
+   file: "image_upload" for posts and messages, "profile_picture_upload"
+   for the avatar.
+
+With S3 the slot is a presigned POST whose policy pins the key, the content
+type and UPLOAD_MAX_BYTES, so S3 itself rejects anything else. Storages
+without presigned uploads (FileSystemStorage in development and tests) get
+a slot on LocalUploadView, which accepts the same POST through Django.
+
+Slots are staging keys under UPLOAD_PREFIX, and stay writable until they
+expire (a presigned POST can be replayed). So claim() never attaches the
+slot's object: it copies it to a new key under the field's upload_to, one
+the client has no credential for, deletes the staging object and checks
+the copy: the token is signed for this user and kind, the size is within
+UPLOAD_MAX_BYTES and the first bytes are those of the declared image
+format. Only then is the whole copy read, to re-save it without its
+metadata (images.without_metadata()); a copy that fails the check or
+can't be read as an image is deleted. Every claim attaches its own copy,
+so nothing can be swapped under an attached image and two claims of one
+upload never share a file.
+"""
+import posixpath
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from .images import without_metadata
+
+UPLOAD_TOKEN_SALT = "direct-upload"
+# Where slots put uploads until they are claimed; worth an expiry rule on S3.
+UPLOAD_PREFIX = "uploads"
+
+# kind -> (model, VariantImageField)
+UPLOAD_KINDS = {
+    "post": ("post_service.Post", "image"),
+    "message": ("chat_service.Message", "image"),
+    "avatar": ("auth_service.Profile", "profile_picture"),
+}
+
+# content type -> (file extension, test on the first bytes of the file)
+CONTENT_TYPES = {
+    "image/jpeg": ("jpg", lambda head: head.startswith(b"\xff\xd8\xff")),
+    "image/png": ("png", lambda head: head.startswith(b"\x89PNG\r\n\x1a\n")),
+    "image/gif": ("gif", lambda head: head[:6] in (b"GIF87a", b"GIF89a")),
+    "image/webp": ("webp", lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP"),
+}
+HEAD_BYTES = 16
+
+
+def upload_field(kind):
+    model_label, field_name = UPLOAD_KINDS[kind]
+    model = apps.get_model(model_label)
+    return model, model._meta.get_field(field_name)
+
+
+def make_slot(request, kind, content_type):
+    """A new upload slot for `kind` (see the module docstring for its shape)."""
+    _, field = upload_field(kind)
+    extension, _ = CONTENT_TYPES[content_type]
+    key = posixpath.join(UPLOAD_PREFIX, kind, f"{uuid.uuid4().hex}.{extension}")
+    token = signing.dumps(
+        {"user": request.user.id, "kind": kind, "key": key, "content_type": content_type},
+        salt=UPLOAD_TOKEN_SALT,
+    )
+    expires_in = settings.UPLOAD_SLOT_EXPIRY
+
+    if isinstance(field.storage, S3Boto3Storage):
+        storage = field.storage
+        upload = storage.connection.meta.client.generate_presigned_post(
+            storage.bucket_name,
+            posixpath.join(storage.location, key),
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, settings.UPLOAD_MAX_BYTES],
+            ],
+            ExpiresIn=expires_in,
+        )
+    else:
+        upload = {"url": request.build_absolute_uri(reverse("upload-target", args=[token])), "fields": {}}
+
+    return {
+        "key": key,
+        "token": token,
+        "expires_in": expires_in,
+        "upload": {"method": "POST", "url": upload["url"], "fields": upload["fields"]},
+    }
+
+
+def read_head(storage, key):
+    """The first HEAD_BYTES of a stored object, without fetching the rest."""
+    if isinstance(storage, S3Boto3Storage):
+        response = storage.connection.meta.client.get_object(
+            Bucket=storage.bucket_name,
+            Key=posixpath.join(storage.location, key),
+            Range=f"bytes=0-{HEAD_BYTES - 1}",
+        )
+        return response["Body"].read()
+    with storage.open(key) as stored:
+        return stored.read(HEAD_BYTES)
+
+
+def copy_upload(storage, source, target):
+    """Copy a stored object to `target` within the storage; returns the new key."""
+    if isinstance(storage, S3Boto3Storage):
+        storage.connection.meta.client.copy_object(
+            Bucket=storage.bucket_name,
+            Key=posixpath.join(storage.location, target),
+            CopySource={"Bucket": storage.bucket_name, "Key": posixpath.join(storage.location, source)},
+        )
+        return target
+    with storage.open(source) as stored:
+        return storage.save(target, stored)
+
+
+def claim(token, kind, user):
+    """
+    The storage key of a checked copy of a finished upload for `kind` (see
+    the module docstring). Raises ValidationError. Attach the key to the
+    model field, save, then queue its variants with images.process_variants().
+    """
+    try:
+        slot = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=settings.UPLOAD_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise ValidationError({"upload": "Invalid or expired upload token."})
+    if slot["user"] != user.id or slot["kind"] != kind:
+        raise ValidationError({"upload": f"This upload is not a {kind} upload of yours."})
+
+    _, field = upload_field(kind)
+    storage = field.storage
+    if not storage.exists(slot["key"]):
+        raise ValidationError({"upload": "Nothing was uploaded for this token."})
+
+    extension, looks_right = CONTENT_TYPES[slot["content_type"]]
+    key = copy_upload(storage, slot["key"], field.generate_filename(None, f"{uuid.uuid4().hex}.{extension}"))
+    storage.delete(slot["key"])
+    try:
+        if storage.size(key) > settings.UPLOAD_MAX_BYTES or not looks_right(read_head(storage, key)):
+            raise ValueError("wrong size or type")
+        with storage.open(key) as stored:
+            stripped = without_metadata(stored)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        storage.delete(key)
+        raise ValidationError({"upload": f"The upload is not a {slot['content_type']} file within the size limit."})
+    storage.delete(key)
+    return storage.save(key, stripped)
+
+
+class UploadSlotView(APIView):
+    """Hand out a direct-to-storage upload slot."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        kind = request.data.get("kind")
+        content_type = request.data.get("content_type")
+        if kind not in UPLOAD_KINDS:
+            return Response({"error": f"kind must be one of {', '.join(UPLOAD_KINDS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if content_type not in CONTENT_TYPES:
+            return Response(
+                {"error": f"content_type must be one of {', '.join(CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            size = int(request.data.get("size", 0))
+        except (TypeError, ValueError):
+            size = 0
+        if not 0 < size <= settings.UPLOAD_MAX_BYTES:
+            return Response(
+                {"error": f"size must be between 1 and {settings.UPLOAD_MAX_BYTES} bytes"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(make_slot(request, kind, content_type), status=status.HTTP_201_CREATED)
+
+
+class LocalUploadView(APIView):
+    """
+    The upload target of slots on storages without presigned POSTs. Like a
+    presigned POST, the token in the URL is the only credential, and it
+    only ever writes the slot's staging key, never an attached file.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, token):
+        try:
+            slot = signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=settings.UPLOAD_SLOT_EXPIRY)
+        except signing.BadSignature:
+            return Response({"error": "Invalid or expired upload slot."}, status=status.HTTP_403_FORBIDDEN)
+
+        _, field = upload_field(slot["kind"])
+        if isinstance(field.storage, S3Boto3Storage):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        upload = request.FILES.get("file")
+        if upload is None or not 0 < upload.size <= settings.UPLOAD_MAX_BYTES:
+            return Response(
+                {"error": f"file must be between 1 and {settings.UPLOAD_MAX_BYTES} bytes"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        field.storage.delete(slot["key"])  # a retried upload replaces the first
+        field.storage.save(slot["key"], upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
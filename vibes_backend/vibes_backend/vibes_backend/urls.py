@@ -4,10 +4,14 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from .uploads import LocalUploadView, UploadSlotView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('auth/', include('auth_service.urls')),
+    path('api/uploads/', UploadSlotView.as_view(), name='upload-slot'),
+    path('api/uploads/<str:token>/', LocalUploadView.as_view(), name='upload-target'),
     path('api/', include('post_service.urls')),
     path('chat/', include('chat_service.urls')),
 